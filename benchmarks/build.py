@@ -0,0 +1,234 @@
+"""
+Measure how long building a zipapp takes, how much memory it needs and how large the result is.
+
+Synthetic site-packages trees are generated for each scenario, then built with ``shiv.builder.create_archive``
+directly ("builder") and through the whole command line ("cli", with a local stand-in for pip, so that copying
+site-packages, hashing and writing the archive are measured but not the network). Every build runs in a fresh
+process, so that its peak RSS isn't polluted by the previous ones.
+
+Usage: python benchmarks/build.py [--scenario NAME ...] [--target NAME ...] [--scale N] [--repeat N]
+                                  [--output results.json] [--compare baseline.json] [--threshold 1.1]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Callable, Dict, List, Optional
+
+from shiv import __version__, builder, cli
+from shiv.bootstrap.environment import Environment
+
+SCENARIOS: Dict[str, Callable[[Path, int], None]] = {}
+TARGETS = ("builder", "cli")
+
+# The module the benchmarked zipapps use as their entry point.
+APP_MODULE = "def main():\n    print('hello')\n"
+
+
+def scenario(fn: Callable[[Path, int], None]) -> Callable[[Path, int], None]:
+    SCENARIOS[fn.__name__.replace("_", "-")] = fn
+    return fn
+
+
+@scenario
+def tiny_modules(root: Path, scale: int) -> None:
+    """Many small modules spread over many packages, like a typical application's dependencies."""
+    for i in range(50 * scale):
+        package = root / f"package_{i}"
+        package.mkdir(parents=True)
+        (package / "__init__.py").write_text(f"NAME = 'package_{i}'\n")
+
+        for j in range(40):
+            (package / f"module_{j}.py").write_text(f"def function_{j}(value):\n    return value * {j}\n" * 20)
+
+
+@scenario
+def huge_binaries(root: Path, scale: int) -> None:
+    """A few large binaries that barely compress, like compiled extensions and bundled shared libraries."""
+    package = root / "binaries"
+    package.mkdir(parents=True)
+    (package / "__init__.py").write_text("")
+
+    for i in range(4):
+        with (package / f"library_{i}.so").open("wb") as f:
+            for _ in range(8 * scale):
+                # half random, half zeros, so that compression has some (but not much) work to do
+                f.write(os.urandom(512 * 1024) + bytes(512 * 1024))
+
+
+@scenario
+def deep_symlinks(root: Path, scale: int) -> None:
+    """Deeply nested packages, some of which are reached through symlinked directories."""
+    for i in range(10 * scale):
+        package = root / f"deep_{i}"
+
+        for depth in range(12):
+            package.mkdir(parents=True)
+            (package / "__init__.py").write_text("")
+            (package / f"leaf_{depth}.py").write_text(f"DEPTH = {depth}\n" * 50)
+            package = package / f"level_{depth}"
+
+        # each tree links to the previous one, without creating any cycle
+        if i:
+            (root / f"deep_{i}" / "linked").symlink_to(root / f"deep_{i - 1}", target_is_directory=True)
+
+
+def tree_size(root: Path) -> Dict[str, int]:
+    files = [path for path in root.rglob("*") if path.is_file()]
+    return {"files": len(files), "input_bytes": sum(path.stat().st_size for path in files)}
+
+
+def peak_rss() -> Optional[int]:
+    """The peak resident set size of this process in bytes, if the platform can tell."""
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macOS bytes
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def build(target: str, site_packages: Path, output: Path) -> None:
+    """Build a zipapp of site_packages, in this process."""
+    if target == "builder":
+        env = Environment(built_at="1980-01-01 00:00:00", entry_point="benchmark_app:main", shiv_version="0")
+        builder.create_archive([site_packages], output, "/usr/bin/env python3", "_bootstrap:bootstrap", env)
+        return
+
+    def install(args: List[str]) -> None:
+        # stands in for pip, "installing" a single module into the staged site-packages
+        Path(args[args.index("--target") + 1], "benchmark_requirement.py").write_text("")
+
+    cli.pip.install = install  # type: ignore
+    args = ["-o", str(output), "-e", "benchmark_app:main", "--reproducible", "--site-packages", str(site_packages)]
+
+    try:
+        cli.main([*args, "benchmark-requirement"])
+    except SystemExit as e:
+        if e.code:
+            raise
+
+
+def run_child(target: str, site_packages: Path, output: Path) -> Dict[str, Optional[float]]:
+    """Build in a fresh interpreter, returning its wall time and peak RSS."""
+    process = subprocess.run(
+        [sys.executable, __file__, "--child", target, str(site_packages), str(output)],
+        stdout=subprocess.PIPE,
+        check=True,
+        universal_newlines=True,
+    )
+    return json.loads(process.stdout.splitlines()[-1])
+
+
+def run(scenarios: List[str], targets: List[str], scale: int, repeat: int) -> List[Dict]:
+    results = []
+
+    for name in scenarios:
+        with TemporaryDirectory() as tmp:
+            source = Path(tmp, "site-packages")
+            SCENARIOS[name](source, scale)
+            (source / "benchmark_app.py").write_text(APP_MODULE)
+            size = tree_size(source)
+
+            for target in targets:
+                runs = [run_child(target, source, Path(tmp, f"{target}.pyz")) for _ in range(repeat)]
+
+                results.append(
+                    {
+                        "scenario": name,
+                        "target": target,
+                        **size,
+                        "seconds": min(result["seconds"] for result in runs),
+                        "max_rss": max((result["max_rss"] or 0) for result in runs) or None,
+                        "output_bytes": Path(tmp, f"{target}.pyz").stat().st_size,
+                    }
+                )
+
+    return results
+
+
+def metadata() -> Dict[str, Optional[str]]:
+    try:
+        commit: Optional[str] = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=Path(__file__).parent,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+
+    return {"shiv_version": __version__, "commit": commit, "python": sys.version.split()[0], "platform": sys.platform}
+
+
+def compare(baseline: Dict, current: Dict, threshold: float) -> bool:
+    """Print how the current results compare to a baseline, return False if anything got slower than threshold."""
+    ok = True
+    previous = {(result["scenario"], result["target"]): result for result in baseline["results"]}
+
+    for result in current["results"]:
+        before = previous.get((result["scenario"], result["target"]))
+
+        if before is None:
+            continue
+
+        line = f"{result['scenario']:<15} {result['target']:<8}"
+
+        for key in ("seconds", "max_rss", "output_bytes"):
+            if before[key] and result[key]:
+                ratio = result[key] / before[key]
+                line += f" {key} x{ratio:.2f}"
+
+                if key == "seconds" and ratio > threshold:
+                    line += " (regression!)"
+                    ok = False
+
+        print(line)
+
+    return ok
+
+
+def main() -> None:
+    if sys.argv[1:2] == ["--child"]:
+        target, site_packages, output = sys.argv[2:5]
+        started = time.perf_counter()
+        build(target, Path(site_packages), Path(output))
+        print(json.dumps({"seconds": time.perf_counter() - started, "max_rss": peak_rss()}))
+        return
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="default: all of them")
+    parser.add_argument("--target", action="append", choices=TARGETS, help="default: all of them")
+    parser.add_argument("--scale", type=int, default=1, help="multiply the size of every scenario")
+    parser.add_argument("--repeat", type=int, default=3, help="keep the best wall time of this many runs")
+    parser.add_argument("--output", type=Path, help="write the results to this json file")
+    parser.add_argument("--compare", type=Path, help="compare the results with a previous json file")
+    parser.add_argument("--threshold", type=float, default=1.1, help="fail if anything is this many times slower")
+    args = parser.parse_args()
+
+    results = {
+        **metadata(),
+        "scale": args.scale,
+        "results": run(args.scenario or sorted(SCENARIOS), args.target or list(TARGETS), args.scale, args.repeat),
+    }
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=4) + "\n")
+    else:
+        json.dump(results, sys.stdout, indent=4)
+        print()
+
+    if args.compare and not compare(json.loads(args.compare.read_text()), results, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Compare the scandir based ``shiv.builder.walk`` with the rglob based walk it replaced.
+
+Usage: python benchmarks/walker.py [--packages N] [--modules N] [--repeat N] [--json]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from shiv.builder import rglob_follow_symlinks, walk
+
+
+def generate_tree(root: Path, packages: int, modules: int) -> None:
+    """Create a synthetic site-packages with nested packages and a symlinked directory."""
+    for i in range(packages):
+        package = root / f"package_{i}" / "sub"
+        package.mkdir(parents=True)
+
+        for j in range(modules):
+            (package / f"module_{j}.py").write_text(f"VALUE = {j}\n")
+            (package / f"module_{j}.pyc").write_bytes(b"")
+
+    (root / "linked").symlink_to(root / "package_0", target_is_directory=True)
+
+
+def rglob_walk(source: Path) -> list:
+    """The walk create_archive used to do: sort, filter, then stat every file."""
+    return [
+        (path, path.relative_to(source), path.stat())
+        for path in sorted(rglob_follow_symlinks(source, "*"), key=str)
+        if path.suffix != ".pyc" and not path.is_dir()
+    ]
+
+
+def scandir_walk(source: Path) -> list:
+    return [file for file in walk(source) if os.path.splitext(file.relpath)[1] != ".pyc"]
+
+
+def best_of(fn, source: Path, repeat: int) -> float:
+    timings = []
+
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(source)
+        timings.append(time.perf_counter() - started)
+
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--packages", type=int, default=200)
+    parser.add_argument("--modules", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="output as json")
+    args = parser.parse_args()
+
+    with TemporaryDirectory() as tmp:
+        source = Path(tmp)
+        generate_tree(source, args.packages, args.modules)
+
+        assert [entry[1] for entry in rglob_walk(source)] == [Path(file.relpath) for file in scandir_walk(source)]
+
+        results = {
+            "files": len(scandir_walk(source)),
+            "rglob_seconds": best_of(rglob_walk, source, args.repeat),
+            "scandir_seconds": best_of(scandir_walk, source, args.repeat),
+        }
+
+    if args.json:
+        json.dump(results, sys.stdout, indent=4)
+        print()
+    else:
+        print(f"files:   {results['files']}")
+        print(f"rglob:   {results['rglob_seconds']:.3f}s")
+        print(f"scandir: {results['scandir_seconds']:.3f}s")
+        print(f"speedup: {results['rglob_seconds'] / results['scandir_seconds']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
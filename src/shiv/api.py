@@ -0,0 +1,324 @@
+"""
+This module is shiv's Python API: it builds zipapps from ``BuildSpec`` objects, which take the same options as the
+``shiv`` command, either one at a time or in batches.
+
+A batch installs every distinct distribution the requirements of its specs resolve to only once, then builds its
+zipapps concurrently in a pool of processes.
+"""
+import hashlib
+import json
+import zipfile
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import click
+
+from . import pip
+from .bootstrap.environment import Environment
+from .builder import default_workers
+from .cli import BUILD_REPORT, STDOUT, main
+from .report import BuildReport
+from .wheel import record_hash
+
+# The options a BuildSpec takes, i.e. the parameters of the shiv command, by name.
+PARAMS = {param.name: param for param in main.params if param.name is not None}
+
+# The options of pip install that take a value, and the ones of these that name requirements.
+PIP_VALUE_OPTIONS = {
+    "--abi",
+    "--cache-dir",
+    "--cert",
+    "--client-cert",
+    "--config-settings",
+    "--constraint",
+    "--editable",
+    "--exists-action",
+    "--extra-index-url",
+    "--find-links",
+    "--global-option",
+    "--implementation",
+    "--index-url",
+    "--keyring-provider",
+    "--log",
+    "--no-binary",
+    "--only-binary",
+    "--platform",
+    "--progress-bar",
+    "--proxy",
+    "--python-version",
+    "--report",
+    "--requirement",
+    "--retries",
+    "--root",
+    "--root-user-action",
+    "--src",
+    "--timeout",
+    "--trusted-host",
+    "--upgrade-strategy",
+    "--use-deprecated",
+    "--use-feature",
+    "-C",
+    "-c",
+    "-e",
+    "-f",
+    "-i",
+    "-r",
+}
+PIP_REQUIREMENT_OPTIONS = {"--constraint", "--editable", "--requirement", "-c", "-e", "-r"}
+
+
+class BuildSpec:
+    """Everything needed to build a zipapp.
+
+    Options are named after the parameters of the ``shiv`` command (e.g. ``entry_point``, ``compressed`` or
+    ``exclude_globs``), options that can be supplied multiple times take sequences. Options that aren't given
+    take the same default as on the command line.
+
+    :param output_file: The path to write the zipapp to.
+    :param pip_args: The arguments to pip install.
+    :param options: Any other option of the ``shiv`` command.
+    """
+
+    def __init__(self, output_file: str, pip_args: Sequence[str] = (), **options: Any) -> None:
+        unknown = sorted(set(options) - set(PARAMS))
+
+        if unknown:
+            raise ValueError(f"Unknown options: {', '.join(unknown)}")
+
+        self.output_file = str(output_file)
+        self.pip_args = list(pip_args)
+        self.options = options
+
+    def params(self) -> Dict[str, Any]:
+        """The parameters to invoke the ``shiv`` command with."""
+        return {**self.options, "output_file": self.output_file, "pip_args": self.pip_args}
+
+
+class BuildResult:
+    """The outcome of building a ``BuildSpec``.
+
+    :param spec: The spec that was built.
+    :param report: The report of the build, if it got far enough to have one.
+    :param error: Why the build failed, or None if it succeeded.
+    """
+
+    def __init__(self, spec: BuildSpec, report: Optional[BuildReport] = None, error: Optional[str] = None) -> None:
+        self.spec = spec
+        self.report = report
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    @property
+    def build_id(self) -> Optional[str]:
+        """The build id of the zipapp that was built (read back from it)."""
+        if not self.ok or self.spec.output_file == STDOUT:
+            return None
+
+        with zipfile.ZipFile(str(Path(self.spec.output_file).expanduser())) as archive:
+            return Environment.from_json(archive.read("environment.json").decode()).build_id
+
+
+def build(spec: BuildSpec) -> BuildResult:
+    """Build a zipapp. Errors that would make the ``shiv`` command exit are returned in the result."""
+    given = spec.params()
+
+    with click.Context(main, info_name="shiv") as ctx:
+        try:
+            # options are checked and converted the way the command line does it
+            params = {name: param.type_cast_value(ctx, given[name]) for name, param in PARAMS.items() if name in given}
+            ctx.invoke(main, **params)
+        except click.ClickException as e:
+            return BuildResult(spec, ctx.meta.get(BUILD_REPORT), e.format_message())
+        except SystemExit as e:
+            if e.code:
+                return BuildResult(spec, ctx.meta.get(BUILD_REPORT), str(e.code).strip())
+
+        return BuildResult(spec, ctx.meta.get(BUILD_REPORT))
+
+
+def distribution_key(distribution: Dict[str, Any]) -> str:
+    """Name the install of a distribution (an item of pip's installation report) after where it comes from, and
+    whether it was requested (by url)."""
+    origin = {key: distribution.get(key) for key in ("download_info", "is_direct", "requested")}
+    digest = hashlib.sha256(json.dumps(origin, sort_keys=True).encode()).hexdigest()
+    metadata = distribution.get("metadata", {})
+    return f"{metadata.get('name', 'unknown')}-{metadata.get('version', 'unknown')}-{digest[:16]}"
+
+
+def pip_options(args: Sequence[str]) -> List[str]:
+    """Drop the requirements from the arguments to pip install, keeping the options that tell pip how to install."""
+    options = []
+    remaining: Iterator[str] = iter(args)
+
+    for arg in remaining:
+        if not arg.startswith("-"):
+            continue
+
+        # values are given as the next argument, or joined to the option (--index-url=URL, -iURL)
+        name, joined = (arg.partition("=")[0], "=" in arg) if arg.startswith("--") else (arg[:2], len(arg) > 2)
+        value = [next(remaining, "")] if name in PIP_VALUE_OPTIONS and not joined else []
+
+        if name not in PIP_REQUIREMENT_OPTIONS:
+            options.extend([arg, *value])
+
+    return options
+
+
+def requirement(distribution: Dict[str, Any]) -> Optional[str]:
+    """Rebuild the line of a requirements file that installs a distribution (an item of pip's installation report)
+    from where pip got it, or return None if pip can't install it from there again (e.g. an editable install)."""
+    info = distribution["download_info"]
+    url = info["url"]
+
+    if "vcs_info" in info:
+        url = f"{info['vcs_info']['vcs']}+{url}@{info['vcs_info']['commit_id']}"
+    elif "archive_info" not in info and ("dir_info" not in info or info["dir_info"].get("editable")):
+        return None
+
+    if info.get("subdirectory"):
+        url += f"#subdirectory={info['subdirectory']}"
+
+    # the hashes pip checked (or computed) the archive against, which --require-hashes needs
+    archive_info = info.get("archive_info", {})
+    hashes = dict(archive_info.get("hashes") or {})
+
+    if archive_info.get("hash"):
+        name, _, value = archive_info["hash"].partition("=")
+        hashes.setdefault(name, value)
+
+    return " ".join([url, *(f"--hash={name}:{value}" for name, value in sorted(hashes.items()))])
+
+
+def forget_url_install(target: Path, distribution: Dict[str, Any]) -> None:
+    """Give a distribution installed from its url the metadata installing its requirements would have given it: pip
+    marks every distribution installed from a url as requested, and records where it came from in
+    ``direct_url.json``."""
+    unwanted = []
+    # pip records the download info of the distributions it resolved from a url as it is
+    direct_url = json.dumps(distribution["download_info"], sort_keys=True).encode("utf-8")
+
+    if not distribution.get("requested"):
+        unwanted.append("REQUESTED")
+
+    if not distribution.get("is_direct"):
+        unwanted.append("direct_url.json")
+
+    for dist_info in target.glob("*.dist-info"):
+        members = {f"{dist_info.name}/{name}" for name in unwanted}
+
+        for name in unwanted:
+            (dist_info / name).unlink(missing_ok=True)
+
+        if distribution.get("is_direct"):
+            (dist_info / "direct_url.json").write_bytes(direct_url)
+
+        # RECORD lists them too (pip writes it with csv's default \r\n line endings, which are kept)
+        record = dist_info / "RECORD"
+        lines = []
+
+        for line in record.read_bytes().splitlines(keepends=True):
+            name = line.decode("utf-8").split(",")[0]
+
+            if name == f"{dist_info.name}/direct_url.json" and distribution.get("is_direct"):
+                line = f"{name},{record_hash(direct_url)},{len(direct_url)}\r\n".encode("utf-8")
+
+            if name not in members:
+                lines.append(line)
+
+        record.write_bytes(b"".join(lines))
+
+
+def share_dependencies(specs: Sequence[BuildSpec], directory: Path, workers: Optional[int] = None) -> List[BuildSpec]:
+    """Install the distributions the requirements of ``specs`` resolve to, each one only once, and return specs that
+    build from these installs instead of running pip themselves.
+
+    Every distribution is installed on its own, from where pip resolved it (see :func:`requirement`), with
+    ``--no-deps`` and the pip options of the first spec that needs it, below ``directory``. It gets the same metadata
+    installing the spec's requirements would have given it, and that install is added to the site-packages of every
+    spec that needs it. Specs whose requirements pip can't resolve upfront (or install again from where it resolved
+    them), specs that need a distribution that fails to install (so that building them reports their own errors),
+    specs that read wheels directly and specs that have site-packages of their own, whose files pip doesn't replace,
+    are returned as they are.
+
+    :param specs: The specs to share the dependencies of.
+    :param directory: The directory to install distributions in.
+    :param workers: How many pip processes to run at the same time (defaults to the number of available cores).
+    """
+
+    def resolve(spec: BuildSpec) -> Optional[List[Dict[str, Any]]]:
+        # pip leaves the files of a spec's site-packages in place (see stage_install), shared installs wouldn't
+        if not spec.pip_args or spec.options.get("direct_wheels") or spec.options.get("site_packages"):
+            return None
+
+        distributions = pip.resolve(spec.pip_args)
+
+        # the spec has to install distributions pip can't install again from where it got them itself
+        if distributions is None or any(requirement(distribution) is None for distribution in distributions):
+            return None
+
+        return distributions
+
+    with ThreadPoolExecutor(max_workers=workers or default_workers()) as executor:
+        resolved = list(executor.map(resolve, specs))
+
+        installs: Dict[str, Tuple[Dict[str, Any], List[str]]] = {}
+
+        for spec, distributions in zip(specs, resolved):
+            for distribution in distributions or ():
+                installs.setdefault(distribution_key(distribution), (distribution, pip_options(spec.pip_args)))
+
+        def install(key: str) -> bool:
+            distribution, options = installs[key]
+            target = directory / key
+            requirements = directory / f"{key}.txt"
+            requirements.write_text(f"{requirement(distribution)}\n")
+
+            try:
+                pip.install(["--target", str(target), "--no-deps", "--no-compile", *options, "-r", str(requirements)])
+            except SystemExit:
+                return False
+
+            forget_url_install(target, distribution)
+            return True
+
+        installed = dict(zip(sorted(installs), executor.map(install, sorted(installs))))
+
+    shared = []
+
+    for spec, distributions in zip(specs, resolved):
+        if not distributions or not all(installed[distribution_key(distribution)] for distribution in distributions):
+            shared.append(spec)
+            continue
+
+        site_packages = [str(directory / distribution_key(distribution)) for distribution in distributions]
+        shared.append(BuildSpec(spec.output_file, **{**spec.options, "site_packages": site_packages}))
+
+    return shared
+
+
+def build_batch(specs: Sequence[BuildSpec], workers: Optional[int] = None, share: bool = True) -> List[BuildResult]:
+    """Build many zipapps concurrently, in a pool of processes.
+
+    :param specs: The specs to build.
+    :param workers: How many zipapps to build at the same time (defaults to the number of available cores).
+    :param share: Whether to install the dependencies the specs have in common only once (see
+        ``share_dependencies``).
+    :return: The result of each spec, in order.
+    """
+    with TemporaryDirectory() as directory:
+        to_build = share_dependencies(specs, Path(directory), workers) if share else list(specs)
+
+        with ProcessPoolExecutor(max_workers=workers or default_workers()) as executor:
+            results = list(executor.map(build, to_build))
+
+    # report the results against the specs as they were given
+    for spec, result in zip(specs, results):
+        result.spec = spec
+
+    return results
@@ -9,13 +9,22 @@ import sys
 import zipfile
 
 from contextlib import contextmanager, suppress
+from fnmatch import fnmatchcase
 from functools import partial
 from importlib import import_module
 from pathlib import Path
+from stat import S_ISLNK
 
 from .environment import Environment
 from .filelock import FileLock
+from .import_profile import record_imports
 from .interpreter import execute_interpreter
+from .manifest import Manifest
+
+# The layers of a layered zipapp, in the order they are added to sys.path.
+APP_LAYER = "app"
+DEPS_LAYER = "deps"
+LAYERS = (APP_LAYER, DEPS_LAYER)
 
 
 def run(module):  # pragma: no cover
@@ -107,7 +116,73 @@ def cache_path(archive, root_dir, build_id):
     return root / f"{name}_{build_id}"
 
 
-def extract_site_packages(archive, target_path, compile_pyc=False, compile_workers=0, force=False):
+def layer_of(path, app_layer):
+    """Return the layer a site-packages file belongs to.
+
+    Scripts (i.e. the bin directory, which also holds the preamble) are always part of the application layer.
+
+    :param str path: The path of the file, relative to site-packages and with forward slashes.
+    :param list app_layer: Globs of the top-level names that belong to the application layer.
+    """
+    top_level = path.split("/", 1)[0]
+
+    if top_level == "bin" or any(fnmatchcase(top_level, glob) for glob in app_layer):
+        return APP_LAYER
+
+    return DEPS_LAYER
+
+
+def is_foreign_bytecode(filename, cache_tag=sys.implementation.cache_tag):
+    """Return True if a file is bytecode that was compiled (at build time) for another interpreter.
+
+    :param str filename: The name of the file in the archive.
+    :param str cache_tag: The cache tag of the running interpreter.
+    """
+    directory, _, name = filename.rpartition("/")
+
+    # e.g. __pycache__/module.cpython-311.pyc or __pycache__/module.cpython-311.opt-1.pyc
+    return directory.endswith("__pycache__") and name.endswith(".pyc") and name.split(".")[1] != cache_tag
+
+
+def link_or_copy(source, destination):
+    """Hardlink a file, or copy it if the filesystem doesn't support hardlinks.
+
+    :param Path source: The file to link to.
+    :param Path destination: The path of the new link.
+    """
+    destination.parent.mkdir(parents=True, exist_ok=True)
+
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+
+def symlink_or_copy(target, link):
+    """Create a symlink, or copy what it points to if the platform doesn't allow creating symlinks.
+
+    Whatever is at ``link`` already (e.g. left over by an interrupted extraction) is replaced.
+
+    :param str target: What the symlink points to, relative to the symlink and with forward slashes.
+    :param Path link: The path of the new symlink.
+    """
+    if link.is_dir() and not link.is_symlink():
+        shutil.rmtree(link)
+    elif link.is_symlink() or link.exists():
+        link.unlink()
+
+    try:
+        os.symlink(target, link)
+    except OSError:
+        source = link.parent / target
+
+        if source.is_dir():
+            shutil.copytree(source, link)
+        else:
+            shutil.copy2(source, link)
+
+
+def extract_site_packages(archive, target_path, compile_pyc=False, compile_workers=0, force=False, include=None):
     """Extract everything in site-packages to a specified path.
 
     :param ZipFile archive: The zipfile object we are bootstrapping from.
@@ -115,6 +190,7 @@ def extract_site_packages(archive, target_path, compile_pyc=False, compile_worke
     :param bool compile_pyc: A boolean to dictate whether we pre-compile pyc.
     :param int compile_workers: An int representing the number of pyc compiler workers.
     :param bool force: A boolean to dictate whether or not we force extraction.
+    :param Callable include: Optional, only extract the files (by path relative to site-packages) it returns true for.
     """
     parent = target_path.parent
     target_path_tmp = Path(parent, target_path.name + ".tmp")
@@ -130,15 +206,43 @@ def extract_site_packages(archive, target_path, compile_pyc=False, compile_worke
         # completed bootstrapping, so let's check (again) if we need to do any work
         if not target_path.exists() or force:
 
+            def wanted(filename):
+                return not is_foreign_bytecode(filename) and (include is None or include(filename.split("/", 1)[-1]))
+
+            symlinks = []
+
             # extract our site-packages
             for fileinfo in archive.infolist():
 
-                if fileinfo.filename.startswith("site-packages"):
+                if fileinfo.filename.startswith("site-packages") and wanted(fileinfo.filename):
+
+                    if S_ISLNK(fileinfo.external_attr >> 16):
+                        # symlinks are created once what they point to is extracted
+                        symlinks.append((fileinfo.filename, archive.read(fileinfo).decode("utf-8")))
+                        continue
+
                     extracted = archive.extract(fileinfo.filename, target_path_tmp)
 
                     # restore original permissions
                     os.chmod(extracted, fileinfo.external_attr >> 16)
 
+            # files deduplicated at build time are hardlinks to the file holding their contents
+            manifest = Manifest.load(archive)
+
+            for path, original in (manifest.aliases() if manifest else {}).items():
+
+                if wanted(f"site-packages/{path}"):
+                    site_packages = target_path_tmp / "site-packages"
+                    link_or_copy(site_packages / original, site_packages / path)
+
+            for filename, target in symlinks:
+                link = target_path_tmp / filename
+                link.parent.mkdir(parents=True, exist_ok=True)
+                symlink_or_copy(target, link)
+
+            # a layer may well be empty, it still needs a (possibly empty) site-packages directory
+            Path(target_path_tmp, "site-packages").mkdir(parents=True, exist_ok=True)
+
             if compile_pyc:
                 compileall.compile_dir(target_path_tmp, quiet=2, workers=compile_workers)
 
@@ -168,12 +272,16 @@ def extend_python_path(environ, additional_paths):
     environ["PYTHONPATH"] = os.pathsep.join(sorted(set(python_path), key=python_path.index))
 
 
-def ensure_no_modify(site_packages, hashes):
-    """Compare the sha256 hash of the unpacked source files to the files when they were added to the pyz."""
+def ensure_no_modify(site_packages, hashes, algorithm="sha256"):
+    """Compare the hash of the unpacked source files to the files when they were added to the pyz."""
 
     for path in site_packages.rglob("**/*.py"):
 
-        if hashlib.sha256(path.read_bytes()).hexdigest() != hashes.get(str(path.relative_to(site_packages))):
+        # symlinks were preserved at build time, the files they point to are checked instead
+        if path.is_symlink():
+            continue
+
+        if hashlib.new(algorithm, path.read_bytes()).hexdigest() != hashes.get(str(path.relative_to(site_packages))):
             raise RuntimeError(
                 "A Python source file has been modified! File: {}. "
                 "Try again with SHIV_FORCE_EXTRACT=1 to overwrite the modified source file(s).".format(str(path))
@@ -195,18 +303,30 @@ def bootstrap():  # pragma: no cover
         # create an environment object (a combination of env vars and json metadata)
         env = Environment.from_json(archive.read("environment.json").decode())
 
-        # get a site-packages directory (from env var or via build id)
-        site_packages = cache_path(archive, env.root, env.build_id) / "site-packages"
-
-        # determine if first run or forcing extract
-        if not site_packages.exists() or env.force_extract:
-            extract_site_packages(
-                archive,
-                site_packages.parent,
-                env.compile_pyc,
-                env.compile_workers,
-                env.force_extract,
-            )
+        # get a site-packages directory per layer (from env var or via build ids)
+        if env.layer_ids:
+            layers = {
+                layer: cache_path(archive, env.root, f"{layer}_{env.layer_ids[layer]}") / "site-packages"
+                for layer in LAYERS
+            }
+        else:
+            layers = {None: cache_path(archive, env.root, env.build_id) / "site-packages"}
+
+        for layer, layer_site_packages in layers.items():
+
+            # determine if first run or forcing extract
+            if not layer_site_packages.exists() or env.force_extract:
+                extract_site_packages(
+                    archive,
+                    layer_site_packages.parent,
+                    env.compile_pyc,
+                    env.compile_workers,
+                    env.force_extract,
+                    include=None if layer is None else lambda path, layer=layer: layer_of(path, env.app_layer) == layer,
+                )
+
+    # scripts and the preamble live in the application layer
+    site_packages = next(iter(layers.values()))
 
     # get sys.path's length
     length = len(sys.path)
@@ -217,9 +337,14 @@ def bootstrap():  # pragma: no cover
     # copy sys.path to determine diff
     sys_path_before = sys.path.copy()
 
+    # record the site-packages files this run uses, to prune later builds with
+    if env.record_imports:
+        record_imports(env.record_imports, layers.values())
+
     # append site-packages using the stdlib blessed way of extending path
     # so as to handle .pth files correctly
-    site.addsitedir(site_packages)
+    for layer_site_packages in layers.values():
+        site.addsitedir(layer_site_packages)
 
     # reorder to place our site-packages before any others found
     sys.path = sys.path[:index] + sys.path[length:] + sys.path[index:length]
@@ -232,7 +357,8 @@ def bootstrap():  # pragma: no cover
 
     # check if source files have been modified, if required
     if env.no_modify:
-        ensure_no_modify(site_packages, env.hashes)
+        for layer_site_packages in layers.values():
+            ensure_no_modify(layer_site_packages, env.hashes, env.hash_algorithm)
 
     # add any new paths to the environment, if requested
     if env.extend_pythonpath:
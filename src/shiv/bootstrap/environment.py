@@ -4,7 +4,7 @@ overrides defined at runtime (via environment variables).
 """
 import json
 import os
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 
 
 def str_bool(v) -> bool:
@@ -24,6 +24,7 @@ class Environment:
     COMPILE_WORKERS: str = "SHIV_COMPILE_WORKERS"
     EXTEND_PYTHONPATH: str = "SHIV_EXTEND_PYTHONPATH"
     PREPEND_PYTHONPATH: str = "SHIV_PREPEND_PYTHONPATH"
+    RECORD_IMPORTS: str = "SHIV_RECORD_IMPORTS"
 
     def __init__(
         self,
@@ -41,15 +42,22 @@ class Environment:
         script: Optional[str] = None,
         preamble: Optional[str] = None,
         root: Optional[str] = None,
+        app_layer: Optional[List[str]] = None,
+        layer_ids: Optional[Dict[str, str]] = None,
+        hash_algorithm: str = "sha256",
     ) -> None:
         self.shiv_version: str = shiv_version
         self.always_write_cache: bool = always_write_cache
         self.build_id: Optional[str] = build_id
         self.built_at: str = built_at
         self.hashes: Optional[Dict[str, Any]] = hashes or {}
+        self.hash_algorithm: str = hash_algorithm
         self.no_modify: bool = no_modify
         self.reproducible: bool = reproducible
         self.preamble: Optional[str] = preamble
+        # globs of the top-level names in site-packages that are extracted separately from the rest
+        self.app_layer: Optional[List[str]] = app_layer
+        self.layer_ids: Optional[Dict[str, str]] = layer_ids
 
         # properties
         self._entry_point: Optional[str] = entry_point
@@ -103,6 +111,11 @@ class Environment:
         """Prepend the given path to sys.path."""
         return os.environ.get(self.PREPEND_PYTHONPATH, self._prepend_pythonpath)
 
+    @property
+    def record_imports(self) -> Optional[str]:
+        """The path to an import profile to record the site-packages files used by this run in."""
+        return os.environ.get(self.RECORD_IMPORTS)
+
     @property
     def compile_workers(self) -> int:
         try:
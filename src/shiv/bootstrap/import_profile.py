@@ -0,0 +1,104 @@
+"""
+This module records which site-packages files an application actually uses at runtime, into an import profile
+that a later build can prune the zipapp with (see ``shiv --import-profile``).
+
+A profile is a text file listing one path per line, relative to site-packages and with forward slashes. Runs append
+to it, so a single profile can collect several representative runs (or the runs of subprocesses).
+
+Shared libraries are loaded by the dynamic loader rather than opened by Python (e.g. the libraries auditwheel vendors
+for extension modules), so the files mapped into the process are recorded as well, where ``/proc`` is available.
+"""
+import atexit
+import os
+import sys
+
+from typing import Any, Callable, Iterable, List, Set, Union
+
+
+def relative_path(path: Any, roots: List[str]) -> str:
+    """Return the path of a file relative to the site-packages directory (one of ``roots``) it is in, or an empty
+    string if it isn't in any of them.
+
+    :param path: The path of the file, as passed to ``open`` (file descriptors are ignored).
+    :param roots: Absolute paths to site-packages directories, ending with a separator.
+    """
+    try:
+        path = os.path.abspath(os.fsdecode(path))
+    except (TypeError, ValueError):
+        return ""
+
+    for root in roots:
+        if path.startswith(root):
+            return os.path.relpath(path, root).replace(os.sep, "/")
+
+    return ""
+
+
+def mapped_files(maps: str = "/proc/self/maps") -> Set[str]:
+    """Return the paths of the files mapped into this process (e.g. shared libraries), or an empty set if they can't
+    be listed (e.g. on platforms without ``/proc``)."""
+    try:
+        with open(maps, encoding="utf-8", errors="replace") as f:
+            # address, permissions, offset, device, inode and (for mapped files) the path, which may contain spaces
+            fields = [line.rstrip("\n").split(None, 5) for line in f]
+    except OSError:
+        return set()
+
+    return {line[5] for line in fields if len(line) == 6 and line[5].startswith(os.sep)}
+
+
+def record_imports(profile: str, site_packages_dirs: Iterable[Union[str, os.PathLike]]) -> Callable[[], None]:
+    """Start recording the files opened (e.g. modules, bytecode and data files) from site-packages, and append them
+    to ``profile`` when the interpreter exits.
+
+    The modules left in ``sys.modules`` at exit are recorded as well, which covers extension modules, and so are
+    the shared libraries loaded from site-packages (with ``ctypes``, or by the dynamic loader on behalf of extension
+    modules).
+
+    :param profile: The path to the profile to append to (relative to the current directory when recording starts).
+    :param site_packages_dirs: The site-packages directories to record the files of.
+    :return: The function appending to the profile, registered to run at exit.
+    """
+    # the application may change the current directory before it exits
+    profile = os.path.abspath(profile)
+    # mapped files are listed by their real paths
+    roots = sorted(
+        {
+            os.path.join(path(site_packages), "")
+            for site_packages in site_packages_dirs
+            for path in (os.path.abspath, os.path.realpath)
+        }
+    )
+    used: Set[str] = set()
+
+    def audit(event, args):
+        if event in ("open", "ctypes.dlopen") and args:
+            used.add(relative_path(args[0], roots))
+
+    def write():
+        for module in list(sys.modules.values()):
+            used.add(relative_path(getattr(module, "__file__", None) or "", roots))
+
+        for path in mapped_files():
+            used.add(relative_path(path, roots))
+
+        used.discard("")
+
+        with open(profile, "a", encoding="utf-8") as f:
+            f.writelines(f"{path}\n" for path in sorted(used))
+
+    sys.addaudithook(audit)
+    atexit.register(write)
+
+    return write
+
+
+def read_profiles(profiles: Iterable[Union[str, os.PathLike]]) -> Set[str]:
+    """Merge the relative paths recorded in one or more profiles."""
+    used: Set[str] = set()
+
+    for profile in profiles:
+        with open(profile, encoding="utf-8") as f:
+            used.update(line.strip() for line in f if line.strip())
+
+    return used
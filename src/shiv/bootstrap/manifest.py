@@ -0,0 +1,167 @@
+"""
+This module contains the ``Manifest`` object, an index of every site-packages file in a pyz that is written
+at build time and can be read back at runtime (or by other tooling) without extracting anything.
+"""
+import hashlib
+import json
+import os
+
+from stat import S_ISLNK
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional
+
+# The hash algorithms digests can be computed with.
+HASH_ALGORITHMS = ("blake2b", "blake2s", "sha256", "sha512")
+
+
+class ManifestEntry(NamedTuple):
+    # the path of the file, relative to site-packages and with forward slashes
+    path: str
+    size: int
+    # the permissions of the file, combined with S_IFLNK for symlinks
+    mode: int
+    # the hex digest of the file's contents
+    digest: str
+    compressed_size: int
+    # the zipfile compression constant and level the file was written with
+    compression: int
+    level: Optional[int] = None
+    # for deduplicated files, the path of the identical file whose archive entry holds the contents
+    alias: Optional[str] = None
+
+
+class Manifest:
+    FILENAME: str = "manifest.json"
+    VERSION: int = 1
+
+    def __init__(
+        self,
+        entries: Optional[List[ManifestEntry]] = None,
+        algorithm: str = "sha256",
+        compression: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        self.algorithm: str = algorithm
+        # the settings of the compression policy the archive was built with, if they were recorded
+        self.compression: Optional[Dict[str, Any]] = compression
+        self.entries: List[ManifestEntry] = []
+        self._by_path: Dict[str, ManifestEntry] = {}
+
+        for entry in entries or []:
+            self.add(entry)
+
+    def __iter__(self) -> Iterator[ManifestEntry]:
+        return iter(self.entries)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def add(self, entry: ManifestEntry) -> None:
+        self.entries.append(entry)
+        self._by_path[entry.path] = entry
+
+    def get(self, path: str) -> Optional[ManifestEntry]:
+        return self._by_path.get(path)
+
+    def new_hash(self, data: bytes = b""):
+        """Return a new hash object using this manifest's algorithm."""
+        return hashlib.new(self.algorithm, data)
+
+    def tree(self) -> Dict[str, str]:
+        """Compute the digest of every directory, keyed by its path (the root being ``""``).
+
+        This is a Merkle tree: the digest of a directory covers the names, permissions and digests of its files and
+        the names and digests of its subdirectories. If a directory has the same digest in two builds, so do all the
+        files below it.
+        """
+        lines: Dict[str, List[str]] = {"": []}
+
+        for entry in self.entries:
+            directory, _, name = entry.path.rpartition("/")
+            lines.setdefault(directory, []).append(f"{name}\0{entry.mode:o}\0{entry.digest}\n")
+
+            # make sure every ancestor of the directory is in the tree as well
+            while directory and directory.rpartition("/")[0] not in lines:
+                directory = directory.rpartition("/")[0]
+                lines[directory] = []
+
+        tree: Dict[str, str] = {}
+
+        # the deepest directories first, so that subdirectories are hashed before their parent
+        for directory in sorted(lines, key=lambda path: path.count("/") if path else -1, reverse=True):
+            tree[directory] = self.new_hash("".join(sorted(lines[directory])).encode()).hexdigest()
+
+            if directory:
+                parent, _, name = directory.rpartition("/")
+                lines[parent].append(f"{name}/\0{tree[directory]}\n")
+
+        return tree
+
+    def build_id(self) -> str:
+        """Compute a build id from the path, permissions and digest of every file: the root of the Merkle tree."""
+        return self.tree()[""]
+
+    def diff(self, other: "Manifest") -> List[str]:
+        """Return the paths of the files that were added, removed or changed between ``other`` and this manifest.
+
+        Only the files of directories whose digests differ between the two are compared.
+        """
+        tree, other_tree = self.tree(), other.tree()
+
+        def changed_files(manifest: "Manifest") -> Dict[str, ManifestEntry]:
+            return {
+                entry.path: entry
+                for entry in manifest
+                if tree.get(entry.path.rpartition("/")[0]) != other_tree.get(entry.path.rpartition("/")[0])
+            }
+
+        ours, theirs = changed_files(self), changed_files(other)
+
+        return sorted(
+            path
+            for path in ours.keys() | theirs.keys()
+            if path not in ours
+            or path not in theirs
+            or (ours[path].mode, ours[path].digest) != (theirs[path].mode, theirs[path].digest)
+        )
+
+    def aliases(self) -> Dict[str, str]:
+        """Return the paths of deduplicated files, mapped to the path of the file holding their contents."""
+        return {entry.path: entry.alias for entry in self.entries if entry.alias is not None}
+
+    def hashes(self, suffix: str = ".py") -> Dict[str, str]:
+        """Return the digests of all files with a given suffix, keyed by their native relative path.
+
+        This is the format of ``Environment.hashes``, used to check that source files haven't been modified.
+        Symlinks are left out, the files they point to are checked instead.
+        """
+        return {
+            entry.path.replace("/", os.sep): entry.digest
+            for entry in self.entries
+            if entry.path.endswith(suffix) and not S_ISLNK(entry.mode)
+        }
+
+    @classmethod
+    def from_json(cls, json_data) -> "Manifest":
+        data = json.loads(json_data)
+        return Manifest([ManifestEntry(*entry) for entry in data["files"]], data["algorithm"], data.get("compression"))
+
+    def to_json(self) -> str:
+        # entries are stored as lists rather than objects to keep the manifest compact (and the alias is only
+        # stored when there is one)
+        files = [list(entry) if entry.alias is not None else list(entry[:-1]) for entry in self.entries]
+        data: Dict[str, Any] = {"version": self.VERSION, "algorithm": self.algorithm, "files": files}
+
+        if self.compression is not None:
+            data["compression"] = self.compression
+
+        return json.dumps(data, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, archive) -> Optional["Manifest"]:
+        """Read the manifest of a pyz, if it has one.
+
+        :param ZipFile archive: The zipfile object to read the manifest from.
+        """
+        try:
+            return cls.from_json(archive.read(cls.FILENAME).decode())
+        except KeyError:
+            return None
@@ -4,23 +4,59 @@ This module is a modified implementation of Python's "zipapp" module.
 We've copied a lot of zipapp's code here in order to backport support for compression.
 https://docs.python.org/3.7/library/zipapp.html#cmdoption-zipapp-c
 """
-import hashlib
+import io
 import os
+import posixpath
+import struct
 import sys
+import threading
 import time
 import zipapp
 import zipfile
+import zlib
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timezone
+from functools import partial
 from itertools import chain
 from pathlib import Path
-from stat import S_IFMT, S_IMODE, S_IXGRP, S_IXOTH, S_IXUSR
+from stat import S_IFLNK, S_IFMT, S_IFREG, S_IMODE, S_ISDIR, S_ISLNK, S_IXGRP, S_IXOTH, S_IXUSR
 from types import ModuleType
-from typing import Any, Generator, IO, Iterator, List, Optional, Tuple, Union
+from typing import (
+    Any,
+    Callable,
+    Collection,
+    Dict,
+    Generator,
+    IO,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    TypeVar,
+    Union,
+)
 
 from . import bootstrap
 from .bootstrap.environment import Environment
+from .bootstrap.manifest import Manifest, ManifestEntry
+from .compression import (
+    DEDUPLICATED_RULE,
+    INCOMPRESSIBLE_RULE,
+    REUSED_RULE,
+    CompressionPolicy,
+    Decision,
+    compress,
+)
 from .constants import BINPRM_ERROR, BUILD_AT_TIMESTAMP_FORMAT
+from .pruning import PruningPolicy
+from .report import BuildReport
 
 try:
     import importlib.resources as importlib_resources  # type: ignore
@@ -45,6 +81,20 @@ else:
 # Typical maximum length for a shebang line
 BINPRM_BUF_SIZE = 128
 
+# How many entries each compression worker may have in flight before the writer catches up.
+# This bounds the amount of compressed data held in memory during parallel builds.
+WORKER_QUEUE_DEPTH = 4
+
+# Files larger than this are streamed into the archive in chunks of this size instead of being read into memory.
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# The fixed-size part of a zip entry's local file header (see APPNOTE.TXT, section 4.3.7)
+LOCAL_FILE_HEADER = struct.Struct("<4s2B4HL2L2H")
+LOCAL_FILE_HEADER_SIGNATURE = b"PK\003\004"
+
 # zipapp __main__.py template
 MAIN_TEMPLATE = """\
 # -*- coding: utf-8 -*-
@@ -53,6 +103,51 @@ import {module}
 """
 
 
+class SourceFile(NamedTuple):
+    """A file found by ``walk``."""
+
+    # the path relative to the directory being walked
+    relpath: str
+    # the result of stat() on the file, following symlinks
+    stat: os.stat_result
+    # the full path to the file
+    path: str
+    # opens the file's contents when they don't live at ``path`` (e.g. a member of a wheel)
+    opener: Optional[Callable[[], IO[bytes]]] = None
+
+    @property
+    def name(self) -> str:
+        """The relative path with forward slashes, as used in archives."""
+        return self.relpath.replace(os.sep, "/")
+
+    def open(self) -> IO[bytes]:
+        """Open the file's contents for reading."""
+        return self.opener() if self.opener is not None else open(self.path, "rb")
+
+
+def file_stat(mode: int, size: int) -> os.stat_result:
+    """A stat result for a file that only exists in an archive, only its mode and size are meaningful.
+
+    Modes without a file type (e.g. bare permissions) are those of regular files.
+    """
+    return os.stat_result((mode if S_IFMT(mode) else S_IFREG | mode, 0, 0, 1, 0, 0, size, 0, 0, 0))
+
+
+class CompressedFile(NamedTuple):
+    """A file read and compressed by one of the workers of create_archive.
+
+    Files that are too large to be held in memory are not read, they have no payload and no decision.
+    """
+
+    file: SourceFile
+    size: int = 0
+    crc: int = 0
+    digest: str = ""
+    payload: bytes = b""
+    decision: Optional[Decision] = None
+    seconds: float = 0.0
+
+
 def write_file_prefix(f: IO[Any], interpreter: str) -> None:
     """Write a shebang line.
 
@@ -76,13 +171,327 @@ def write_to_zipapp(
 ) -> None:
     """Write a file or a bytestring to a ZipFile as a separate entry and update contents_hash as a side effect."""
 
+    archive.writestr(zipinfo_for(arcname, date_time, compression, stat), data)
+
+
+def zipinfo_for(
+    arcname: str,
+    date_time: Tuple[int, int, int, int, int, int],
+    compression: int,
+    stat: Optional[os.stat_result] = None,
+    level: Optional[int] = None,
+) -> zipfile.ZipInfo:
+    """Create the ZipInfo for an archive entry, carrying over permissions from ``stat`` if provided."""
+
     zinfo = zipfile.ZipInfo(arcname, date_time=date_time)
     zinfo.compress_type = compression
+    zinfo._compresslevel = level  # type: ignore
 
     if stat:
         zinfo.external_attr = (S_IMODE(stat.st_mode) | S_IFMT(stat.st_mode)) << 16
 
-    archive.writestr(zinfo, data)
+    return zinfo
+
+
+def write_compressed_to_zipapp(
+    archive: zipfile.ZipFile, zinfo: zipfile.ZipInfo, payload: Union[bytes, Iterable[bytes]]
+) -> None:
+    """Write an already compressed payload (either a bytestring or an iterable of chunks) to a ZipFile.
+
+    The CRC and the file sizes must already be set on ``zinfo``. This mirrors what ZipFile.writestr does
+    internally, minus the compression, so the resulting bytes are identical to a writestr of the original data.
+    """
+    zinfo.flag_bits = 0x00
+
+    if zinfo.compress_type == zipfile.ZIP_LZMA:
+        # compressed data includes an end-of-stream (EOS) marker
+        zinfo.flag_bits |= 0x02
+
+    if not zinfo.external_attr:
+        zinfo.external_attr = 0o600 << 16
+
+    zip64 = zinfo.file_size * 1.05 > zipfile.ZIP64_LIMIT
+
+    with archive._lock:  # type: ignore
+        if archive._seekable:  # type: ignore
+            archive.fp.seek(archive.start_dir)  # type: ignore
+
+        zinfo.header_offset = archive.fp.tell()  # type: ignore
+        archive._writecheck(zinfo)  # type: ignore
+        archive._didModify = True  # type: ignore
+
+        archive.fp.write(zinfo.FileHeader(zip64))  # type: ignore
+
+        for chunk in [payload] if isinstance(payload, bytes) else payload:
+            archive.fp.write(chunk)  # type: ignore
+
+        archive.start_dir = archive.fp.tell()  # type: ignore
+
+        archive.filelist.append(zinfo)
+        archive.NameToInfo[zinfo.filename] = zinfo
+
+
+def read_chunks(path: Union[str, Path, SourceFile]) -> Iterator[bytes]:
+    """Read a file in chunks of ``STREAM_CHUNK_SIZE`` bytes."""
+    with path.open() if isinstance(path, SourceFile) else open(path, "rb") as src:
+        yield from iter(lambda: src.read(STREAM_CHUNK_SIZE), b"")
+
+
+def stream_to_zipapp(
+    archive: zipfile.ZipFile,
+    zinfo: zipfile.ZipInfo,
+    path: Union[str, Path, SourceFile],
+    contents_hash: Optional[Any] = None,
+) -> None:
+    """Stream a file into a ZipFile in fixed-size chunks, so memory use doesn't depend on the file's size.
+
+    The CRC is computed by zipfile as the data goes through, ``contents_hash`` is updated with every chunk.
+    The ``file_size`` of ``zinfo`` should be set upfront, it is used to decide whether ZIP64 extensions are needed.
+    """
+    with archive.open(zinfo, mode="w") as dest:
+        for chunk in read_chunks(path):
+            if contents_hash is not None:
+                contents_hash.update(chunk)
+
+            dest.write(chunk)
+
+
+class StreamWriter:
+    """Wraps a stream that can't seek (e.g. stdout or a pipe), keeping track of how much was written to it.
+
+    zipfile writes the entries of an archive it can't seek in followed by data descriptors, but it still needs to
+    know where each entry starts relative to the beginning of the file, which includes the shebang.
+    """
+
+    def __init__(self, stream: IO[bytes]) -> None:
+        self.stream = stream
+        self.position = 0
+
+    def write(self, data: bytes) -> int:
+        self.stream.write(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        raise io.UnsupportedOperation("seek")
+
+    def flush(self) -> None:
+        self.stream.flush()
+
+
+@contextmanager
+def open_target(target: Union[Path, IO[bytes]]) -> Iterator[IO[Any]]:
+    """Open the file an archive is written to, or wrap the stream it is written to (see ``StreamWriter``)."""
+    if isinstance(target, Path):
+        with target.open(mode="wb") as fd:
+            yield fd
+    else:
+        yield StreamWriter(target)  # type: ignore
+        target.flush()
+
+
+class PreviousArchive:
+    """A previously built pyz, whose compressed entries can be copied into a new archive without recompressing them.
+
+    An entry is reused only if its name, size, CRC-32 and compression method match the file being archived,
+    so the new archive is byte-identical to one built from scratch with the same compression settings.
+    If the previous build has a manifest, the contents digest and the compression level have to match as well.
+
+    Whether a build stored incompressible entries can't be told from the entries alone, so given the ``policy`` of
+    the new build, nothing is reused unless the manifest of the previous build records the same ``store_ratio``.
+    """
+
+    def __init__(self, path: Path, policy: Optional[CompressionPolicy] = None) -> None:
+        with zipfile.ZipFile(str(path)) as archive:
+            self.entries: Dict[str, zipfile.ZipInfo] = {zinfo.filename: zinfo for zinfo in archive.infolist()}
+            self.manifest = Manifest.load(archive)
+
+        recorded = self.manifest.compression if self.manifest is not None else None
+
+        if policy is not None and (recorded or {}).get("store_ratio") != policy.store_ratio:
+            self.entries = {}
+
+        self.reused = 0
+        self._fd = path.open("rb")
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        self._fd.close()
+
+    def find(
+        self,
+        name: str,
+        size: int,
+        decision: Decision,
+        crc: Optional[int] = None,
+        digest: Optional[str] = None,
+    ) -> Optional[zipfile.ZipInfo]:
+        """Return the previous entry for the site-packages file ``name`` if it can be reused, ``None`` otherwise.
+
+        Leaving out ``crc`` and ``digest`` only checks the cheap criteria, to decide whether reading the file first
+        is worth it.
+        """
+        zinfo = self.entries.get(f"site-packages/{name}")
+
+        if zinfo is None or zinfo.file_size != size or zinfo.compress_type != decision.compression:
+            return None
+
+        # encrypted entries can't be reused
+        if zinfo.flag_bits & 0x1 or (crc is not None and zinfo.CRC != crc):
+            return None
+
+        entry = self.manifest.get(name) if self.manifest else None
+
+        if entry is not None and (entry.level != decision.level or (digest is not None and entry.digest != digest)):
+            return None
+
+        return zinfo
+
+    def read(self, zinfo: zipfile.ZipInfo) -> Iterator[bytes]:
+        """Read the compressed payload of a previous entry, in chunks of at most ``STREAM_CHUNK_SIZE`` bytes."""
+        header = self._pread(zinfo.header_offset, LOCAL_FILE_HEADER.size)
+
+        if len(header) != LOCAL_FILE_HEADER.size or header[0:4] != LOCAL_FILE_HEADER_SIGNATURE:
+            raise zipfile.BadZipFile(f"Bad local file header for {zinfo.filename}")
+
+        fields = LOCAL_FILE_HEADER.unpack(header)
+        # the local header is followed by the file name and the extra field, both of variable length
+        offset = zinfo.header_offset + LOCAL_FILE_HEADER.size + fields[10] + fields[11]
+        remaining = zinfo.compress_size
+
+        with self._lock:
+            self.reused += 1
+
+        while remaining:
+            chunk = self._pread(offset, min(remaining, STREAM_CHUNK_SIZE))
+
+            if not chunk:
+                raise zipfile.BadZipFile(f"Truncated data for {zinfo.filename}")
+
+            offset += len(chunk)
+            remaining -= len(chunk)
+            yield chunk
+
+    def _pread(self, offset: int, size: int) -> bytes:
+        # worker threads share the file handle
+        with self._lock:
+            self._fd.seek(offset)
+            return self._fd.read(size)
+
+
+@contextmanager
+def previous_archive(
+    path: Optional[Path], target: Optional[Path], policy: Optional[CompressionPolicy] = None
+) -> Iterator[Optional[PreviousArchive]]:
+    """Open a previous build of ``target`` for reuse, if it exists.
+
+    If the previous build is ``target`` itself, it is moved out of the way first (and removed afterwards),
+    since it's about to be overwritten.
+    """
+    if path is None or not path.exists():
+        yield None
+        return
+
+    moved = False
+
+    if target is not None and target.exists() and target.samefile(path):
+        moved = True
+        path = target.replace(target.with_name(target.name + ".previous"))
+
+    previous = PreviousArchive(path, policy)
+
+    try:
+        yield previous
+    finally:
+        previous.close()
+
+        if moved:
+            path.unlink()
+
+
+def write_large_file(
+    archive: zipfile.ZipFile,
+    zinfo: zipfile.ZipInfo,
+    file: SourceFile,
+    file_hash: Any,
+    policy: CompressionPolicy,
+    previous: Optional[PreviousArchive] = None,
+) -> Decision:
+    """Write a file that is too large to be held in memory, reusing its previous compressed entry if possible.
+
+    ``file_hash`` is updated with the file's contents, the compression decision that was applied is returned.
+    Whether the file is incompressible is decided from its first chunk only.
+    """
+    decision = policy.decide(file.name)
+
+    if policy.store_ratio is not None:
+        with file.open() as f:
+            sample = f.read(STREAM_CHUNK_SIZE)
+
+        if policy.is_incompressible(decision, len(sample), len(compress(sample, decision.compression, decision.level))):
+            decision = Decision(zipfile.ZIP_STORED, None, INCOMPRESSIBLE_RULE)
+
+    zinfo.compress_type = decision.compression
+    zinfo._compresslevel = decision.level  # type: ignore
+
+    candidate = previous.find(file.name, zinfo.file_size, decision) if previous else None
+
+    if previous is None or candidate is None:
+        stream_to_zipapp(archive, zinfo, file, file_hash)
+        return decision
+
+    # we need a checksum before deciding, which means reading the file one extra time when it did change
+    crc = 0
+    for chunk in read_chunks(file):
+        crc = zlib.crc32(chunk, crc)
+        file_hash.update(chunk)
+
+    if previous.find(file.name, zinfo.file_size, decision, crc, file_hash.hexdigest()) is None:
+        stream_to_zipapp(archive, zinfo, file)
+        return decision
+
+    zinfo.CRC = crc
+    zinfo.compress_size = candidate.compress_size
+    write_compressed_to_zipapp(archive, zinfo, previous.read(candidate))
+    return decision._replace(rule=REUSED_RULE)
+
+
+def default_workers() -> int:
+    """Return the number of cores available to this process."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+
+    return os.cpu_count() or 1
+
+
+def imap_ordered(fn: Callable[[T], R], items: Iterable[T], workers: int) -> Iterator[R]:
+    """Like ``map``, but evaluated across a pool of threads.
+
+    Results are yielded in the order of ``items``, and only a bounded number of them are
+    computed ahead of the consumer, so memory use stays proportional to the number of workers.
+
+    :param fn: The function to apply to each item.
+    :param items: The items to process.
+    :param workers: The number of threads to use, 1 means "don't use threads at all".
+    """
+    if workers <= 1:
+        yield from map(fn, items)
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending: deque = deque()
+
+        for item in items:
+            pending.append(executor.submit(fn, item))
+
+            if len(pending) >= workers * WORKER_QUEUE_DEPTH:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
 
 
 def rglob_follow_symlinks(path: Path, glob: str) -> Generator[Path, None, None]:
@@ -94,14 +503,241 @@ def rglob_follow_symlinks(path: Path, glob: str) -> Generator[Path, None, None]:
             yield p
 
 
+def walk(
+    source: Path, preserve_symlinks: bool = False, keep_symlink: Optional[Callable[[str, str], bool]] = None
+) -> Iterator[SourceFile]:
+    """Yield every file below ``source``, following symlinks, sorted by relative path.
+
+    This yields the same files, in the same order, as sorting the output of ``rglob_follow_symlinks``,
+    but with a single ``stat()`` call per entry and no intermediate Path objects. Symlinks pointing to
+    a directory that is already being walked are skipped, to avoid walking in circles.
+
+    If ``preserve_symlinks`` is true, symlinks (to files or directories) pointing inside ``source`` aren't followed,
+    they are yielded as symlinks instead (see :func:`preserved_symlink`). If given, ``keep_symlink`` is called with
+    the name of each of these symlinks and the name of what it points to (relative to ``source``, with forward slashes
+    and a trailing slash for directories), the symlinks it returns false for are followed after all.
+    """
+    root = os.fspath(source)
+
+    # like rglob, yield nothing for a source that isn't a directory
+    if os.path.isdir(root):
+        stat = os.stat(root)
+        real_root = os.path.realpath(root) if preserve_symlinks else None
+        yield from _walk(root, "", {(stat.st_dev, stat.st_ino)}, real_root, keep_symlink)
+
+
+def preserved_symlink(
+    entry: "os.DirEntry[str]", relpath: str, root: str, keep: Optional[Callable[[str, str], bool]] = None
+) -> Optional[SourceFile]:
+    """Return a symlink as a file whose contents are the path it points to, if it points to something in ``root``
+    (and ``keep`` returns true for it, see :func:`walk`).
+
+    The path is made relative to the symlink (with forward slashes), so that it remains valid wherever ``root`` ends
+    up, and the file's mode is that of a symlink.
+    """
+    if not entry.is_symlink():
+        return None
+
+    target = os.path.realpath(entry.path)
+
+    if not os.path.exists(target) or not (target == root or target.startswith(root + os.sep)):
+        return None
+
+    name = os.path.relpath(target, root).replace(os.sep, "/") + ("/" if os.path.isdir(target) else "")
+
+    if keep is not None and not keep(relpath.replace(os.sep, "/"), name):
+        return None
+
+    # where the target is relative to where the link is in the tree, which isn't necessarily where it is on disk
+    link = os.path.relpath(os.path.relpath(target, root), os.path.dirname(relpath) or os.curdir)
+    data = link.replace(os.sep, "/").encode("utf-8")
+    stat = entry.stat(follow_symlinks=False)
+    stat = os.stat_result((S_IFLNK | S_IMODE(stat.st_mode), *stat[1:6], len(data), *stat[7:10]))
+
+    return SourceFile(relpath, stat, entry.path, partial(io.BytesIO, data))
+
+
+def _walk(
+    path: str,
+    prefix: str,
+    ancestors: Set[Tuple[int, int]],
+    root: Optional[str],
+    keep_symlink: Optional[Callable[[str, str], bool]] = None,
+) -> Iterator[SourceFile]:
+    with os.scandir(path) as it:
+        entries: List[Tuple[os.DirEntry, os.stat_result, Optional[SourceFile]]] = []
+
+        for entry in it:
+            symlink = preserved_symlink(entry, prefix + entry.name, root, keep_symlink) if root is not None else None
+            entries.append((entry, symlink.stat if symlink is not None else entry.stat(), symlink))
+
+    # Sorting directories as if their names ended with a separator
+    # yields the same order as sorting the full paths of all files.
+    entries.sort(key=lambda item: item[0].name + os.sep if S_ISDIR(item[1].st_mode) else item[0].name)
+
+    for entry, stat, symlink in entries:
+        relpath = prefix + entry.name
+
+        if not S_ISDIR(stat.st_mode):
+            yield symlink or SourceFile(relpath, stat, entry.path)
+            continue
+
+        if not stat.st_ino:
+            # on windows, DirEntry.stat() doesn't fill in inode numbers
+            stat = os.stat(entry.path)
+
+        key = (stat.st_dev, stat.st_ino)
+
+        if key in ancestors:
+            continue
+
+        ancestors.add(key)
+        yield from _walk(entry.path, relpath + os.sep, ancestors, root, keep_symlink)
+        ancestors.remove(key)
+
+
+def symlink_kept(
+    name: str,
+    target: str,
+    app_layer: Optional[List[str]] = None,
+    pruning: Optional[PruningPolicy] = None,
+    compiled: Collection[str] = (),
+) -> bool:
+    """Whether a symlink is preserved: only if what it points to is extracted next to it, i.e. archived and in the
+    same layer.
+
+    :param name: The name of the symlink, relative to site-packages and with forward slashes.
+    :param target: The name of what it points to, with a trailing slash for directories.
+    :param app_layer: Optional, globs of the application layer.
+    :param pruning: Optional, the policy of the files left out.
+    :param compiled: The relative paths of the sources left out for their sourceless bytecode.
+    """
+    if posixpath.splitext(target)[1] == ".pyc" or target.replace("/", os.sep) in compiled:
+        return False
+
+    if app_layer and bootstrap.layer_of(name, app_layer) != bootstrap.layer_of(target, app_layer):
+        return False
+
+    return pruning is None or pruning.excluded_by(target) is None
+
+
+def follow_symlinks(files: Sequence[SourceFile], keep: Callable[[str, str], bool]) -> List[SourceFile]:
+    """Replace the symlinks among ``files`` (e.g. the files of an archive, see :func:`preserved_symlink`) that
+    ``keep`` returns false for (see :func:`walk`) with what they point to among ``files``, the way ``walk`` follows
+    them.
+    """
+    by_name = {file.name: file for file in files}
+
+    def link_target(file: SourceFile) -> str:
+        with file.open() as f:
+            link = f.read().decode("utf-8")
+
+        return posixpath.normpath(posixpath.join(posixpath.dirname(file.name), link))
+
+    def followed(name: str, target: str, seen: Set[str]) -> Iterator[SourceFile]:
+        if target in seen:
+            return
+
+        file = by_name.get(target)
+
+        if file is not None and S_ISLNK(file.stat.st_mode):
+            yield from followed(name, link_target(file), seen | {target})
+        elif file is not None:
+            yield file._replace(relpath=name.replace("/", os.sep))
+        else:
+            # a directory: everything below it
+            for other in files:
+                if other.name.startswith(target + "/"):
+                    yield from followed(f"{name}/{posixpath.relpath(other.name, target)}", other.name, seen | {target})
+
+    result: List[SourceFile] = []
+
+    for file in files:
+        if not S_ISLNK(file.stat.st_mode):
+            result.append(file)
+            continue
+
+        target = link_target(file)
+        is_dir = target not in by_name and any(other.name.startswith(target + "/") for other in files)
+
+        if keep(file.name, target + "/" if is_dir else target):
+            result.append(file)
+        else:
+            result.extend(followed(file.name, target, set()))
+
+    return result
+
+
 def create_archive(
-    sources: List[Path], target: Path, interpreter: str, main: str, env: Environment, compressed: bool = True
-) -> None:
+    sources: List[Path],
+    target: Union[Path, IO[bytes]],
+    interpreter: str,
+    main: str,
+    env: Environment,
+    compressed: bool = True,
+    workers: Optional[int] = None,
+    reuse_from: Optional[Path] = None,
+    policy: Optional[CompressionPolicy] = None,
+    bytecode: Optional[Path] = None,
+    sourceless: bool = False,
+    report: Optional[BuildReport] = None,
+    extra_files: Sequence[SourceFile] = (),
+    deduplicate: bool = False,
+    hash_algorithm: str = "sha256",
+    preserve_symlinks: bool = False,
+    pruning: Optional[PruningPolicy] = None,
+    stripped: Optional[Path] = None,
+) -> BuildReport:
     """Create an application archive from SOURCE.
 
     This function is a heavily modified version of stdlib's
     `zipapp.create_archive <https://docs.python.org/3/library/zipapp.html#zipapp.create_archive>`_
 
+    Files are read and compressed by a pool of ``workers`` threads (defaulting to the number of available
+    cores), but always written in the same sorted order, so the output doesn't depend on the worker count.
+    Files larger than ``STREAM_CHUNK_SIZE`` are streamed into the archive chunk by chunk instead, so peak
+    memory use doesn't depend on the size of the largest file.
+
+    If ``reuse_from`` points to a previous build, the compressed data of unchanged entries is copied
+    from it instead of compressing these files again.
+
+    How each entry is compressed is decided by ``policy`` (by default, everything is deflated if ``compressed``
+    is true and stored otherwise).
+
+    A report of the build is returned: how long each phase took, what each of the policy's rules did, sizes per
+    top-level package and the slowest entries. Phases are added to ``report`` if one is given.
+
+    Files excluded by ``pruning`` are left out (including ``extra_files`` and bytecode), how many files and bytes
+    each rule excluded is recorded in the report.
+
+    If ``preserve_symlinks`` is true, symlinks in ``sources`` that point inside their source are archived as
+    symlinks (a zip entry whose contents are the path the symlink points to, with the mode of a symlink) instead of
+    archiving what they point to again, and they are extracted as symlinks.
+
+    The contents of every file are hashed with ``hash_algorithm`` (while they are compressed, so in parallel), the
+    digests are stored in the archive's manifest, and the default build id is the root of their Merkle tree (see
+    :meth:`shiv.bootstrap.manifest.Manifest.tree`).
+
+    ``target`` is either the path to write the archive to, or a stream (e.g. stdout or a pipe) to write it to in
+    a single pass, using data descriptors for the entries whose checksum isn't known before they are written.
+
+    ``extra_files`` are archived in site-packages after the files of ``sources``, their contents may come from
+    somewhere other than a file on disk (e.g. the members of a wheel, see :mod:`shiv.wheel`).
+
+    ``.pyc`` files found in ``sources`` are skipped, but bytecode compiled at build time can be added from
+    the ``bytecode`` directory (see :mod:`shiv.bytecode`). If ``sourceless`` is true, the sources that were
+    compiled next to their ``.py`` file in that directory are left out.
+
+    Files that have a copy in the ``stripped`` directory (native extensions without their debug information, see
+    :mod:`shiv.strip`) are archived from that copy instead.
+
+    If ``deduplicate`` is true, files with the same contents and permissions as a file that's already in the archive
+    aren't stored again: the manifest records them as aliases of that file, which are hardlinked to it when
+    site-packages is extracted.
+
+    If ``env.app_layer`` is set, the site-packages files it matches (see :func:`shiv.bootstrap.layer_of`) and the
+    rest of them are extracted separately at runtime, each to a directory named after a hash of its own contents,
+    so that changing the application doesn't require extracting its dependencies again.
     """
 
     # Check that main has the right format.
@@ -116,75 +752,237 @@ def create_archive(
     timestamp = datetime.strptime(env.built_at, BUILD_AT_TIMESTAMP_FORMAT).replace(tzinfo=timezone.utc).timestamp()
     zipinfo_datetime: Tuple[int, int, int, int, int, int] = time.gmtime(int(timestamp))[0:6]
 
-    with target.open(mode="wb") as fd:
+    if report is None:
+        report = BuildReport()
+
+    target_path = target if isinstance(target, Path) else None
+
+    # Determine compression.
+    if policy is None:
+        policy = CompressionPolicy(zipfile.ZIP_DEFLATED if compressed else zipfile.ZIP_STORED)
+
+    with previous_archive(reuse_from, target_path, policy) as previous, open_target(target) as fd:
 
         # Write shebang.
         write_file_prefix(fd, interpreter)
 
-        # Determine compression.
-        compression = zipfile.ZIP_DEFLATED if compressed else zipfile.ZIP_STORED
+        # zipimport can only read deflated (or stored) entries, so that's what the bootstrap code is written with.
+        compression = zipfile.ZIP_STORED if policy.method == zipfile.ZIP_STORED else zipfile.ZIP_DEFLATED
 
         # Pack zipapp with dependencies.
         with zipfile.ZipFile(fd, "w", compression=compression) as archive:
 
-            site_packages = Path("site-packages")
-            contents_hash = hashlib.sha256()
+            # Every file is read exactly once, its digest and how it was written are recorded in the manifest.
+            manifest = Manifest(algorithm=hash_algorithm, compression=policy.to_dict())
 
-            for source in sources:
+            with report.phase("site-packages") as stats:
 
-                # Glob is known to return results in non-deterministic order.
-                # We need to sort them by in-archive paths to ensure
-                # that archive contents are reproducible.
-                #
-                # NOTE: https://github.com/linkedin/shiv/issues/236
-                # this special rglob function can be replaced with "rglob('*', follow_symlinks=True)"
-                # when Python 3.13 becomes the lowest supported version
-                for path in sorted(rglob_follow_symlinks(source, "*"), key=str):
+                # The manifest entry of the first file stored with each digest, mode (and layer), when deduplicating.
+                stored: Dict[Tuple[str, int, Optional[str]], ManifestEntry] = {}
 
-                    # Skip compiled files and directories (as they are not required to be present in the zip).
-                    if path.suffix == ".pyc" or path.is_dir():
-                        continue
+                # Sources compiled to sourceless bytecode (i.e. ``module.pyc`` next to ``module.py``) are left out.
+                compiled = set()
 
-                    data = path.read_bytes()
+                if bytecode is not None and sourceless:
+                    compiled = {file.relpath[:-1] for file in walk(bytecode) if file.relpath.endswith(".pyc")}
+
+                # Files with a stripped copy are archived from it instead.
+                replaced = {file.relpath for file in walk(stripped)} if stripped is not None else set()
 
-                    # update the contents hash
-                    contents_hash.update(data)
-                    # take filenames into account as well - build_id should change if a file is moved or renamed
-                    contents_hash.update(str(path.relative_to(source)).encode())
+                all_sources: List[Union[Path, Sequence[SourceFile]]] = [*sources, extra_files]
 
-                    arcname = str(site_packages / path.relative_to(source))
+                if bytecode is not None:
+                    all_sources.append(bytecode)
 
-                    write_to_zipapp(archive, arcname, data, zipinfo_datetime, compression, stat=path.stat())
+                if stripped is not None:
+                    all_sources.append(stripped)
 
-            if env.build_id is None:
-                # Now that we have a hash of all the source files, use it as our build id if the user did not
-                # specify a custom one.
-                env.build_id = contents_hash.hexdigest()
+                keep_symlink = partial(symlink_kept, app_layer=env.app_layer, pruning=pruning, compiled=compiled)
 
-            # now let's add the shiv bootstrap code.
-            bootstrap_target = Path("_bootstrap")
+                def kept(file: SourceFile) -> bool:
+                    rule = pruning.excluded_by(file.name) if pruning is not None else None
 
-            for path, name in iter_package_files(bootstrap):
-                data = path.read_bytes()
+                    if rule is not None:
+                        report.record_pruned(rule, file.stat.st_size)
+
+                    return rule is None
+
+                for source in all_sources:
+
+                    if not isinstance(source, Path):
+                        files = [file for file in source if file.relpath not in replaced]
+                    elif source in (bytecode, stripped):
+                        # Bytecode compiled at build time is the one kind of compiled file we do want.
+                        files = list(walk(source))
+                    else:
+                        # Skip compiled files (as they are not required to be present in the zip).
+                        files = [
+                            file
+                            for file in walk(source, preserve_symlinks, keep_symlink)
+                            if os.path.splitext(file.relpath)[1] != ".pyc"
+                            and file.relpath not in compiled
+                            and file.relpath not in replaced
+                        ]
+
+                    files = [file for file in files if kept(file)]
+
+                    def read_and_compress(file: SourceFile) -> CompressedFile:
+                        if file.stat.st_size > STREAM_CHUNK_SIZE:
+                            # too large to hold in memory, the writer will stream it instead
+                            if not deduplicate:
+                                return CompressedFile(file)
+
+                            # but it has to know whether the file is a duplicate first
+                            file_hash = manifest.new_hash()
+
+                            for chunk in read_chunks(file):
+                                file_hash.update(chunk)
+
+                            return CompressedFile(file, digest=file_hash.hexdigest())
+
+                        started = time.perf_counter()
+
+                        with file.open() as f:
+                            data = f.read()
+
+                        crc = zlib.crc32(data)
+                        digest = manifest.new_hash(data).hexdigest()
+
+                        # compression rules are matched against paths relative to site-packages
+                        decision = policy.decide(file.name)  # type: ignore
+                        reusable = previous.find(file.name, len(data), decision, crc, digest) if previous else None
+
+                        if previous is not None and reusable is None and policy.may_store(decision):  # type: ignore
+                            # the previous build may have stored the file because it was incompressible, which can't
+                            # be told without compressing it again
+                            stored = Decision(zipfile.ZIP_STORED, None, INCOMPRESSIBLE_RULE)
+                            reusable = previous.find(file.name, len(data), stored, crc, digest)
+                            decision = stored if reusable is not None else decision
+
+                        if previous is not None and reusable is not None:
+                            payload = b"".join(previous.read(reusable))
+                            decision = decision._replace(rule=REUSED_RULE)
+                        else:
+                            decision, payload = policy.apply(file.name, data)  # type: ignore
+
+                        elapsed = time.perf_counter() - started
+                        return CompressedFile(file, len(data), crc, digest, payload, decision, elapsed)
+
+                    for file, size, crc, digest, payload, decision, seconds in imap_ordered(
+                        read_and_compress, files, workers or default_workers()
+                    ):
+
+                        arcname = f"site-packages/{file.name}"
+                        # the type of symlinks is part of their mode, so that they are never mistaken for files
+                        mode = S_IMODE(file.stat.st_mode) | (S_IFLNK if S_ISLNK(file.stat.st_mode) else 0)
+                        # layers are extracted separately, so files can only be aliases of files of the same layer
+                        layer = bootstrap.layer_of(file.name, env.app_layer) if env.app_layer else None
+                        original = stored.get((digest, mode, layer)) if digest else None
+
+                        if original is not None and original.path != file.name:
+                            # only the manifest refers to duplicates, their contents are those of the original
+                            size = size if decision is not None else file.stat.st_size
+                            report.compression.record(DEDUPLICATED_RULE, size, 0, seconds)
+                            report.record_entry(file.name, size, 0, seconds)
+                            stats.files += 1
+                            stats.bytes += size
+                            manifest.add(original._replace(path=file.name, compressed_size=0, alias=original.path))
+                            continue
+
+                        if decision is None:
+                            zinfo = zipinfo_for(arcname, zipinfo_datetime, compression, stat=file.stat)
+                            zinfo.file_size = file.stat.st_size
+
+                            started = time.perf_counter()
+                            file_hash = manifest.new_hash()
+                            decision = write_large_file(archive, zinfo, file, file_hash, policy, previous)
+                            digest = file_hash.hexdigest()
+                            seconds = time.perf_counter() - started
+                        else:
+                            zinfo = zipinfo_for(
+                                arcname, zipinfo_datetime, decision.compression, file.stat, decision.level
+                            )
+                            zinfo.file_size = size
+                            zinfo.compress_size = len(payload)
+                            zinfo.CRC = crc
+                            write_compressed_to_zipapp(archive, zinfo, payload)
+
+                        report.compression.record(decision.rule, zinfo.file_size, zinfo.compress_size, seconds)
+                        report.record_entry(file.name, zinfo.file_size, zinfo.compress_size, seconds)
+                        stats.files += 1
+                        stats.bytes += zinfo.file_size
+                        entry = ManifestEntry(
+                            file.name,
+                            zinfo.file_size,
+                            mode,
+                            digest,
+                            zinfo.compress_size,
+                            decision.compression,
+                            decision.level,
+                        )
+                        manifest.add(entry)
+
+                        # hardlinking symlinks would link to their targets instead
+                        if deduplicate and not S_ISLNK(mode):
+                            stored.setdefault((digest, mode, layer), entry)
+
+            with report.phase("bootstrap"):
+
+                if env.build_id is None:
+                    # Now that we have a hash of all the source files, use it as our build id if the user did not
+                    # specify a custom one.
+                    env.build_id = manifest.build_id()
+
+                if env.app_layer:
+                    # Each layer is extracted to its own directory, named after a hash of the layer's contents.
+                    env.layer_ids = {
+                        layer: Manifest(
+                            [entry for entry in manifest if bootstrap.layer_of(entry.path, env.app_layer) == layer],
+                            manifest.algorithm,
+                        ).build_id()
+                        for layer in bootstrap.LAYERS
+                    }
+
+                if env.no_modify:
+                    # the hashes of all source files are checked at runtime
+                    env.hashes = manifest.hashes(".py")
+                    env.hash_algorithm = manifest.algorithm
 
                 write_to_zipapp(
-                    archive,
-                    str(bootstrap_target / name),
-                    data,
-                    zipinfo_datetime,
-                    compression,
-                    stat=path.stat(),
+                    archive, Manifest.FILENAME, manifest.to_json().encode("utf-8"), zipinfo_datetime, compression
                 )
 
-            # Write environment info in json file.
-            #
-            # The environment file contains build_id which is a SHA-256 checksum of all **site-packages** contents.
-            # the bootstrap code, environment.json and __main__.py are not used to calculate the checksum, is it's
-            # only used for local caching of site-packages and these files are always read from archive.
-            write_to_zipapp(archive, "environment.json", env.to_json().encode("utf-8"), zipinfo_datetime, compression)
+                # now let's add the shiv bootstrap code.
+                bootstrap_target = Path("_bootstrap")
 
-            # write __main__
-            write_to_zipapp(archive, "__main__.py", main_py.encode("utf-8"), zipinfo_datetime, compression)
+                for path, name in iter_package_files(bootstrap):
+                    data = path.read_bytes()
+
+                    write_to_zipapp(
+                        archive,
+                        str(bootstrap_target / name),
+                        data,
+                        zipinfo_datetime,
+                        compression,
+                        stat=path.stat(),
+                    )
+
+                # Write environment info in json file.
+                #
+                # The environment file contains build_id which is the root of the Merkle tree of the manifest of all
+                # **site-packages** contents. The bootstrap code, environment.json and __main__.py are not used to
+                # calculate the checksum, as it's only used for local caching of site-packages and these files are
+                # always read from archive.
+                write_to_zipapp(
+                    archive, "environment.json", env.to_json().encode("utf-8"), zipinfo_datetime, compression
+                )
+
+                # write __main__
+                write_to_zipapp(archive, "__main__.py", main_py.encode("utf-8"), zipinfo_datetime, compression)
 
     # Make pyz executable (on windows this is no-op).
-    target.chmod(target.stat().st_mode | S_IXUSR | S_IXGRP | S_IXOTH)
+    if target_path is not None:
+        with report.phase("chmod"):
+            target_path.chmod(target_path.stat().st_mode | S_IXUSR | S_IXGRP | S_IXOTH)
+
+    return report
@@ -0,0 +1,119 @@
+"""
+This module compiles the Python sources of a zipapp to bytecode at build time, for one or more interpreters.
+
+Bytecode is compiled by the target interpreters themselves (bytecode isn't portable across Python versions),
+as hash-based pycs so that builds remain reproducible.
+"""
+import json
+import subprocess
+import sys
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+from .builder import walk
+from .constants import BYTECODE_COMPILE_ERROR
+
+# The script each target interpreter runs, it reads a json job from stdin and writes a json result to stdout.
+COMPILE_SCRIPT = """\
+import importlib.util
+import json
+import os
+import py_compile
+import sys
+
+job = json.load(sys.stdin)
+
+for path, relpath in job["files"]:
+    for optimize in job["optimize"]:
+        if job["legacy"]:
+            cfile = relpath + "c"
+        else:
+            cfile = importlib.util.cache_from_source(relpath, optimization=optimize or "")
+
+        try:
+            py_compile.compile(
+                path,
+                cfile=os.path.join(job["target"], cfile),
+                dfile=relpath,
+                doraise=True,
+                optimize=optimize,
+                invalidation_mode=py_compile.PycInvalidationMode.CHECKED_HASH,
+            )
+        except py_compile.PyCompileError:
+            # like pip and compileall, skip files that don't compile (e.g. tests written for another version)
+            pass
+
+json.dump({"cache_tag": sys.implementation.cache_tag}, sys.stdout)
+"""
+
+# Scripts in the bin directory are run by path, so they're never compiled (nor removed in sourceless mode).
+SKIPPED_DIRS = ("bin",)
+
+
+def find_sources(sources: Sequence[Path]) -> Dict[str, str]:
+    """Find all Python source files to compile, mapping their relative paths to their full paths.
+
+    If the same file is found in multiple sources, the last one wins (as it does when extracting the archive).
+    """
+    found = {}
+
+    for source in sources:
+        for file in walk(source):
+            if file.relpath.endswith(".py") and file.name.split("/", 1)[0] not in SKIPPED_DIRS:
+                found[file.relpath] = file.path
+
+    return found
+
+
+def compile_bytecode(
+    sources: Sequence[Path],
+    target: Path,
+    python: str,
+    optimize: Sequence[int] = (0,),
+    legacy: bool = False,
+    workers: int = 1,
+) -> str:
+    """Compile every Python source file in ``sources`` with the interpreter ``python``.
+
+    The compiled files are laid out below ``target`` as they would be next to their sources, in ``__pycache__``
+    directories, or right next to them (as ``module.pyc``) if ``legacy`` is true, which allows importing
+    them without their sources. Files that fail to compile (e.g. because they use a newer syntax) are skipped.
+
+    Returns the cache tag of the interpreter (e.g. ``cpython-311``).
+
+    :param sources: Site-packages directories to compile.
+    :param target: The directory to write bytecode to.
+    :param python: The interpreter to compile bytecode with.
+    :param optimize: The optimization levels to compile bytecode for.
+    :param legacy: Whether to use the legacy (sourceless) layout.
+    :param workers: How many interpreter processes to compile with.
+    """
+    files = sorted(find_sources(sources).items())
+
+    def run(shard: List[List[str]]) -> str:
+        job = {"files": shard, "optimize": list(optimize), "legacy": legacy, "target": str(target)}
+        try:
+            process = subprocess.run(
+                [python, "-I", "-c", COMPILE_SCRIPT],
+                input=json.dumps(job),
+                stdout=subprocess.PIPE,
+                universal_newlines=True,
+            )
+        except OSError:
+            sys.exit(BYTECODE_COMPILE_ERROR.format(python=python))
+
+        if process.returncode:
+            sys.exit(BYTECODE_COMPILE_ERROR.format(python=python))
+
+        return json.loads(process.stdout)["cache_tag"]
+
+    # bytecode compilation is CPU bound, so files are split between several interpreter processes
+    workers = max(1, min(workers, len(files)))
+    shards = [[[path, relpath] for relpath, path in files[i::workers]] for i in range(workers)]
+
+    with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+        cache_tags = set(executor.map(run, shards))
+
+    return cache_tags.pop()
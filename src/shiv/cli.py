@@ -1,90 +1,277 @@
-import hashlib
+import errno
+import json
 import os
 import shutil
 import sys
+import threading
 import time
 
-from configparser import ConfigParser
+from contextlib import ExitStack, redirect_stdout, suppress
 from datetime import datetime
+from functools import wraps
 from pathlib import Path
+from stat import S_ISLNK
 from tempfile import TemporaryDirectory
-from typing import List, Optional
+from typing import Any, Callable, Collection, Dict, List, Optional, Sequence, Set
+from zipfile import ZIP_STORED
 
 import click
 
+try:
+    import fcntl
+except ImportError:
+    # windows
+    fcntl = None  # type: ignore
+
 from . import __version__
-from . import builder, pip
+from . import builder, pip, strip
 from .bootstrap.environment import Environment
+from .bootstrap.import_profile import read_profiles
+from .bootstrap.manifest import HASH_ALGORITHMS
+from .bytecode import compile_bytecode
+from .compression import COMPRESSION_METHODS, CompressionPolicy
 from .constants import (
     BUILD_AT_TIMESTAMP_FORMAT,
     DEFAULT_SHEBANG,
+    DIRECT_WHEELS_ERROR,
+    DIRECT_WHEELS_PRECOMPILE_ERROR,
     DISALLOWED_ARGS,
     DISALLOWED_PIP_ARGS,
     NO_ENTRY_POINT,
     NO_OUTFILE,
     NO_PIP_ARGS_OR_SITE_PACKAGES,
+    PIP_INSTALL_ERROR,
     SOURCE_DATE_EPOCH_DEFAULT,
     SOURCE_DATE_EPOCH_ENV,
+    SOURCELESS_ERROR,
+    TREE_SHAKE_ERROR,
 )
+from .entry_points import ConsoleScriptIndex
+from .output_cache import OutputCache, output_key
+from .pruning import PRESETS, PruningPolicy
+from .report import BuildReport, PrunedStats
+from .tree_shaking import find_imports, shake
+from .wheel import Wheel, wheel_files
 
 
-def find_entry_point(site_packages_dirs: List[Path], console_script: str) -> str:
+def find_entry_point(site_packages_dirs: List[Path], console_script: str, wheels: Sequence[Wheel] = ()) -> str:
     """Find a console_script in a site-packages directory.
 
     Console script metadata is stored in entry_points.txt per setuptools
-    convention. This function searches all entry_points.txt files and
-    returns the import string for a given console_script argument.
+    convention. This function searches the entry_points.txt files of the
+    distributions installed in site-packages (see :mod:`shiv.entry_points`)
+    and returns the import string for a given console_script argument.
 
     :param site_packages_dirs: Paths to site-packages directories on disk.
     :param console_script: A console_script string.
+    :param wheels: Wheels to search as well.
     """
 
-    config_parser = ConfigParser()
-
-    for site_packages in site_packages_dirs:
-        # noinspection PyTypeChecker
-        config_parser.read(site_packages.rglob("entry_points.txt"))
-
-    return config_parser["console_scripts"][console_script]
+    return ConsoleScriptIndex.build(site_packages_dirs, wheels).entry_points[console_script]
 
 
-def console_script_exists(site_packages_dirs: List[Path], console_script: str) -> bool:
+def console_script_exists(
+    site_packages_dirs: List[Path], console_script: str, files: Sequence[builder.SourceFile] = ()
+) -> bool:
     """Return true if the console script with provided name exists in one of the site-packages directories.
 
     Console script is expected to be in the 'bin' directory of site packages.
 
     :param site_packages_dirs: Paths to site-packages directories on disk.
     :param console_script: A console script name.
+    :param files: Files that will be added to site-packages, but aren't on disk (e.g. members of wheels).
     """
 
-    for site_packages in site_packages_dirs:
+    return ConsoleScriptIndex.build(site_packages_dirs, files=files).exists(console_script)
+
+
+# The ioctl that asks Linux filesystems supporting it (btrfs, xfs...) for a copy-on-write clone of a file.
+FICLONE = 0x40049409
+
+# The ways copytree can stage a file, in order of preference.
+STAGING_METHODS = ("reflink", "hardlink", "copy")
+
+
+def reflink(src: str, dst: str) -> None:
+    """Clone ``src`` to ``dst`` without copying its data, or raise OSError if the filesystem can't."""
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, "reflinks are not supported on this platform")
+
+    with open(src, "rb") as src_fd:
+        try:
+            with open(dst, "wb") as dst_fd:
+                fcntl.ioctl(dst_fd.fileno(), FICLONE, src_fd.fileno())
+        except OSError:
+            os.unlink(dst)
+            raise
+
+    shutil.copystat(src, dst)
+
 
-        if (site_packages / "bin" / console_script).exists():
-            return True
+# Options that don't affect the contents of the zipapp, and options whose values are paths to inputs (which are
+# hashed by contents instead), are left out of the key of the output cache.
+OUTPUT_CACHE_IGNORED_OPTIONS = {
+    "output_file",
+    "site_packages",
+    "preamble",
+    "precompile_pythons",
+    "pip_args",
+    "compression_report",
+    "timings",
+    "build_report",
+    "build_workers",
+    "reuse_from",
+    "install_cache",
+    "output_cache",
+    "cache_report",
+}
 
-    return False
+# The output file that streams the zipapp to stdout, and where the stream is kept in the click context's meta.
+STDOUT = "-"
+OUTPUT_STREAM = "shiv.output_stream"
 
+# Where the report of the build is kept in the click context's meta, for callers of the API (see shiv.api).
+BUILD_REPORT = "shiv.build_report"
 
-def copytree(src: Path, dst: Path) -> None:
+
+def messages_to_stderr(f: Callable[..., None]) -> Callable[..., None]:
+    """Print everything to stderr instead of stdout when the zipapp itself is streamed to stdout."""
+
+    @wraps(f)
+    def wrapper(*args: Any, **kwargs: Any) -> None:
+        if kwargs.get("output_file") != STDOUT:
+            return f(*args, **kwargs)
+
+        click.get_current_context().meta[OUTPUT_STREAM] = sys.stdout.buffer
+
+        with redirect_stdout(sys.stderr):
+            return f(*args, **kwargs)
+
+    return wrapper
+
+
+def copy_file(src: Path, dst: Path) -> None:
+    """Copy a file, as a reflink if the filesystem allows it."""
+    with suppress(FileNotFoundError):
+        dst.unlink()
+
+    try:
+        reflink(str(src), str(dst))
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def copytree(
+    src: Path,
+    dst: Path,
+    workers: Optional[int] = None,
+    preserve_symlinks: bool = False,
+    exclude: Collection[str] = (),
+) -> Dict[str, int]:
     """A utility function for syncing directories.
 
-    This function is based on shutil.copytree. In Python versions that are
-    older than 3.8, shutil.copytree would raise FileExistsError if the "dst"
-    directory already existed.
+    Files are staged without copying their contents where the filesystem allows it: as a reflink (a copy-on-write
+    clone) if possible, as a hardlink otherwise, and only copied as a last resort. Files are staged by a pool of
+    ``workers`` threads, and returns how many files were staged with each method.
+
+    Existing files in ``dst`` are replaced (not overwritten in place, as they may be hardlinked to another source),
+    and anything that's later written to ``dst`` must do the same.
 
+    If ``preserve_symlinks`` is true, symlinks pointing inside ``src`` are staged as symlinks (see
+    :func:`shiv.builder.walk`).
+
+    Files below the top-level names of ``src`` listed in ``exclude`` aren't staged.
     """
 
     # Make our target (if it doesn't already exist).
     dst.mkdir(parents=True, exist_ok=True)
 
-    for path in src.iterdir():  # type: Path
+    # once a method fails (e.g. reflinks on ext4, or hardlinks across devices), it isn't tried again
+    unsupported: Set[str] = set()
+    directories_lock = threading.Lock()
+    directories: Set[str] = set()
+
+    def stage(file: builder.SourceFile) -> str:
+        target = os.path.join(dst, file.relpath)
+        parent = os.path.dirname(target)
+
+        with directories_lock:
+            if parent not in directories:
+                os.makedirs(parent, exist_ok=True)
+                directories.add(parent)
+
+        with suppress(FileNotFoundError):
+            os.unlink(target)
+
+        if S_ISLNK(file.stat.st_mode):
+            with file.open() as f:
+                os.symlink(f.read().decode("utf-8"), target)
+
+            return "symlink"
+
+        for method in STAGING_METHODS[:-1]:
+            if method in unsupported:
+                continue
+
+            try:
+                if method == "reflink":
+                    reflink(file.path, target)
+                else:
+                    os.link(file.path, target)
+            except OSError:
+                unsupported.add(method)
+            else:
+                return method
+
+        shutil.copy2(file.path, target)
+        return "copy"
 
-        # If we encounter a subdirectory, recurse.
-        if path.is_dir():
-            copytree(path, dst / path.relative_to(src))
+    counts = dict.fromkeys(STAGING_METHODS + ("symlink",), 0)
+    files = [file for file in builder.walk(src, preserve_symlinks) if file.name.split("/", 1)[0] not in exclude]
 
+    for method in builder.imap_ordered(stage, files, workers or builder.default_workers()):
+        counts[method] += 1
+
+    return counts
+
+
+def stage_install(install: Path, dst: Path, upgrade: bool = False, workers: Optional[int] = None) -> Dict[str, int]:
+    """Stage a (cached) install into ``dst`` the way ``pip install --target`` would have installed it there.
+
+    Like pip, top-level files and directories that already exist in ``dst`` (e.g. copied from --site-packages) are
+    left as they are, unless ``upgrade`` is true, in which case they are replaced entirely. Returns how many files
+    were staged with each method (see :func:`copytree`).
+    """
+    existing = {name for name in os.listdir(install) if os.path.lexists(os.path.join(dst, name))}
+
+    for name in sorted(existing):
+        path = os.path.join(dst, name)
+
+        if not upgrade:
+            click.secho(
+                f"Warning! Target directory {path} already exists. Specify --upgrade to force replacement.",
+                fg="yellow",
+            )
+        elif os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path)
         else:
-            shutil.copy2(str(path), str(dst / path.relative_to(src)))
+            os.unlink(path)
+
+    return copytree(install, dst, workers, exclude=set() if upgrade else existing)
+
+
+def write_reports(report: BuildReport, compression_report: bool, timings: bool, build_report: Optional[str]) -> None:
+    """Print and write the reports of a build that were asked for."""
+    if compression_report:
+        for line in report.compression.lines():
+            click.echo(line)
+
+    if timings:
+        for line in report.lines():
+            click.echo(line)
+
+    if build_report:
+        Path(build_report).expanduser().write_text(report.to_json())
 
 
 @click.command(context_settings=dict(help_option_names=["-h", "--help", "--halp"], ignore_unknown_options=True))
@@ -93,7 +280,11 @@ def copytree(src: Path, dst: Path) -> None:
     "--entry-point", "-e", default=None, help="The entry point to invoke (takes precedence over --console-script)."
 )
 @click.option("--console-script", "-c", default=None, help="The console_script to invoke.")
-@click.option("--output-file", "-o", help="The path to the output file for shiv to create.")
+@click.option(
+    "--output-file",
+    "-o",
+    help="The path to the output file for shiv to create, or '-' to stream the zipapp to stdout.",
+)
 @click.option(
     "--python",
     "-p",
@@ -112,16 +303,215 @@ def copytree(src: Path, dst: Path) -> None:
     "--build-id",
     default=None,
     help=(
-        "Use a custom build id instead of the default (a SHA256 hash of the contents of the build). "
+        "Use a custom build id instead of the default (a hash of the contents of the build). "
         "Warning: must be unique per build!"
     ),
 )
+@click.option(
+    "--hash-algorithm",
+    type=click.Choice(HASH_ALGORITHMS),
+    default="sha256",
+    help="The algorithm to hash the contents of the build with, e.g. blake2b (which is faster on 64-bit platforms).",
+)
+@click.option(
+    "--app-layer",
+    multiple=True,
+    help=(
+        "A top-level name in site-packages (or a glob, e.g. 'myapp*') that is part of the application layer, "
+        "which is extracted (along with scripts) separately from the rest, so that changes to it don't require "
+        "extracting the dependencies again. Can be supplied multiple times."
+    ),
+)
 @click.option("--compressed/--uncompressed", default=True, help="Whether or not to compress your zip.")
+@click.option(
+    "--compression-method",
+    type=click.Choice(sorted(COMPRESSION_METHODS)),
+    default="deflate",
+    help="The compression algorithm to use for compressed entries.",
+)
+@click.option(
+    "--compression-level",
+    type=click.IntRange(min=1, max=9),
+    default=None,
+    help="The compression level to use (default is the compression algorithm's default).",
+)
+@click.option(
+    "--store",
+    "store_globs",
+    multiple=True,
+    help="A glob (e.g. '*.so') of files to store without compression. Can be supplied multiple times.",
+)
+@click.option(
+    "--compress",
+    "compress_globs",
+    multiple=True,
+    help="A glob of files to always compress, even if they match --store. Can be supplied multiple times.",
+)
+@click.option(
+    "--store-ratio",
+    type=click.FloatRange(min=0, max=1),
+    default=None,
+    help=(
+        "Store files uncompressed when compressing doesn't shrink them below this fraction of their size "
+        "(e.g. 0.9), to save decompressing them at runtime."
+    ),
+)
+@click.option(
+    "--deduplicate",
+    is_flag=True,
+    help=(
+        "Store files with identical contents and permissions only once, "
+        "their copies are hardlinked when the zipapp is extracted."
+    ),
+)
+@click.option(
+    "--exclude",
+    "exclude_globs",
+    multiple=True,
+    help="A glob (e.g. '*/benchmarks/*') of site-packages files to leave out. Can be supplied multiple times.",
+)
+@click.option(
+    "--include",
+    "include_globs",
+    multiple=True,
+    help="A glob of files to keep, even if they match --exclude or --prune. Can be supplied multiple times.",
+)
+@click.option(
+    "--prune",
+    "prune_presets",
+    type=click.Choice(sorted(PRESETS)),
+    multiple=True,
+    help="A built-in set of files to leave out (e.g. strip-tests). Can be supplied multiple times.",
+)
+@click.option(
+    "--tree-shake",
+    is_flag=True,
+    help=(
+        "Leave out the top-level packages of site-packages that are never imported, "
+        "starting from the entry point (or console script) and following imports statically."
+    ),
+)
+@click.option(
+    "--keep",
+    "keep_globs",
+    multiple=True,
+    help=(
+        "A glob of top-level packages for --tree-shake to keep (e.g. plugins that are imported dynamically). "
+        "Can be supplied multiple times."
+    ),
+)
+@click.option(
+    "--import-profile",
+    "import_profiles",
+    type=click.Path(exists=True, dir_okay=False),
+    multiple=True,
+    help=(
+        "An import profile recorded by running a zipapp with SHIV_RECORD_IMPORTS=<path>, only the site-packages "
+        "files it lists (and those matching --include) are kept. Can be supplied multiple times."
+    ),
+)
+@click.option(
+    "--strip-debug",
+    is_flag=True,
+    help="Strip the debug information from native extensions (ELF shared objects), using binutils' strip.",
+)
+@click.option(
+    "--keep-debug",
+    "keep_debug_globs",
+    multiple=True,
+    help=(
+        "A glob (e.g. 'torch/*') of native extensions for --strip-debug to leave as they are. "
+        "Can be supplied multiple times."
+    ),
+)
+@click.option(
+    "--preserve-symlinks",
+    is_flag=True,
+    help=(
+        "Store symlinks pointing inside their site-packages directory as symlinks, instead of storing what they "
+        "point to again. They are extracted as symlinks (or copies, where symlinks can't be created)."
+    ),
+)
+@click.option("--compression-report", is_flag=True, help="Print how much each compression rule saved.")
+@click.option("--timings", is_flag=True, help="Print how long each phase of the build took.")
+@click.option(
+    "--build-report",
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help=(
+        "Write a json report of the build to this path: timings per phase, sizes per top-level package, "
+        "compression statistics and the slowest entries."
+    ),
+)
+@click.option(
+    "--build-workers",
+    type=click.IntRange(min=1),
+    default=None,
+    help="The number of threads used to compress the zipapp (default is the number of available cores).",
+)
+@click.option(
+    "--reuse-from",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help=(
+        "A previous build of this zipapp (if it exists) to copy unchanged compressed entries from, "
+        "instead of compressing them again. Nothing is reused if it was built with a different --store-ratio."
+    ),
+)
+@click.option(
+    "--install-cache",
+    type=click.Path(file_okay=False),
+    default=None,
+    help=(
+        "A directory to cache pip installs in, keyed by the exact set of distributions they resolve to and the "
+        "interpreter. Builds resolving to a cached install don't run pip install at all."
+    ),
+)
+@click.option(
+    "--direct-wheels",
+    is_flag=True,
+    help=(
+        "Build straight from the local wheels PIP ARGS resolve to (e.g. with --no-index --find-links), "
+        "reading each wheel into the zipapp instead of installing it first."
+    ),
+)
+@click.option(
+    "--output-cache",
+    type=click.Path(file_okay=False),
+    default=None,
+    help=(
+        "A directory to cache finished zipapps in, keyed by all the inputs of their build. Builds whose inputs "
+        "are identical to a cached build's copy it instead of building it again. Only reproducible builds "
+        "(see --reproducible) writing to a file are cached."
+    ),
+)
+@click.option("--cache-report", is_flag=True, help="Print whether the zipapp was found in the output cache.")
 @click.option(
     "--compile-pyc",
     is_flag=True,
     help="Whether or not to compile pyc files during initial bootstrap.",
 )
+@click.option(
+    "--precompile",
+    "precompile_pythons",
+    multiple=True,
+    help=(
+        "An interpreter (e.g. python3.11) to compile bytecode with at build time, only the bytecode matching "
+        "the running interpreter is extracted. Can be supplied multiple times."
+    ),
+)
+@click.option(
+    "--optimize",
+    "optimize_levels",
+    type=click.IntRange(min=0, max=2),
+    multiple=True,
+    help="An optimization level to precompile bytecode for (default is 0). Can be supplied multiple times.",
+)
+@click.option(
+    "--sourceless",
+    is_flag=True,
+    help="Only ship the precompiled bytecode of Python modules, not their sources. Requires --precompile.",
+)
 @click.option(
     "--extend-pythonpath",
     "-E",
@@ -156,6 +546,7 @@ def copytree(src: Path, dst: Path) -> None:
 )
 @click.option("--root", type=click.Path(), help="Override the 'root' path (default is ~/.shiv).")
 @click.argument("pip_args", nargs=-1, type=click.UNPROCESSED)
+@messages_to_stderr
 def main(
     output_file: str,
     entry_point: Optional[str],
@@ -163,8 +554,37 @@ def main(
     python: Optional[str],
     site_packages: Optional[str],
     build_id: Optional[str],
+    hash_algorithm: str,
+    app_layer: List[str],
     compressed: bool,
+    compression_method: str,
+    compression_level: Optional[int],
+    store_globs: List[str],
+    compress_globs: List[str],
+    store_ratio: Optional[float],
+    deduplicate: bool,
+    exclude_globs: List[str],
+    include_globs: List[str],
+    prune_presets: List[str],
+    tree_shake: bool,
+    keep_globs: List[str],
+    import_profiles: List[str],
+    strip_debug: bool,
+    keep_debug_globs: List[str],
+    preserve_symlinks: bool,
+    compression_report: bool,
+    timings: bool,
+    build_report: Optional[str],
+    build_workers: Optional[int],
+    reuse_from: Optional[str],
+    install_cache: Optional[str],
+    direct_wheels: bool,
+    output_cache: Optional[str],
+    cache_report: bool,
     compile_pyc: bool,
+    precompile_pythons: List[str],
+    optimize_levels: List[int],
+    sourceless: bool,
     extend_pythonpath: bool,
     reproducible: bool,
     no_modify: bool,
@@ -189,6 +609,16 @@ def main(
             if supplied_arg in disallowed:
                 sys.exit(DISALLOWED_PIP_ARGS.format(arg=supplied_arg, reason=DISALLOWED_ARGS[disallowed]))
 
+    # sourceless bytecode lives right next to its (absent) source, so there's only room for one flavor of it
+    if sourceless and (len(precompile_pythons) != 1 or len(optimize_levels) > 1):
+        sys.exit(SOURCELESS_ERROR)
+
+    if direct_wheels and precompile_pythons:
+        sys.exit(DIRECT_WHEELS_PRECOMPILE_ERROR)
+
+    if tree_shake and entry_point is None and console_script is None:
+        sys.exit(TREE_SHAKE_ERROR)
+
     if build_id is not None:
         click.secho(
             "Warning! You have overridden the default build-id behavior, "
@@ -197,49 +627,198 @@ def main(
         )
 
     sources: List[Path] = []
-
-    with TemporaryDirectory() as tmp_site_packages:
+    report = BuildReport()
+    click.get_current_context().meta[BUILD_REPORT] = report
+    target = Path(output_file).expanduser()
+
+    # unless the build is reproducible, the time it was built at is part of the zipapp
+    cache = OutputCache(Path(output_cache).expanduser()) if output_cache and output_file != STDOUT else None
+    cache_key = None
+
+    if cache is not None and (reproducible or SOURCE_DATE_EPOCH_ENV in os.environ):
+        with report.phase("output-cache"):
+            options = {
+                name: value
+                for name, value in click.get_current_context().params.items()
+                if name not in OUTPUT_CACHE_IGNORED_OPTIONS
+            }
+            options["preamble"] = Path(preamble).name if preamble else None
+            options["import_profiles"] = [pip.file_digest(Path(profile)) for profile in import_profiles]
+            options[SOURCE_DATE_EPOCH_ENV] = os.environ.get(SOURCE_DATE_EPOCH_ENV)
+            cache_key = output_key(
+                options,
+                pip_args,
+                [Path(sp).expanduser() for sp in site_packages or ()],
+                Path(preamble) if preamble else None,
+                precompile_pythons,
+            )
+            cached = cache.get(cache_key) if cache_key is not None else None
+
+            if cached is not None:
+                copy_file(cached, target)
+
+        if cached is not None:
+            if cache_report:
+                click.echo(f"Output cache hit: {cache_key}")
+
+            write_reports(report, compression_report, timings, build_report)
+            return
+
+    wheels: List[Wheel] = []
+    extra_files: List[builder.SourceFile] = []
+
+    with ExitStack() as stack:
+        tmp_site_packages = stack.enter_context(TemporaryDirectory())
+        tmp_bytecode = stack.enter_context(TemporaryDirectory())
+        tmp_stripped = stack.enter_context(TemporaryDirectory())
 
         # If both site_packages and pip_args are present, we need to copy the site_packages
         # dir into our staging area (tmp_site_packages) as pip may modify the contents.
         if site_packages:
-            if pip_args:
-                for sp in site_packages:
-                    copytree(Path(sp), Path(tmp_site_packages))
+            if pip_args and not direct_wheels:
+                with report.phase("copytree") as stats:
+                    for sp in site_packages:
+                        stats.files += sum(
+                            copytree(Path(sp), Path(tmp_site_packages), build_workers, preserve_symlinks).values()
+                        )
             else:
                 sources.extend([Path(p).expanduser() for p in site_packages])
 
-        if pip_args:
-            # Install dependencies into staged site-packages.
-            pip.install(["--target", tmp_site_packages] + list(pip_args))
+        if pip_args and direct_wheels:
+            # Read the wheels pip resolves to straight into the zipapp, without installing them.
+            with report.phase("pip") as stats:
+                resolved = pip.resolve(list(pip_args))
+
+                if resolved is None:
+                    sys.exit(PIP_INSTALL_ERROR)
+
+                for distribution in resolved:
+                    url = distribution["download_info"]["url"]
+                    path = pip.local_path(url)
+
+                    if path is None or path.suffix != ".whl":
+                        sys.exit(DIRECT_WHEELS_ERROR.format(url=url))
+
+                    # pip records how requirements given as urls were installed
+                    direct_url = json.dumps(distribution["download_info"], sort_keys=True)
+
+                    wheels.append(
+                        Wheel(
+                            path,
+                            requested=distribution.get("requested", False),
+                            direct_url=direct_url if distribution.get("is_direct") else None,
+                        )
+                    )
+                    stack.callback(wheels[-1].close)
+
+                extra_files = wheel_files(wheels)
+                stats.files += len(extra_files)
+
+        elif pip_args:
+            # Install dependencies into staged site-packages. Their bytecode is never used, so it isn't compiled.
+            with report.phase("pip") as stats:
+                cached = pip.cached_install(list(pip_args), Path(install_cache).expanduser()) if install_cache else None
+
+                if cached is not None:
+                    upgrade = "-U" in pip_args or "--upgrade" in pip_args
+                    stats.files += sum(stage_install(cached, Path(tmp_site_packages), upgrade, build_workers).values())
+                else:
+                    pip.install(["--target", tmp_site_packages, "--no-compile"] + list(pip_args))
 
         if preamble:
             bin_dir = Path(tmp_site_packages, "bin")
             bin_dir.mkdir(exist_ok=True)
-            shutil.copy(Path(preamble).absolute(), bin_dir / Path(preamble).name)
 
-        sources.append(Path(tmp_site_packages).absolute())
+            # the staged site-packages may be hardlinked to the user's, so never write to its files in place
+            with suppress(FileNotFoundError):
+                (bin_dir / Path(preamble).name).unlink()
 
-        if no_modify:
-            # if no_modify is specified, we need to build a map of source files and their
-            # sha256 hashes, to be checked at runtime:
-            hashes = {}
+            shutil.copy(Path(preamble).absolute(), bin_dir / Path(preamble).name)
 
-            for source in sources:
-                for path in source.rglob("**/*.py"):
-                    hashes[str(path.relative_to(source))] = hashlib.sha256(path.read_bytes()).hexdigest()
+        sources.append(Path(tmp_site_packages).absolute())
 
         # if entry_point is a console script, get the callable and null out the console_script variable
         # so that we avoid modifying sys.argv in bootstrap.py
         if entry_point is None and console_script is not None:
+            scripts = ConsoleScriptIndex.build(sources, wheels, extra_files)
+
+            for name, definitions in sorted(scripts.conflicts.items()):
+                click.secho(
+                    f"Warning! The console script '{name}' is defined differently by "
+                    f"{', '.join(script.origin for script in definitions)}, using {definitions[-1].entry_point}.",
+                    fg="yellow",
+                )
+
             try:
-                entry_point = find_entry_point(sources, console_script)
+                entry_point = scripts.entry_points[console_script]
             except KeyError:
-                if not console_script_exists(sources, console_script):
+                if not scripts.exists(console_script):
                     sys.exit(NO_ENTRY_POINT.format(entry_point=console_script))
             else:
                 console_script = None
 
+        pruning = PruningPolicy(
+            exclude_globs,
+            include_globs,
+            prune_presets,
+            profile=read_profiles(import_profiles) if import_profiles else None,
+        )
+
+        if tree_shake:
+            with report.phase("tree-shaking"):
+                files = [file for source in sources for file in builder.walk(source)] + extra_files
+                roots: Dict[str, str] = {}
+
+                if entry_point is not None:
+                    roots[entry_point.split(":", 1)[0].split(".", 1)[0]] = f"entry point {entry_point}"
+
+                # the console script (if it isn't a known entry point) and the preamble are scripts in bin
+                scripts_by_name = {file.name: file for file in files if file.name.startswith("bin/")}
+
+                for script in (console_script, Path(preamble).name if preamble else None):
+                    if f"bin/{script}" in scripts_by_name:
+                        with scripts_by_name[f"bin/{script}"].open() as f:
+                            imported = find_imports(f.read())
+
+                        roots.update((module, f"imported by bin/{script}") for module in sorted(imported))
+
+                shaken = shake(files, roots, keep_globs, scan=lambda name: pruning.excluded_by(name) is None)
+                pruning.top_level.update(shaken.dropped)
+
+            for line in shaken.lines():
+                click.echo(f"Left out {line}")
+
+        if strip_debug:
+            with report.phase("strip-debug") as stats:
+                files = [file for source in sources for file in builder.walk(source)] + extra_files
+                stripped = strip.strip_debug(
+                    [file for file in files if pruning.excluded_by(file.name) is None],
+                    Path(tmp_stripped),
+                    keep_debug_globs,
+                    workers=build_workers,
+                )
+
+                for file in stripped:
+                    report.record_stripped(file.size, file.stripped_size)
+
+                stats.files += len(stripped)
+
+            click.echo(
+                f"Stripped debug information from {report.stripped.files} native extensions, "
+                f"saving {report.stripped.saved} bytes"
+            )
+
+        for precompile_python in precompile_pythons:
+            with report.phase("bytecode"):
+                compile_bytecode(
+                    sources,
+                    Path(tmp_bytecode),
+                    precompile_python,
+                    optimize=optimize_levels or (0,),
+                    legacy=sourceless,
+                    workers=build_workers or builder.default_workers(),
+                )
+
         # Some projects need reproducible artifacts, so they can use SOURCE_DATE_EPOCH
         # environment variable to specify the timestamps in the zipapp.
         timestamp = int(
@@ -259,21 +838,55 @@ def main(
             reproducible=reproducible,
             preamble=Path(preamble).name if preamble else None,
             root=root,
+            app_layer=list(app_layer) or None,
         )
 
-        if no_modify:
-            env.hashes = hashes
+        policy = CompressionPolicy(
+            method=COMPRESSION_METHODS[compression_method] if compressed else ZIP_STORED,
+            level=compression_level,
+            store=store_globs,
+            compress=compress_globs,
+            store_ratio=store_ratio,
+        )
 
         # create the zip
         builder.create_archive(
             sources,
-            target=Path(output_file).expanduser(),
+            target=click.get_current_context().meta[OUTPUT_STREAM] if output_file == STDOUT else target,
             interpreter=python or DEFAULT_SHEBANG,
             main="_bootstrap:bootstrap",
             env=env,
-            compressed=compressed,
+            workers=build_workers,
+            reuse_from=Path(reuse_from).expanduser() if reuse_from else None,
+            policy=policy,
+            bytecode=Path(tmp_bytecode) if precompile_pythons else None,
+            sourceless=sourceless,
+            report=report,
+            extra_files=extra_files,
+            deduplicate=deduplicate,
+            hash_algorithm=hash_algorithm,
+            preserve_symlinks=preserve_symlinks,
+            pruning=pruning,
+            stripped=Path(tmp_stripped) if strip_debug else None,
         )
 
+    if import_profiles:
+        # what is never extracted is what extraction time is saved on
+        left_out = report.pruned.get("import-profile", PrunedStats())
+        click.echo(
+            f"Import profile: left out {left_out.files} files ({left_out.bytes} bytes) "
+            "that are never extracted or compiled at runtime"
+        )
+
+    if cache is not None and cache_key is not None:
+        with report.phase("output-cache"):
+            cache.put(cache_key, target)
+
+    if cache_report and cache is not None:
+        click.echo(f"Output cache miss: {cache_key}" if cache_key is not None else "Output cache: build not cacheable")
+
+    write_reports(report, compression_report, timings, build_report)
+
 
 if __name__ == "__main__":  # pragma: no cover
     main()
@@ -0,0 +1,187 @@
+"""
+This module decides how each entry of a zipapp is compressed, and keeps track of what that decision cost or saved.
+"""
+import zipfile
+
+from fnmatch import fnmatchcase
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+# The compression methods supported by zipfile (and therefore by zipimport and shiv's bootstrap).
+COMPRESSION_METHODS: Dict[str, int] = {
+    "deflate": zipfile.ZIP_DEFLATED,
+    "bzip2": zipfile.ZIP_BZIP2,
+    "lzma": zipfile.ZIP_LZMA,
+}
+
+# Names of the rules reported by a CompressionReport.
+DEFAULT_RULE = "default"
+INCOMPRESSIBLE_RULE = "incompressible"
+REUSED_RULE = "reused"
+DEDUPLICATED_RULE = "deduplicated"
+
+
+def compress(data: bytes, compression: int, level: Optional[int] = None) -> bytes:
+    """Compress a bytestring exactly the way ZipFile.writestr would.
+
+    :param data: The uncompressed contents of an archive entry.
+    :param compression: The zipfile compression constant to use.
+    :param level: The compression level, or None for the method's default.
+    """
+    if compression == zipfile.ZIP_STORED:
+        return data
+
+    # zlib, bz2 and lzma all release the GIL while compressing, so this parallelizes nicely across threads.
+    compressor = zipfile._get_compressor(compression, level)  # type: ignore
+    return compressor.compress(data) + compressor.flush()
+
+
+class Decision(NamedTuple):
+    """How a single archive entry should be compressed."""
+
+    compression: int
+    level: Optional[int]
+    rule: str
+
+
+class CompressionPolicy:
+    """Decides how each entry of an archive is compressed.
+
+    Entries matching one of the ``compress`` globs are always compressed, entries matching one of the ``store``
+    globs are always stored. Everything else is compressed using ``method``, unless ``store_ratio`` is set and
+    compressing an entry doesn't shrink it below that fraction of its original size, in which case it is stored
+    as well (which costs a few bytes, but saves decompressing it every time it is read).
+
+    Globs are matched against the path of the entry inside the archive, ``*`` matches across directories.
+
+    :param method: The zipfile compression constant to use by default.
+    :param level: The compression level, or None for the method's default.
+    :param store: Globs of entries that should be stored without compression.
+    :param compress: Globs of entries that should be compressed no matter what.
+    :param store_ratio: Store entries whose compressed size is above this fraction of their original size.
+    """
+
+    def __init__(
+        self,
+        method: int = zipfile.ZIP_DEFLATED,
+        level: Optional[int] = None,
+        store: Sequence[str] = (),
+        compress: Sequence[str] = (),
+        store_ratio: Optional[float] = None,
+    ) -> None:
+        self.method = method
+        self.level = level
+        self.store = list(store)
+        self.compress = list(compress)
+        self.store_ratio = store_ratio
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The settings of this policy, as recorded in the manifest of the archives it compressed."""
+        return {
+            "method": self.method,
+            "level": self.level,
+            "store": self.store,
+            "compress": self.compress,
+            "store_ratio": self.store_ratio,
+        }
+
+    @property
+    def default(self) -> Decision:
+        """The decision for entries that no rule applies to."""
+        return Decision(self.method, self.level if self.method != zipfile.ZIP_STORED else None, DEFAULT_RULE)
+
+    def decide(self, arcname: str) -> Decision:
+        """Decide how to compress an entry, based on its name alone."""
+        for pattern in self.compress:
+            if fnmatchcase(arcname, pattern):
+                method = self.method if self.method != zipfile.ZIP_STORED else zipfile.ZIP_DEFLATED
+                return Decision(method, self.level, f"compress:{pattern}")
+
+        for pattern in self.store:
+            if fnmatchcase(arcname, pattern):
+                return Decision(zipfile.ZIP_STORED, None, f"store:{pattern}")
+
+        return self.default
+
+    def may_store(self, decision: Decision) -> bool:
+        """Return True if an entry compressed according to ``decision`` may still be stored, if it's incompressible."""
+        return (
+            self.store_ratio is not None
+            and decision.rule == DEFAULT_RULE
+            and decision.compression != zipfile.ZIP_STORED
+        )
+
+    def is_incompressible(self, decision: Decision, size: int, compressed_size: int) -> bool:
+        """Return True if an entry compressed according to ``decision`` should rather be stored."""
+        if self.store_ratio is None or not self.may_store(decision):
+            return False
+
+        return compressed_size > size * self.store_ratio
+
+    def apply(self, arcname: str, data: bytes) -> Tuple[Decision, bytes]:
+        """Compress an entry according to this policy, returning the decision that was made and the payload."""
+        decision = self.decide(arcname)
+        payload = compress(data, decision.compression, decision.level)
+
+        if self.is_incompressible(decision, len(data), len(payload)):
+            return Decision(zipfile.ZIP_STORED, None, INCOMPRESSIBLE_RULE), data
+
+        return decision, payload
+
+
+class RuleStats:
+    """Totals for all the entries a single compression rule applied to."""
+
+    def __init__(self) -> None:
+        self.entries = 0
+        self.size = 0
+        self.compressed_size = 0
+        self.seconds = 0.0
+
+
+class CompressionReport:
+    """Collects statistics about the decisions of a CompressionPolicy during a build."""
+
+    def __init__(self) -> None:
+        self.rules: Dict[str, RuleStats] = {}
+
+    def record(self, rule: str, size: int, compressed_size: int, seconds: float = 0.0) -> None:
+        stats = self.rules.setdefault(rule, RuleStats())
+        stats.entries += 1
+        stats.size += size
+        stats.compressed_size += compressed_size
+        stats.seconds += seconds
+
+    @property
+    def throughput(self) -> Optional[float]:
+        """How many bytes per second were compressed during this build."""
+        size = sum(stats.size for stats in self.rules.values() if stats.size != stats.compressed_size)
+        seconds = sum(stats.seconds for stats in self.rules.values() if stats.size != stats.compressed_size)
+        return size / seconds if size and seconds else None
+
+    def lines(self) -> List[str]:
+        """A human readable summary of this report."""
+        lines = []
+        throughput = self.throughput
+
+        for rule, stats in sorted(self.rules.items()):
+            line = (
+                f"{rule}: {stats.entries} entries, {stats.size} bytes -> {stats.compressed_size} bytes "
+                f"in {stats.seconds:.2f}s"
+            )
+
+            if rule.startswith("store:") and throughput:
+                line += f" (saved ~{stats.size / throughput:.2f}s of compression)"
+
+            elif rule == INCOMPRESSIBLE_RULE:
+                line += " (stored, they did not compress past the threshold)"
+
+            elif rule == REUSED_RULE and throughput:
+                line += f" (saved ~{stats.size / throughput:.2f}s of compression)"
+
+            lines.append(line)
+
+        total_size = sum(stats.size for stats in self.rules.values())
+        total_compressed = sum(stats.compressed_size for stats in self.rules.values())
+        lines.append(f"total: {total_size} bytes -> {total_compressed} bytes")
+
+        return lines
@@ -7,6 +7,16 @@ NO_PIP_ARGS_OR_SITE_PACKAGES = "\nYou must supply PIP ARGS or --site-packages!\n
 NO_OUTFILE = "\nYou must provide an output file option! (--output-file/-o)\n"
 NO_ENTRY_POINT = "\nNo entry point '{entry_point}' found in console_scripts or the bin dir!\n"
 BINPRM_ERROR = "\nShebang is too long, it would exceed BINPRM_BUF_SIZE! Consider /usr/bin/env\n"
+BYTECODE_COMPILE_ERROR = "\nCompiling bytecode with '{python}' failed!\n"
+DIRECT_WHEELS_ERROR = (
+    "\n--direct-wheels requires every requirement to resolve to a local wheel "
+    "(e.g. with --no-index --find-links), not '{url}'!\n"
+)
+DIRECT_WHEELS_PRECOMPILE_ERROR = "\n--direct-wheels can't be combined with --precompile!\n"
+STRIP_DEBUG_ERROR = "\nCould not run '{strip}' to strip debug information (is binutils installed?)!\n"
+TREE_SHAKE_ERROR = "\n--tree-shake requires an entry point (--entry-point or --console-script)!\n"
+NOT_A_SHIV_PYZ_ERROR = "\n'{pyz}' is not a zipapp created by shiv (it has no environment.json)!\n"
+SOURCELESS_ERROR = "\n--sourceless requires exactly one --precompile interpreter and one --optimize level!\n"
 
 # pip
 PIP_INSTALL_ERROR = "\nPip install failed!\n"
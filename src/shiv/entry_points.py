@@ -0,0 +1,117 @@
+"""
+This module indexes the console scripts of the distributions in one or more site-packages directories.
+
+Only the metadata of installed distributions is read (``entry_points.txt`` in top-level ``*.dist-info`` and
+``*.egg-info`` directories), rather than every ``entry_points.txt`` file that happens to be in the tree.
+"""
+import os
+
+from configparser import ConfigParser, Error
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Sequence, Set
+
+from .builder import SourceFile
+from .wheel import Wheel, strip_extras
+
+METADATA_SUFFIXES = (".dist-info", ".egg-info")
+
+
+class ConsoleScript(NamedTuple):
+    name: str
+    # the import string of the script's callable, e.g. "package.module:main"
+    entry_point: str
+    # where the script was defined, e.g. "package-1.0.dist-info"
+    origin: str
+
+
+def parse_console_scripts(text: str, origin: str) -> List[ConsoleScript]:
+    """Parse the console scripts of an ``entry_points.txt`` file, ignoring malformed files."""
+    # entry points are case sensitive and may contain '%', so neither lowercasing keys nor interpolation is wanted
+    config_parser = ConfigParser(interpolation=None, strict=False)
+    config_parser.optionxform = str  # type: ignore
+
+    try:
+        config_parser.read_string(text)
+    except Error:
+        return []
+
+    if not config_parser.has_section("console_scripts"):
+        return []
+
+    return [
+        ConsoleScript(name, strip_extras(value), origin) for name, value in config_parser["console_scripts"].items()
+    ]
+
+
+class ConsoleScriptIndex:
+    """All the console scripts defined by the distributions in a set of site-packages directories.
+
+    When several distributions define the same script, the last one wins (as it would once they are installed
+    in the same directory). Scripts defined differently by several distributions are reported as ``conflicts``.
+    """
+
+    def __init__(self) -> None:
+        self.definitions: Dict[str, List[ConsoleScript]] = {}
+        # the names of the files in the bin directories
+        self.bin_scripts: Set[str] = set()
+
+    def add(self, script: ConsoleScript) -> None:
+        self.definitions.setdefault(script.name, []).append(script)
+
+    @classmethod
+    def build(
+        cls, site_packages_dirs: Sequence[Path], wheels: Sequence[Wheel] = (), files: Sequence[SourceFile] = ()
+    ) -> "ConsoleScriptIndex":
+        """Index the console scripts of site-packages directories, wheels and files that aren't on disk yet.
+
+        :param site_packages_dirs: Paths to site-packages directories on disk.
+        :param wheels: Wheels that will be added to site-packages.
+        :param files: Files that will be added to site-packages (e.g. the members of ``wheels``).
+        """
+        index = cls()
+
+        for site_packages in site_packages_dirs:
+            if not site_packages.is_dir():
+                continue
+
+            with os.scandir(site_packages) as it:
+                metadata_dirs = sorted(entry.name for entry in it if entry.name.endswith(METADATA_SUFFIXES))
+
+            for name in metadata_dirs:
+                try:
+                    text = (site_packages / name / "entry_points.txt").read_text(encoding="utf-8")
+                except (OSError, UnicodeDecodeError):
+                    # egg-info can be a single file, most distributions have no entry points at all
+                    continue
+
+                for script in parse_console_scripts(text, name):
+                    index.add(script)
+
+            if (site_packages / "bin").is_dir():
+                index.bin_scripts.update(os.listdir(site_packages / "bin"))
+
+        for wheel in wheels:
+            for script in parse_console_scripts(wheel.entry_points_text(), wheel.dist_info):
+                index.add(script)
+
+        index.bin_scripts.update(file.name.split("/", 1)[1] for file in files if file.name.startswith("bin/"))
+
+        return index
+
+    @property
+    def entry_points(self) -> Dict[str, str]:
+        """The entry point of each console script."""
+        return {name: definitions[-1].entry_point for name, definitions in self.definitions.items()}
+
+    @property
+    def conflicts(self) -> Dict[str, List[ConsoleScript]]:
+        """Console scripts that several distributions define differently."""
+        return {
+            name: definitions
+            for name, definitions in self.definitions.items()
+            if len({script.entry_point for script in definitions}) > 1
+        }
+
+    def exists(self, console_script: str) -> bool:
+        """Return true if a script with this name exists in the bin directory."""
+        return console_script in self.bin_scripts
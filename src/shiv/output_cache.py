@@ -0,0 +1,112 @@
+"""
+This module caches finished zipapps, keyed by everything that goes into building them.
+
+When the inputs of a build (its options, the distributions its requirements resolve to, the contents of its
+site-packages directories...) are identical to those of a cached build, the cached zipapp can be copied into
+place instead of building it again.
+"""
+import hashlib
+import json
+import os
+import shutil
+import sys
+import sysconfig
+import uuid
+
+from pathlib import Path
+from stat import S_IMODE
+from typing import Any, Dict, Optional, Sequence
+
+from . import __version__, pip
+from .pip import file_digest
+from .builder import walk
+from .wheel import current_umask
+
+
+def tree_digest(path: Path) -> str:
+    """Hash the relative paths, permissions and contents of every file below ``path``."""
+    tree_hash = hashlib.sha256()
+
+    for file in walk(path):
+        tree_hash.update(f"{file.name}\0{S_IMODE(file.stat.st_mode):o}\0{file_digest(Path(file.path))}\n".encode())
+
+    return tree_hash.hexdigest()
+
+
+def interpreter_digest(python: str) -> str:
+    """Identify an interpreter by its path, size and modification time (upgrading it changes the last two)."""
+    path = shutil.which(python)
+
+    if path is None:
+        return python
+
+    stat = os.stat(path)
+    return f"{os.path.realpath(path)}\0{stat.st_size}\0{stat.st_mtime_ns}"
+
+
+def output_key(
+    options: Dict[str, Any],
+    pip_args: Sequence[str],
+    site_packages: Sequence[Path] = (),
+    preamble: Optional[Path] = None,
+    precompile_pythons: Sequence[str] = (),
+) -> Optional[str]:
+    """Compute the key of a build from its inputs.
+
+    Returns None if the build can't be cached, i.e. when pip can't tell which distributions ``pip_args`` resolve to,
+    or a distribution comes from a remote archive without a hash.
+
+    :param options: Every option that affects the contents of the zipapp, must be serializable to json.
+    :param pip_args: The arguments to pip install.
+    :param site_packages: Site-packages directories to include, they are hashed by contents.
+    :param preamble: A preamble script, hashed by contents.
+    :param precompile_pythons: Interpreters to compile bytecode with.
+    """
+    inputs: Dict[str, Any] = {
+        "shiv_version": __version__,
+        # pip resolves (and writes scripts) for the interpreter running shiv, and applies the umask to what it installs
+        "python": [sys.executable, sys.version, sysconfig.get_platform()],
+        "umask": current_umask(),
+        "options": options,
+        "site_packages": [tree_digest(path) for path in site_packages],
+        "preamble": file_digest(preamble) if preamble is not None else None,
+        "precompile": [interpreter_digest(python) for python in precompile_pythons],
+        "requirements": None,
+    }
+
+    if pip_args:
+        resolved = pip.resolve(list(pip_args))
+        inputs["requirements"] = pip.install_key(resolved, tree_digest) if resolved is not None else None
+
+        if inputs["requirements"] is None:
+            return None
+
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+
+class OutputCache:
+    """A directory of finished zipapps, named after the keys of their builds.
+
+    :param directory: The directory to store zipapps in.
+    """
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+
+    def get(self, key: str) -> Optional[Path]:
+        """Return the cached zipapp for ``key``, if there is one."""
+        path = self.directory / f"{key}.pyz"
+        return path if path.exists() else None
+
+    def put(self, key: str, zipapp: Path) -> None:
+        """Copy a freshly built zipapp into the cache."""
+        # copy next to the entry and rename it into place, so concurrent builds never see a partial zipapp
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.directory / f".{key}.{uuid.uuid4().hex}"
+
+        try:
+            shutil.copy2(zipapp, tmp_path)
+            os.replace(tmp_path, self.directory / f"{key}.pyz")
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
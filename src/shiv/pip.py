@@ -1,13 +1,22 @@
 import contextlib
+import hashlib
+import json
 import os
+import shutil
 import subprocess
 import sys
+import sysconfig
+import uuid
 
-from typing import Generator, List
+from pathlib import Path
+from typing import Any, Callable, Dict, Generator, List, Optional
+from urllib.parse import urlparse
+from urllib.request import url2pathname
 
 import click
 
 from .bootstrap import extend_python_path, get_first_sitedir_index
+from .builder import read_chunks
 from .constants import PIP_INSTALL_ERROR, PIP_REQUIRE_VIRTUALENV
 
 
@@ -45,19 +54,11 @@ def install(args: List[str]) -> None:
     """
 
     with clean_pip_env():
-
-        # if being invoked as a pyz, we must ensure we have access to our own
-        # site-packages when subprocessing since there is no guarantee that pip
-        # will be available
-        subprocess_env = os.environ.copy()
-        sitedir_index = get_first_sitedir_index()
-        extend_python_path(subprocess_env, sys.path[sitedir_index:])
-
         process = subprocess.Popen(
             [sys.executable, "-m", "pip", "--disable-pip-version-check", "install", *args],
             stdout=subprocess.PIPE,
             stderr=subprocess.STDOUT,
-            env=subprocess_env,
+            env=_pip_env(),
             universal_newlines=True,
         )
 
@@ -67,3 +68,146 @@ def install(args: List[str]) -> None:
 
     if process.wait() > 0:
         sys.exit(PIP_INSTALL_ERROR)
+
+
+def _pip_env() -> Dict[str, str]:
+    # if being invoked as a pyz, we must ensure we have access to our own
+    # site-packages when subprocessing since there is no guarantee that pip
+    # will be available
+    subprocess_env = os.environ.copy()
+    sitedir_index = get_first_sitedir_index()
+    extend_python_path(subprocess_env, sys.path[sitedir_index:])
+    return subprocess_env
+
+
+def resolve(args: List[str]) -> Optional[List[Dict[str, Any]]]:
+    """Ask pip which distributions installing ``args`` would install, without installing anything.
+
+    Returns the ``install`` section of pip's `installation report
+    <https://pip.pypa.io/en/stable/reference/installation-report/>`_, or None if pip can't produce one
+    (e.g. because it is older than 22.2).
+    """
+    with clean_pip_env():
+        process = subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "pip",
+                "--disable-pip-version-check",
+                "install",
+                "--dry-run",
+                "--ignore-installed",
+                "--quiet",
+                "--report",
+                "-",
+                *args,
+            ],
+            stdout=subprocess.PIPE,
+            env=_pip_env(),
+            universal_newlines=True,
+        )
+
+    if process.returncode:
+        return None
+
+    try:
+        return json.loads(process.stdout)["install"]
+    except (ValueError, KeyError):
+        return None
+
+
+def local_path(url: str) -> Optional[Path]:
+    """Return the path a ``file:`` url points to, or None for any other url."""
+    parsed = urlparse(url)
+    return Path(url2pathname(parsed.path)) if parsed.scheme == "file" else None
+
+
+def file_digest(path: Path) -> str:
+    """Hash the contents of a file."""
+    file_hash = hashlib.sha256()
+
+    for chunk in read_chunks(path):
+        file_hash.update(chunk)
+
+    return file_hash.hexdigest()
+
+
+def install_key(
+    resolved: List[Dict[str, Any]], directory_digest: Optional[Callable[[Path], str]] = None
+) -> Optional[str]:
+    """Compute the key of an install from the distributions it resolved to and the running interpreter.
+
+    Returns None if the install can't be cached, i.e. when a distribution comes from a local directory
+    (whose contents can change without its version changing), unless ``directory_digest`` is given
+    to hash the contents of such directories.
+    """
+    interpreter = f"{sys.implementation.cache_tag}\0{sysconfig.get_platform()}\0{sys.version}\n"
+    install_hash = hashlib.sha256(interpreter.encode())
+    distributions = []
+
+    for item in resolved:
+        info = item["download_info"]
+
+        if "archive_info" in info:
+            hashes = info["archive_info"].get("hashes")
+
+            if hashes:
+                algorithm = "sha256" if "sha256" in hashes else min(hashes)
+                digest = f"{algorithm}={hashes[algorithm]}"
+            elif local_path(info["url"]) is not None:
+                digest = f"sha256={file_digest(local_path(info['url']))}"  # type: ignore
+            else:
+                return None
+
+        elif "vcs_info" in info:
+            digest = info["vcs_info"]["commit_id"]
+
+        elif directory_digest is not None and local_path(info["url"]) is not None:
+            digest = directory_digest(local_path(info["url"]))  # type: ignore
+
+        else:
+            return None
+
+        metadata = item["metadata"]
+        distributions.append(f"{metadata['name']}\0{metadata['version']}\0{info['url']}\0{digest}\n")
+
+    for distribution in sorted(distributions):
+        install_hash.update(distribution.encode())
+
+    return install_hash.hexdigest()
+
+
+def cached_install(args: List[str], cache: Path) -> Optional[Path]:
+    """Install ``args`` into an install cache, unless an identical install is already there.
+
+    The cache is keyed by the exact set of distributions pip resolves ``args`` to and the interpreter, so a cache
+    hit doesn't run pip install at all. Returns the cached site-packages directory, or None if the install can't be
+    cached (in which case it's up to the caller to install ``args`` with :func:`install`).
+    """
+    resolved = resolve(args)
+    key = install_key(resolved) if resolved is not None else None
+
+    if key is None:
+        return None
+
+    entry = cache / key
+
+    if entry.exists():
+        click.echo(f"Using cached install {key}")
+        return entry
+
+    # install next to the entry and rename it into place, so concurrent builds never see a partial install
+    cache.mkdir(parents=True, exist_ok=True)
+    tmp_entry = cache / f".{key}.{uuid.uuid4().hex}"
+
+    try:
+        install(["--target", str(tmp_entry), "--no-compile", *args])
+        tmp_entry.rename(entry)
+    except OSError:
+        # another build populated the same entry first
+        if not entry.exists():
+            raise
+    finally:
+        shutil.rmtree(str(tmp_entry), ignore_errors=True)
+
+    return entry
@@ -0,0 +1,123 @@
+"""
+This module decides which site-packages files are left out of a zipapp altogether.
+"""
+from fnmatch import fnmatchcase
+from typing import Collection, Dict, Optional, Sequence, Tuple
+
+# Built-in sets of globs, for the kinds of files applications usually don't need at runtime.
+PRESETS: Dict[str, Tuple[str, ...]] = {
+    "strip-tests": ("tests/*", "*/tests/*", "test/*", "*/test/*", "*/conftest.py"),
+    "strip-stubs": ("*.pyi", "*-stubs/*"),
+    "strip-docs": ("*/docs/*", "*/doc/*", "*/examples/*"),
+    "strip-record": ("*.dist-info/RECORD",),
+}
+
+# The names of shared objects, e.g. extension modules and the libraries auditwheel vendors (libfoo-1a2b3c.so.1.2).
+SHARED_OBJECT_GLOBS = ("*.so", "*.so.*")
+
+
+def is_shared_object_name(name: str) -> bool:
+    """Return true if a site-packages file is named like a shared object."""
+    return any(fnmatchcase(name.rpartition("/")[2], pattern) for pattern in SHARED_OBJECT_GLOBS)
+
+
+def source_of(name: str) -> str:
+    """Return the source a bytecode file (e.g. ``package/__pycache__/module.cpython-311.pyc``) was compiled from,
+    or ``name`` itself if it isn't cached bytecode."""
+    directory, _, filename = name.rpartition("/")
+    parent, _, cache = directory.rpartition("/")
+
+    if cache != "__pycache__" or not filename.endswith(".pyc"):
+        return name
+
+    source = f"{filename.split('.', 1)[0]}.py"
+    return f"{parent}/{source}" if parent else source
+
+
+class PruningPolicy:
+    """Decides which site-packages files are excluded from an archive.
+
+    Files matching one of the ``exclude`` globs or one of the globs of the ``presets``, and files below one of the
+    ``top_level`` names (e.g. the packages tree shaking found to be unreachable, see :mod:`shiv.tree_shaking`) are
+    excluded, unless they match one of the ``include`` globs.
+
+    Given a ``profile`` (the files recorded as used at runtime, see :mod:`shiv.bootstrap.import_profile`), every
+    other file is excluded as well, except for scripts and ``.pth`` files. The bytecode of a recorded module is kept
+    along with it, and so are the shared objects a recorded extension module may load (see ``vendored``).
+
+    Globs are matched against the path of the file relative to site-packages, ``*`` matches across directories.
+
+    :param exclude: Globs of files to exclude.
+    :param include: Globs of files to keep no matter what.
+    :param presets: Names of built-in sets of globs to exclude (see ``PRESETS``).
+    :param top_level: Top-level files or directories of site-packages to exclude entirely.
+    :param profile: Optional, the only files to keep (besides those matching ``include``).
+    """
+
+    def __init__(
+        self,
+        exclude: Sequence[str] = (),
+        include: Sequence[str] = (),
+        presets: Sequence[str] = (),
+        top_level: Sequence[str] = (),
+        profile: Optional[Collection[str]] = None,
+    ) -> None:
+        self.exclude = list(exclude)
+        self.include = list(include)
+        self.presets = list(presets)
+        self.top_level = set(top_level)
+        self.profile = profile
+        # the directories of the shared objects (e.g. extension modules) the profile recorded
+        self.extension_dirs = {name.rpartition("/")[0] for name in profile or () if is_shared_object_name(name)}
+
+    def excluded_by(self, name: str) -> Optional[str]:
+        """Return the name of the rule excluding a file (a preset, ``exclude:<glob>``, ``tree-shaking:<name>`` or
+        ``import-profile``), or None to keep it."""
+        if any(fnmatchcase(name, pattern) for pattern in self.include):
+            return None
+
+        top_level = name.split("/", 1)[0]
+
+        if top_level in self.top_level:
+            return f"tree-shaking:{top_level}"
+
+        if self.profile is not None and not self.recorded(name):
+            return "import-profile"
+
+        for preset in self.presets:
+            if any(fnmatchcase(name, pattern) for pattern in PRESETS[preset]):
+                return preset
+
+        for pattern in self.exclude:
+            if fnmatchcase(name, pattern):
+                return f"exclude:{pattern}"
+
+        return None
+
+    def recorded(self, name: str) -> bool:
+        """Return true if the profile recorded a file (or the module it is the bytecode of) as used."""
+        if name.startswith("bin/") or ("/" not in name and name.endswith(".pth")):
+            return True
+
+        profile = self.profile or ()
+        return name in profile or source_of(name) in profile or self.vendored(name)
+
+    def vendored(self, name: str) -> bool:
+        """Return true if a shared object may be loaded by an extension module the profile recorded, by the dynamic
+        loader rather than by Python: it is next to one, or in a ``*.libs`` directory (where auditwheel vendors
+        libraries, e.g. ``pkg.libs`` or ``pkg/.libs``) of a package with one."""
+        if not is_shared_object_name(name):
+            return False
+
+        directory = name.rpartition("/")[0]
+
+        if directory in self.extension_dirs:
+            return True
+
+        parent, _, libs = directory.rpartition("/")
+
+        if not libs.endswith(".libs"):
+            return False
+
+        package = "/".join(part for part in (parent, libs.rpartition(".libs")[0]) if part)
+        return any(path == package or path.startswith(f"{package}/") for path in self.extension_dirs)
@@ -0,0 +1,367 @@
+"""
+This module repacks an existing pyz without rebuilding it: the site-packages files of the pyz are read straight
+from it and written to a new archive, e.g. with a different compression policy, without the files of a pruning
+preset, with bytecode precompiled at build time or with a different application layer.
+
+Entries whose compression doesn't change are copied as they are, without decompressing them (see
+:class:`shiv.builder.PreviousArchive`). Everything derived from the contents of site-packages (the manifest, the
+build id, the layer ids and the hashes checked at runtime) is computed again from what ends up in the new archive,
+so the new pyz is never extracted over the extracted contents of the old one.
+"""
+import os
+import sys
+import zipfile
+
+from contextlib import ExitStack
+from functools import partial
+from pathlib import Path
+from stat import S_IMODE, S_ISLNK
+from tempfile import TemporaryDirectory
+from typing import IO, List, Optional, Sequence, Set, Union
+
+import click
+
+from . import __version__
+from . import builder
+from .bootstrap.environment import Environment
+from .bootstrap.import_profile import read_profiles
+from .bootstrap.manifest import HASH_ALGORITHMS, Manifest
+from .bytecode import compile_bytecode
+from .cli import write_reports
+from .compression import COMPRESSION_METHODS, REUSED_RULE, CompressionPolicy
+from .constants import DEFAULT_SHEBANG, NOT_A_SHIV_PYZ_ERROR, SOURCELESS_ERROR
+from .pruning import PRESETS, PruningPolicy
+from .report import BuildReport
+
+# The directory of a pyz site-packages files are stored in.
+SITE_PACKAGES = "site-packages/"
+
+
+def read_interpreter(path: Path) -> Optional[str]:
+    """Return the interpreter in the shebang of a pyz, if it has one."""
+    with path.open("rb") as f:
+        line = f.readline(builder.BINPRM_BUF_SIZE + 3)
+
+    if not line.startswith(b"#!"):
+        return None
+
+    return line[2:].rstrip(b"\r\n").decode(sys.getfilesystemencoding())
+
+
+def archive_files(
+    archive: zipfile.ZipFile, path: Path, manifest: Optional[Manifest] = None
+) -> List[builder.SourceFile]:
+    """List the site-packages files of a pyz, read from the archive when they are opened.
+
+    Given the manifest of the pyz, deduplicated files are listed as well (they are opened from the entry holding
+    their contents), with the modes the manifest recorded.
+
+    :param archive: The pyz, opened for reading.
+    :param path: The path to the pyz.
+    :param manifest: Optional, the manifest of the pyz.
+    """
+    files = []
+
+    if manifest is not None:
+        for entry in manifest:
+            # deduplicated files are read from the entry holding their contents
+            opener = partial(archive.open, SITE_PACKAGES + (entry.alias or entry.path))
+            stat = builder.file_stat(entry.mode, entry.size)
+            files.append(builder.SourceFile(entry.path.replace("/", os.sep), stat, str(path), opener))
+
+        return files
+
+    for zinfo in archive.infolist():
+        if not zinfo.filename.startswith(SITE_PACKAGES) or zinfo.is_dir():
+            continue
+
+        name = os.path.relpath(zinfo.filename, SITE_PACKAGES).replace(os.sep, "/")
+        mode = zinfo.external_attr >> 16
+        stat = builder.file_stat(mode if S_IMODE(mode) else mode | 0o644, zinfo.file_size)
+        files.append(builder.SourceFile(name.replace("/", os.sep), stat, str(path), partial(archive.open, zinfo)))
+
+    return files
+
+
+def repack(
+    source: Path,
+    target: Union[Path, IO[bytes]],
+    interpreter: Optional[str] = None,
+    policy: Optional[CompressionPolicy] = None,
+    pruning: Optional[PruningPolicy] = None,
+    precompile: Sequence[str] = (),
+    optimize: Sequence[int] = (0,),
+    sourceless: bool = False,
+    deduplicate: Optional[bool] = None,
+    app_layer: Optional[List[str]] = None,
+    build_id: Optional[str] = None,
+    hash_algorithm: Optional[str] = None,
+    workers: Optional[int] = None,
+    report: Optional[BuildReport] = None,
+) -> BuildReport:
+    """Write the contents of the pyz ``source`` to a new archive.
+
+    The bootstrap code of the new archive is that of this version of shiv, the rest of its environment (e.g. its
+    entry point and the time it was built at) is carried over. Its build id is computed from its contents again,
+    unless ``build_id`` is given.
+
+    :param source: The pyz to repack.
+    :param target: The path to write the new archive to (which may be ``source`` itself), or a stream.
+    :param interpreter: The interpreter for the shebang (default is the shebang of ``source``).
+    :param policy: How to compress entries (see :class:`shiv.compression.CompressionPolicy`).
+    :param pruning: Optional, which site-packages files to leave out (see :class:`shiv.pruning.PruningPolicy`).
+    :param precompile: Interpreters to compile bytecode with (see :func:`shiv.bytecode.compile_bytecode`).
+    :param optimize: The optimization levels to compile bytecode for.
+    :param sourceless: Whether to leave out the sources of the modules compiled to (legacy) bytecode.
+    :param deduplicate: Whether to store identical files only once (default is whether ``source`` did).
+    :param app_layer: Optional, globs of the application layer (default is the application layer of ``source``).
+    :param build_id: Optional, a custom build id.
+    :param hash_algorithm: The algorithm to hash contents with (default is the one the manifest of ``source`` uses).
+    :param workers: How many threads (and bytecode compiling processes) to use.
+    :param report: Optional, the report to add the phases of repacking to.
+    """
+    if report is None:
+        report = BuildReport()
+
+    with ExitStack() as stack:
+        archive = stack.enter_context(zipfile.ZipFile(str(source)))
+        tmp_sources = stack.enter_context(TemporaryDirectory())
+        tmp_bytecode = stack.enter_context(TemporaryDirectory())
+
+        try:
+            env = Environment.from_json(archive.read("environment.json").decode())
+        except KeyError:
+            sys.exit(NOT_A_SHIV_PYZ_ERROR.format(pyz=source))
+
+        manifest = Manifest.load(archive)
+        files = archive_files(archive, source, manifest)
+        compiled: Set[str] = set()
+
+        if app_layer is not None:
+            env.app_layer = app_layer or None
+
+        if precompile:
+            with report.phase("bytecode"):
+                # the sources to compile have to be on disk
+                for file in files:
+                    if S_ISLNK(file.stat.st_mode):
+                        continue
+
+                    if file.name.endswith(".py") and (pruning is None or pruning.excluded_by(file.name) is None):
+                        path = Path(tmp_sources, file.relpath)
+                        path.parent.mkdir(parents=True, exist_ok=True)
+                        path.write_bytes(b"".join(builder.read_chunks(file)))
+
+                for python in precompile:
+                    compile_bytecode(
+                        [Path(tmp_sources)],
+                        Path(tmp_bytecode),
+                        python,
+                        optimize=optimize,
+                        legacy=sourceless,
+                        workers=workers or builder.default_workers(),
+                    )
+
+            compiled = {file.relpath for file in builder.walk(Path(tmp_bytecode))}
+
+        # symlinks are only kept if what they point to is still extracted next to them, the others are followed
+        sourceless_sources = {relpath[:-1] for relpath in compiled if relpath.endswith(".pyc")}
+        keep_symlink = partial(
+            builder.symlink_kept, app_layer=env.app_layer, pruning=pruning, compiled=sourceless_sources
+        )
+        files = builder.follow_symlinks(files, keep_symlink)
+
+        # bytecode compiled now replaces the bytecode of the same name, and sourceless bytecode its source
+        files = [file for file in files if file.relpath not in compiled and file.relpath + "c" not in compiled]
+
+        env.shiv_version = __version__
+        env.build_id = build_id
+        env.hash_algorithm = hash_algorithm or (manifest.algorithm if manifest is not None else env.hash_algorithm)
+        env.hashes = {}
+        env.layer_ids = None
+
+        if deduplicate is None:
+            deduplicate = bool(manifest is not None and manifest.aliases())
+
+        builder.create_archive(
+            [],
+            target,
+            interpreter=interpreter or read_interpreter(source) or DEFAULT_SHEBANG,
+            main="_bootstrap:bootstrap",
+            env=env,
+            workers=workers,
+            reuse_from=source,
+            policy=policy,
+            bytecode=Path(tmp_bytecode) if precompile else None,
+            report=report,
+            extra_files=files,
+            deduplicate=deduplicate,
+            hash_algorithm=env.hash_algorithm,
+            pruning=pruning,
+        )
+
+    return report
+
+
+@click.command(context_settings=dict(help_option_names=["-h", "--help", "--halp"]))
+@click.option("--output-file", "-o", required=True, help="The path to write the repacked zipapp to.")
+@click.option("--python", "-p", help="The python interpreter to set as the shebang (default is the one of PYZ).")
+@click.option(
+    "--build-id",
+    default=None,
+    help="Use a custom build id instead of the default (a hash of the contents of the repacked zipapp).",
+)
+@click.option(
+    "--hash-algorithm",
+    type=click.Choice(HASH_ALGORITHMS),
+    default=None,
+    help="The algorithm to hash the contents of the zipapp with (default is the one PYZ was built with).",
+)
+@click.option(
+    "--app-layer",
+    multiple=True,
+    help="A top-level name in site-packages (or a glob) that is part of the application layer (default is PYZ's).",
+)
+@click.option("--compressed/--uncompressed", default=True, help="Whether or not to compress your zip.")
+@click.option(
+    "--compression-method",
+    type=click.Choice(sorted(COMPRESSION_METHODS)),
+    default="deflate",
+    help="The compression algorithm to use for compressed entries.",
+)
+@click.option(
+    "--compression-level",
+    type=click.IntRange(min=1, max=9),
+    default=None,
+    help="The compression level to use (default is the compression algorithm's default).",
+)
+@click.option("--store", "store_globs", multiple=True, help="A glob of files to store without compression.")
+@click.option("--compress", "compress_globs", multiple=True, help="A glob of files to always compress.")
+@click.option(
+    "--store-ratio",
+    type=click.FloatRange(min=0, max=1),
+    default=None,
+    help="Store files uncompressed when compressing doesn't shrink them below this fraction of their size.",
+)
+@click.option(
+    "--deduplicate/--no-deduplicate",
+    default=None,
+    help="Store files with identical contents and permissions only once (default is whether PYZ did).",
+)
+@click.option("--exclude", "exclude_globs", multiple=True, help="A glob of site-packages files to leave out.")
+@click.option(
+    "--include", "include_globs", multiple=True, help="A glob of files to keep, even if they match --exclude."
+)
+@click.option(
+    "--prune",
+    "prune_presets",
+    type=click.Choice(sorted(PRESETS)),
+    multiple=True,
+    help="A built-in set of files to leave out (e.g. strip-tests).",
+)
+@click.option(
+    "--import-profile",
+    "import_profiles",
+    type=click.Path(exists=True, dir_okay=False),
+    multiple=True,
+    help="An import profile recorded with SHIV_RECORD_IMPORTS=<path>, only the files it lists are kept.",
+)
+@click.option("--precompile", "precompile_pythons", multiple=True, help="An interpreter to compile bytecode with.")
+@click.option(
+    "--optimize",
+    "optimize_levels",
+    type=click.IntRange(min=0, max=2),
+    multiple=True,
+    help="An optimization level to precompile bytecode for (default is 0).",
+)
+@click.option("--sourceless", is_flag=True, help="Only keep the precompiled bytecode of Python modules.")
+@click.option(
+    "--build-workers",
+    type=click.IntRange(min=1),
+    default=None,
+    help="The number of threads used to compress the zipapp (default is the number of available cores).",
+)
+@click.option("--compression-report", is_flag=True, help="Print how much each compression rule saved.")
+@click.option("--timings", is_flag=True, help="Print how long each phase of repacking took.")
+@click.option(
+    "--build-report",
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help="Write a json report of repacking to this path.",
+)
+@click.argument("pyz", type=click.Path(exists=True, dir_okay=False))
+def main(
+    output_file: str,
+    python: Optional[str],
+    build_id: Optional[str],
+    hash_algorithm: Optional[str],
+    app_layer: List[str],
+    compressed: bool,
+    compression_method: str,
+    compression_level: Optional[int],
+    store_globs: List[str],
+    compress_globs: List[str],
+    store_ratio: Optional[float],
+    deduplicate: Optional[bool],
+    exclude_globs: List[str],
+    include_globs: List[str],
+    prune_presets: List[str],
+    import_profiles: List[str],
+    precompile_pythons: List[str],
+    optimize_levels: List[int],
+    sourceless: bool,
+    build_workers: Optional[int],
+    compression_report: bool,
+    timings: bool,
+    build_report: Optional[str],
+    pyz: str,
+) -> None:
+    """Repack a PYZ file created with ``shiv``, e.g. to compress it differently, without rebuilding it.
+
+    Entries that are compressed the same way as before are copied without recompressing them.
+    """
+    if sourceless and (len(precompile_pythons) != 1 or len(optimize_levels) > 1):
+        sys.exit(SOURCELESS_ERROR)
+
+    policy = CompressionPolicy(
+        method=COMPRESSION_METHODS[compression_method] if compressed else zipfile.ZIP_STORED,
+        level=compression_level,
+        store=store_globs,
+        compress=compress_globs,
+        store_ratio=store_ratio,
+    )
+    pruning = PruningPolicy(
+        exclude_globs,
+        include_globs,
+        prune_presets,
+        profile=read_profiles(import_profiles) if import_profiles else None,
+    )
+    target = Path(output_file).expanduser()
+
+    report = repack(
+        Path(pyz),
+        target,
+        interpreter=python,
+        policy=policy,
+        pruning=pruning,
+        precompile=precompile_pythons,
+        optimize=optimize_levels or (0,),
+        sourceless=sourceless,
+        deduplicate=deduplicate,
+        app_layer=list(app_layer) or None,
+        build_id=build_id,
+        hash_algorithm=hash_algorithm,
+        workers=build_workers,
+    )
+
+    with zipfile.ZipFile(str(target)) as archive:
+        env = Environment.from_json(archive.read("environment.json").decode())
+
+    reused = report.compression.rules.get(REUSED_RULE)
+    pruned = sum(stats.files for stats in report.pruned.values())
+    click.echo(
+        f"Repacked {pyz} to {output_file}: copied {reused.entries if reused else 0} entries without recompressing "
+        f"them, left out {pruned} files, build id {env.build_id}"
+    )
+
+    write_reports(report, compression_report, timings, build_report)
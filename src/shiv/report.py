@@ -0,0 +1,152 @@
+"""
+This module contains the ``BuildReport``, which records where the time of a build went and what it produced.
+"""
+import heapq
+import json
+import time
+
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, NamedTuple, Tuple
+
+from .compression import CompressionReport
+
+
+class PhaseStats:
+    """Wall and CPU time spent in a single phase of a build, and how much it processed."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.files = 0
+        self.bytes = 0
+
+
+class PackageStats:
+    """Totals for all the archive entries of a single top-level package (or module)."""
+
+    def __init__(self) -> None:
+        self.entries = 0
+        self.size = 0
+        self.compressed_size = 0
+
+
+class PrunedStats:
+    """Totals for all the files a single pruning rule excluded."""
+
+    def __init__(self) -> None:
+        self.files = 0
+        self.bytes = 0
+
+
+class StrippedStats:
+    """Totals for the native extensions whose debug information was stripped."""
+
+    def __init__(self) -> None:
+        self.files = 0
+        self.bytes = 0
+        self.saved = 0
+
+
+class EntryStats(NamedTuple):
+    name: str
+    size: int
+    compressed_size: int
+    seconds: float
+
+
+class BuildReport:
+    """Collects timings and statistics during a build.
+
+    :param slowest: How many of the slowest entries to keep track of.
+    """
+
+    def __init__(self, slowest: int = 10) -> None:
+        self.phases: Dict[str, PhaseStats] = {}
+        self.packages: Dict[str, PackageStats] = {}
+        self.pruned: Dict[str, PrunedStats] = {}
+        self.stripped = StrippedStats()
+        self.compression = CompressionReport()
+        self._slowest = slowest
+        self._entries: List[Tuple[float, EntryStats]] = []
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[PhaseStats]:
+        """Time the phase ``name``, the stats are yielded so that what the phase processed can be recorded."""
+        stats = self.phases.setdefault(name, PhaseStats(name))
+        started, cpu_started = time.perf_counter(), time.process_time()
+
+        try:
+            yield stats
+        finally:
+            stats.seconds += time.perf_counter() - started
+            # process time includes all threads, so this can exceed the wall time of parallel phases
+            stats.cpu_seconds += time.process_time() - cpu_started
+
+    def record_entry(self, name: str, size: int, compressed_size: int, seconds: float) -> None:
+        """Record a site-packages entry, ``name`` is its path relative to site-packages (with forward slashes)."""
+        package = self.packages.setdefault(name.split("/", 1)[0], PackageStats())
+        package.entries += 1
+        package.size += size
+        package.compressed_size += compressed_size
+
+        # only keep the slowest entries around
+        item = (seconds, EntryStats(name, size, compressed_size, seconds))
+
+        if len(self._entries) < self._slowest:
+            heapq.heappush(self._entries, item)
+        elif self._entries and seconds > self._entries[0][0]:
+            heapq.heapreplace(self._entries, item)
+
+    def record_pruned(self, rule: str, size: int) -> None:
+        """Record a site-packages file of ``size`` bytes that the pruning rule ``rule`` excluded."""
+        stats = self.pruned.setdefault(rule, PrunedStats())
+        stats.files += 1
+        stats.bytes += size
+
+    def record_stripped(self, size: int, stripped_size: int) -> None:
+        """Record a native extension of ``size`` bytes whose debug information was stripped."""
+        self.stripped.files += 1
+        self.stripped.bytes += size
+        self.stripped.saved += size - stripped_size
+
+    @property
+    def slowest(self) -> List[EntryStats]:
+        """The slowest entries to read and compress, slowest first."""
+        return [entry for _, entry in sorted(self._entries, reverse=True)]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "phases": {name: vars(stats).copy() for name, stats in self.phases.items()},
+            "packages": {name: vars(stats).copy() for name, stats in sorted(self.packages.items())},
+            "compression": {rule: vars(stats).copy() for rule, stats in sorted(self.compression.rules.items())},
+            "pruned": {rule: vars(stats).copy() for rule, stats in sorted(self.pruned.items())},
+            "stripped": vars(self.stripped).copy(),
+            "slowest": [entry._asdict() for entry in self.slowest],
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=4)
+
+    def lines(self) -> List[str]:
+        """A human readable summary of the timings of this report."""
+        lines = []
+
+        for name, stats in self.phases.items():
+            line = f"{name}: {stats.seconds:.2f}s wall, {stats.cpu_seconds:.2f}s cpu"
+
+            if stats.files:
+                line += f", {stats.files} files, {stats.bytes} bytes"
+
+            lines.append(line)
+
+        for rule, pruned in sorted(self.pruned.items()):
+            lines.append(f"pruned by {rule}: {pruned.files} files, {pruned.bytes} bytes")
+
+        if self.stripped.files:
+            lines.append(f"stripped debug information: {self.stripped.files} files, saved {self.stripped.saved} bytes")
+
+        total = sum(stats.seconds for stats in self.phases.values())
+        lines.append(f"total: {total:.2f}s")
+
+        return lines
@@ -0,0 +1,92 @@
+"""
+This module strips the debug information from the native extensions (ELF shared objects) of a zipapp at build time.
+
+Many wheels ship shared objects built with debug information, which is often most of their size and is never used
+at runtime. Files are stripped with binutils' ``strip --strip-debug``, which keeps the symbol table (and with it
+usable tracebacks in debuggers and profilers). The stripped copies are written to a separate directory, so the
+files being archived (which may be hardlinked to the user's own) are never modified.
+"""
+import os
+import shutil
+import subprocess
+import sys
+
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatchcase
+from pathlib import Path
+from stat import S_IMODE, S_ISLNK
+from typing import Iterable, List, NamedTuple, Optional, Sequence
+
+from .builder import SourceFile, default_workers
+from .constants import STRIP_DEBUG_ERROR
+from .pruning import SHARED_OBJECT_GLOBS
+
+# The first bytes of every ELF file.
+ELF_MAGIC = b"\x7fELF"
+
+
+class StrippedFile(NamedTuple):
+    # the path relative to site-packages, with forward slashes
+    name: str
+    size: int
+    stripped_size: int
+
+
+def is_shared_object(file: SourceFile) -> bool:
+    """Return true if a file looks like an ELF shared object (by name, then by contents)."""
+    if S_ISLNK(file.stat.st_mode) or not any(fnmatchcase(file.name, pattern) for pattern in SHARED_OBJECT_GLOBS):
+        return False
+
+    with file.open() as f:
+        return f.read(len(ELF_MAGIC)) == ELF_MAGIC
+
+
+def strip_debug(
+    files: Iterable[SourceFile],
+    target: Path,
+    keep: Sequence[str] = (),
+    strip: str = "strip",
+    workers: Optional[int] = None,
+) -> List[StrippedFile]:
+    """Write a copy of every shared object in ``files`` without its debug information below ``target``.
+
+    Only copies that are smaller than the original are kept, files ``strip`` can't handle (e.g. those built for
+    another architecture) are skipped. Returns the files that were stripped.
+
+    :param files: The files of site-packages.
+    :param target: The directory to write stripped copies to, laid out like site-packages.
+    :param keep: Globs of files (e.g. ``torch/*``) to leave as they are.
+    :param strip: The strip command to use.
+    :param workers: How many files to strip at the same time (defaults to the number of available cores).
+    """
+    candidates = [
+        file
+        for file in files
+        if not any(fnmatchcase(file.name, pattern) for pattern in keep) and is_shared_object(file)
+    ]
+
+    def run(file: SourceFile) -> Optional[StrippedFile]:
+        path = target / file.relpath
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        with file.open() as src, path.open("wb") as dst:
+            shutil.copyfileobj(src, dst)
+
+        try:
+            process = subprocess.run(
+                [strip, "--strip-debug", str(path)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+        except OSError:
+            sys.exit(STRIP_DEBUG_ERROR.format(strip=strip))
+
+        stripped_size = path.stat().st_size
+
+        if process.returncode or stripped_size >= file.stat.st_size:
+            path.unlink()
+            return None
+
+        os.chmod(path, S_IMODE(file.stat.st_mode))
+        return StrippedFile(file.name, file.stat.st_size, stripped_size)
+
+    with ThreadPoolExecutor(max_workers=workers or default_workers()) as executor:
+        return [stripped for stripped in executor.map(run, candidates) if stripped is not None]
@@ -0,0 +1,195 @@
+"""
+This module finds the top-level packages and modules of site-packages an application never imports, by statically
+walking its import graph from its entry point.
+
+The analysis is coarse on purpose: a top-level package is reachable as soon as any of its modules is imported, and
+then the imports of all its modules count. Imports that can't be seen statically (e.g. plugins loaded by name from
+entry points) have to be kept explicitly.
+"""
+import ast
+import csv
+import io
+
+from collections import deque
+from fnmatch import fnmatchcase
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Sequence, Set
+
+from .builder import SourceFile
+
+# The suffixes of the files Python can import a module from.
+MODULE_SUFFIXES = (".py", ".pyc", ".so", ".pyd")
+
+# Top-level names that are never left out: scripts, and the bytecode of top-level modules (which is tiny, and shared
+# by all of them).
+NEVER_DROPPED = ("bin", "__pycache__")
+
+# Functions that import a module given its name, as the first argument.
+IMPORT_FUNCTIONS = ("import_module", "__import__")
+
+
+def module_name(name: str) -> Optional[str]:
+    """Return the name of the top-level module a site-packages file belongs to, if it is part of one.
+
+    :param name: The path of the file, relative to site-packages and with forward slashes.
+    """
+    first, _, rest = name.partition("/")
+
+    if first == "__pycache__":
+        # the bytecode of a top-level module, e.g. __pycache__/six.cpython-311.pyc
+        return rest.split(".", 1)[0]
+
+    if rest:
+        return first if first.isidentifier() else None
+
+    # top-level modules, including extension modules (e.g. _cffi_backend.cpython-311-x86_64-linux-gnu.so)
+    stem = first.split(".", 1)[0]
+    return stem if first.endswith(MODULE_SUFFIXES) and stem.isidentifier() else None
+
+
+def find_imports(source: bytes) -> Set[str]:
+    """Return the top-level names a Python module imports (absolute imports only), or an empty set if it can't be
+    parsed.
+
+    Calls to ``importlib.import_module`` and ``__import__`` with a literal module name count as imports as well.
+    """
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return set()
+
+    names: Set[str] = set()
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name for alias in node.names)
+
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            names.add(node.module)
+
+        elif isinstance(node, ast.Call) and node.args and isinstance(node.args[0], ast.Constant):
+            function = node.func.attr if isinstance(node.func, ast.Attribute) else getattr(node.func, "id", None)
+
+            if function in IMPORT_FUNCTIONS and isinstance(node.args[0].value, str):
+                names.add(node.args[0].value)
+
+    return {name.split(".", 1)[0] for name in names if name and not name.startswith(".")}
+
+
+def distribution_modules(file: SourceFile) -> Set[str]:
+    """Return the top-level modules a distribution installed, read from its ``RECORD`` or ``top_level.txt``."""
+    with file.open() as f:
+        text = f.read().decode("utf-8", errors="replace")
+
+    if file.name.endswith("/top_level.txt"):
+        return {line.strip() for line in text.splitlines() if line.strip()}
+
+    return {module for row in csv.reader(io.StringIO(text)) if row for module in [module_name(row[0])] if module}
+
+
+class TreeShaking:
+    """The result of walking the import graph of an application.
+
+    :param reachable: The top-level modules the application may import, mapped to why.
+    :param dropped: The top-level names in site-packages that can be left out, mapped to why.
+    """
+
+    def __init__(self, reachable: Dict[str, str], dropped: Dict[str, str]) -> None:
+        self.reachable = reachable
+        self.dropped = dropped
+
+    def lines(self) -> List[str]:
+        """A human readable summary of what was left out and why."""
+        return [f"{name}: {reason}" for name, reason in sorted(self.dropped.items())]
+
+
+def shake(
+    files: Iterable[SourceFile],
+    roots: Dict[str, str],
+    keep: Sequence[str] = (),
+    scan: Optional[Callable[[str], bool]] = None,
+) -> TreeShaking:
+    """Find the top-level names of site-packages that can't be imported from ``roots``.
+
+    Top-level packages and modules that are never imported are dropped, and so is the metadata of distributions
+    all of whose modules are dropped. Directories without any Python module (e.g. data files) are kept.
+
+    :param files: Every file of site-packages.
+    :param roots: The top-level modules the application starts from, mapped to why (e.g. its entry point).
+    :param keep: Globs of top-level modules to keep, even if they don't seem to be imported.
+    :param scan: Optional, only the imports of the files (by name) it returns true for are followed, e.g. to leave
+        out the imports of tests that won't be archived.
+    """
+    # the Python sources and the top-level names (i.e. files or directories) of each top-level module
+    sources: Dict[str, List[SourceFile]] = {}
+    top_level: Dict[str, Set[str]] = {}
+    metadata: Dict[str, SourceFile] = {}
+    pth_files: List[SourceFile] = []
+
+    for file in files:
+        module = module_name(file.name)
+        first = file.name.split("/", 1)[0]
+
+        if module is not None and file.name.endswith(MODULE_SUFFIXES) and first not in NEVER_DROPPED:
+            top_level.setdefault(module, set()).add(first)
+
+            if file.name.endswith(".py") and (scan is None or scan(file.name)):
+                sources.setdefault(module, []).append(file)
+
+        elif first.endswith(".dist-info") and file.name == f"{first}/RECORD":
+            metadata[first] = file
+
+        elif first.endswith(".egg-info") and file.name == f"{first}/top_level.txt":
+            metadata[first] = file
+
+        elif file.name.endswith(".pth") and "/" not in file.name:
+            pth_files.append(file)
+
+    reachable: Dict[str, str] = {}
+    queue: Deque[str] = deque()
+
+    def reach(module: str, reason: str) -> None:
+        if module in top_level and module not in reachable:
+            reachable[module] = reason
+            queue.append(module)
+
+    for module, reason in roots.items():
+        reach(module, reason)
+
+    for module in sorted(top_level):
+        if any(fnmatchcase(module, pattern) for pattern in keep):
+            reach(module, "kept explicitly")
+
+    # .pth files run their import lines at startup
+    for file in pth_files:
+        with file.open() as f:
+            lines = f.read().decode("utf-8", errors="replace").splitlines()
+
+        for line in lines:
+            if line.startswith(("import ", "import\t")):
+                for module in sorted(find_imports(line.encode())):
+                    reach(module, f"imported by {file.name}")
+
+    while queue:
+        importer = queue.popleft()
+
+        for file in sources.get(importer, []):
+            with file.open() as f:
+                imported = find_imports(f.read())
+
+            for module in sorted(imported):
+                reach(module, f"imported by {importer}")
+
+    dropped = {
+        first: f"{module} is never imported"
+        for module, names in top_level.items()
+        if module not in reachable
+        for first in names
+    }
+
+    for first, file in metadata.items():
+        modules = distribution_modules(file) & top_level.keys()
+
+        if modules and not modules & reachable.keys():
+            dropped[first] = f"all of its modules are dropped ({', '.join(sorted(modules))})"
+
+    return TreeShaking(reachable, dropped)
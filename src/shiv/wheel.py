@@ -0,0 +1,207 @@
+"""
+This module reads wheels and lays out their contents the way ``pip install --target`` would, without extracting them.
+
+This lets a zipapp be built straight from a local wheelhouse: every member of a wheel is read from the wheel and
+written to the archive, skipping the round trip through a staged site-packages directory.
+"""
+import base64
+import csv
+import hashlib
+import io
+import os
+import sys
+import zipfile
+
+from configparser import ConfigParser
+from functools import partial
+from pathlib import Path
+from typing import IO, Callable, Dict, List, Optional, Sequence, Tuple
+
+from .builder import SourceFile, file_stat
+
+# The template pip (through distlib) uses to generate console scripts.
+SCRIPT_TEMPLATE = r"""# -*- coding: utf-8 -*-
+import re
+import sys
+from {module} import {import_name}
+if __name__ == '__main__':
+    sys.argv[0] = re.sub(r'(-script\.pyw|\.exe)?$', '', sys.argv[0])
+    sys.exit({func}())
+"""
+
+
+def strip_extras(specification: str) -> str:
+    """Return the object reference of an entry point without the extras it may list, e.g. ``module:func [extra]``."""
+    return specification.partition("[")[0].strip()
+
+
+def current_umask() -> int:
+    """Get the current umask, which pip applies to the permissions of the files it installs."""
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+def record_hash(data: bytes) -> str:
+    """Hash a file the way RECORD files do."""
+    return "sha256=" + base64.urlsafe_b64encode(hashlib.sha256(data).digest()).decode("ascii").rstrip("=")
+
+
+class Wheel:
+    """A wheel, whose files are read straight from the zip.
+
+    :param path: The path to the wheel.
+    :param python: The interpreter to use in the shebang of scripts (like pip, the one running shiv by default).
+    :param requested: Whether the wheel's project was requested (rather than pulled in as a dependency).
+    :param direct_url: The contents of ``direct_url.json``, for wheels that were requested by url.
+    """
+
+    def __init__(
+        self, path: Path, python: str = sys.executable, requested: bool = False, direct_url: Optional[str] = None
+    ) -> None:
+        self.path = path
+        self.python = python
+        self.requested = requested
+        self.direct_url = direct_url
+        self.zip = zipfile.ZipFile(str(path))
+
+        try:
+            self.dist_info = next(
+                name.split("/", 1)[0] for name in self.zip.namelist() if name.endswith(".dist-info/WHEEL")
+            )
+        except StopIteration:
+            self.zip.close()
+            raise ValueError(f"{path} is not a wheel, it has no .dist-info/WHEEL file")
+
+        self.data = self.dist_info[: -len(".dist-info")] + ".data"
+        self.project = self.dist_info.split("-", 1)[0]
+
+    def close(self) -> None:
+        self.zip.close()
+
+    def entry_points_text(self) -> str:
+        """The contents of the wheel's ``entry_points.txt``, if it has one."""
+        try:
+            return self.zip.read(f"{self.dist_info}/entry_points.txt").decode("utf-8")
+        except KeyError:
+            return ""
+
+    def entry_points(self) -> ConfigParser:
+        # like pip, keep the case of script names and don't interpolate values
+        config_parser = ConfigParser(interpolation=None)
+        config_parser.optionxform = str  # type: ignore
+        config_parser.read_string(self.entry_points_text())
+        return config_parser
+
+    def target_path(self, name: str) -> Tuple[str, bool]:
+        """Map the name of a member of the wheel to where pip would install it, relative to the target directory.
+
+        Also returns whether the file is installed in the lib directory (i.e. purelib or platlib), which matters for
+        how pip records it.
+        """
+        if not name.startswith(self.data + "/"):
+            return name, True
+
+        scheme, _, path = name.split("/", 1)[1].partition("/")
+
+        if scheme == "scripts":
+            return f"bin/{path}", False
+
+        if scheme == "headers":
+            return f"include/python/{self.project}/{path}", False
+
+        # purelib and platlib, as well as data, all end up in the target directory itself
+        return path, scheme in ("purelib", "platlib")
+
+    def record(self) -> Dict[str, str]:
+        """Read the hashes of the members of this wheel from its RECORD."""
+        lines = self.zip.read(f"{self.dist_info}/RECORD").decode("utf-8").splitlines()
+        return {row[0]: row[1] for row in csv.reader(lines) if row}
+
+    def files(self, umask: int = 0o022) -> List[SourceFile]:
+        """Return every file pip would install from this wheel, including console scripts and install metadata.
+
+        :param umask: The umask to apply to the permissions of files, like pip does.
+        """
+        files: List[SourceFile] = []
+        record_rows: List[Tuple[str, str, str]] = []
+        wheel_record = self.record()
+        regular_mode = 0o666 & ~umask
+
+        def add(target: str, in_lib: bool, mode: int, size: int, opener: Callable[[], IO[bytes]], hash_: str) -> None:
+            files.append(SourceFile(target.replace("/", os.sep), file_stat(mode, size), str(self.path), opener))
+            # like pip, files outside of the lib directory are recorded relative to it
+            record_rows.append((target if in_lib else f"../../{target}", hash_, str(size)))
+
+        def add_data(target: str, in_lib: bool, mode: int, data: bytes) -> None:
+            add(target, in_lib, mode, len(data), partial(io.BytesIO, data), record_hash(data))
+
+        for zinfo in self.zip.infolist():
+            if zinfo.is_dir() or zinfo.filename == f"{self.dist_info}/RECORD":
+                continue
+
+            target, in_lib = self.target_path(zinfo.filename)
+            mode = (0o777 & ~umask | 0o111) if (zinfo.external_attr >> 16) & 0o111 else regular_mode
+
+            if target.startswith("bin/"):
+                data = self.zip.read(zinfo)
+
+                # like pip, point scripts using a "#!python" shebang to the interpreter
+                if data.startswith(b"#!python"):
+                    _, _, rest = data.partition(b"\n")
+                    data = b"#!" + self.python.encode(sys.getfilesystemencoding()) + os.linesep.encode() + rest
+
+                add_data(target, in_lib, mode, data)
+            else:
+                opener = partial(self.zip.open, zinfo)
+                add(target, in_lib, mode, zinfo.file_size, opener, wheel_record.get(zinfo.filename, ""))
+
+        entry_points = self.entry_points()
+
+        for section in ("console_scripts", "gui_scripts"):
+            if not entry_points.has_section(section):
+                continue
+
+            for script, specification in entry_points[section].items():
+                module, _, func = (part.strip() for part in strip_extras(specification).partition(":"))
+                text = SCRIPT_TEMPLATE.format(module=module, import_name=func.split(".")[0], func=func)
+                add_data(f"bin/{script}", False, regular_mode | 0o555, f"#!{self.python}\n{text}".encode("utf-8"))
+
+        add_data(f"{self.dist_info}/INSTALLER", True, regular_mode, b"pip\n")
+
+        if self.requested:
+            add_data(f"{self.dist_info}/REQUESTED", True, regular_mode, b"")
+
+        if self.direct_url is not None:
+            add_data(f"{self.dist_info}/direct_url.json", True, regular_mode, self.direct_url.encode("utf-8"))
+
+        # finally, RECORD lists everything that was installed (pip writes it with csv's default \r\n line endings)
+        record_rows.append((f"{self.dist_info}/RECORD", "", ""))
+        record = io.StringIO()
+        csv.writer(record).writerows(sorted(record_rows))
+        data = record.getvalue().encode("utf-8")
+        files.append(
+            SourceFile(
+                os.path.join(self.dist_info, "RECORD"),
+                file_stat(regular_mode, len(data)),
+                str(self.path),
+                partial(io.BytesIO, data),
+            )
+        )
+
+        return files
+
+
+def wheel_files(wheels: Sequence[Wheel]) -> List[SourceFile]:
+    """Merge the files of several wheels, in the order walking the site-packages pip would install them to yields.
+
+    As with pip, if two wheels contain the same file the last one wins.
+    """
+    umask = current_umask()
+    files: Dict[str, SourceFile] = {}
+
+    for wheel in wheels:
+        for file in wheel.files(umask):
+            files[file.relpath] = file
+
+    return [files[relpath] for relpath in sorted(files)]
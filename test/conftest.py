@@ -1,4 +1,7 @@
 import os
+import shutil
+import subprocess
+import sys
 
 from contextlib import contextmanager
 from pathlib import Path
@@ -18,6 +21,18 @@ def package_location():
     return Path(__file__).absolute().parent / "package"
 
 
+@pytest.fixture
+def wheelhouse(package_location, tmp_path):
+    """A directory holding a wheel of the test package, built from a copy so the package is left untouched."""
+    package = tmp_path / "package-source"
+    shutil.copytree(package_location, package, ignore=shutil.ignore_patterns("build", "*.egg-info"))
+    wheelhouse = tmp_path / "wheelhouse"
+    subprocess.run(
+        [sys.executable, "-m", "pip", "wheel", "-q", "--no-deps", "-w", str(wheelhouse), str(package)], check=True
+    )
+    return wheelhouse
+
+
 @pytest.fixture
 def sp():
     return [Path(__file__).absolute().parent / "sp" / "site-packages"]
@@ -0,0 +1,194 @@
+import hashlib
+import subprocess
+import sys
+
+from pathlib import Path
+
+import pytest
+
+from shiv import api
+from shiv.api import BuildSpec, build, build_batch, distribution_key, pip_options, share_dependencies
+from shiv.constants import NO_PIP_ARGS_OR_SITE_PACKAGES, PIP_INSTALL_ERROR
+
+
+def distribution(name, url):
+    return {"download_info": {"url": url, "archive_info": {}}, "metadata": {"name": name, "version": "1.0"}}
+
+
+def read_requirement(args):
+    """The requirement a shared install installs, from the requirements file given last."""
+    assert args[-2] == "-r"
+    return Path(args[-1]).read_text().strip()
+
+
+class TestAPI:
+    @pytest.fixture
+    def site_packages(self, tmp_path):
+        site_packages = tmp_path / "site-packages"
+        site_packages.mkdir()
+        (site_packages / "hello.py").write_text("def main():\n    print('hello!')\n")
+        return site_packages
+
+    def test_unknown_option(self):
+        with pytest.raises(ValueError, match="Unknown options: bogus"):
+            BuildSpec("hello.pyz", bogus=True)
+
+    def test_build(self, tmp_path, site_packages):
+        output_file = tmp_path / "hello.pyz"
+        spec = BuildSpec(output_file, entry_point="hello:main", site_packages=[site_packages], reproducible=True)
+
+        result = build(spec)
+
+        assert result.ok
+        assert result.report.phases["site-packages"].files == 1
+        assert result.build_id == build(spec).build_id
+
+        proc = subprocess.run([str(output_file)], stdout=subprocess.PIPE)
+        assert proc.stdout.decode().strip() == "hello!"
+
+    @pytest.mark.parametrize(
+        "options, error",
+        [
+            ({}, NO_PIP_ARGS_OR_SITE_PACKAGES.strip()),
+            ({"site_packages": ["/does/not/exist"]}, "Path '/does/not/exist' does not exist."),
+            ({"site_packages": ["."], "compression_level": 10}, "Invalid value for '--compression-level'"),
+        ],
+    )
+    def test_build_errors(self, tmp_path, options, error):
+        result = build(BuildSpec(tmp_path / "hello.pyz", **options))
+
+        assert not result.ok
+        assert error in result.error
+        assert result.build_id is None
+
+    def test_share_dependencies(self, tmp_path, monkeypatch):
+        common = distribution("common", "https://example.com/common-1.0-py3-none-any.whl")
+        resolved = {
+            ("alpha",): [distribution("alpha", "https://example.com/alpha-1.0-py3-none-any.whl"), common],
+            ("beta",): [distribution("beta", "https://example.com/beta-1.0-py3-none-any.whl"), common],
+            ("unresolvable",): None,
+        }
+        installed = {}
+        monkeypatch.setattr(api.pip, "resolve", lambda args: resolved[tuple(args[-1:])])
+        monkeypatch.setattr(api.pip, "install", lambda args: installed.setdefault(read_requirement(args), args[3:-2]))
+
+        specs = [
+            BuildSpec("alpha.pyz", ["--index-url", "https://mirror", "alpha"], console_script="alpha"),
+            BuildSpec("beta.pyz", ["beta"]),
+            # what pip installs doesn't replace what's in site-packages (see stage_install)
+            BuildSpec("extra.pyz", ["beta"], site_packages=["extra"]),
+            BuildSpec("wheels.pyz", ["alpha"], direct_wheels=True),
+            BuildSpec("other.pyz", ["unresolvable"]),
+        ]
+        shared = share_dependencies(specs, tmp_path)
+
+        # every distribution is installed once, with the pip options of the spec that needs it
+        assert installed == {
+            "https://example.com/alpha-1.0-py3-none-any.whl": ["--no-compile", "--index-url", "https://mirror"],
+            "https://example.com/beta-1.0-py3-none-any.whl": ["--no-compile"],
+            "https://example.com/common-1.0-py3-none-any.whl": ["--no-compile", "--index-url", "https://mirror"],
+        }
+
+        assert shared[0].pip_args == []
+        assert shared[0].options == {
+            "console_script": "alpha",
+            "site_packages": [str(tmp_path / distribution_key(item)) for item in resolved[("alpha",)]],
+        }
+        assert shared[1].options["site_packages"][1] == shared[0].options["site_packages"][1]
+        assert shared[2:] == specs[2:]
+
+    def test_share_dependencies_install_fails(self, tmp_path, monkeypatch):
+        common = distribution("common", "https://example.com/common-1.0-py3-none-any.whl")
+        broken = distribution("broken", "https://example.com/broken-1.0-py3-none-any.whl")
+        resolved = {("alpha",): [common], ("beta",): [common, broken]}
+
+        def install(args):
+            if read_requirement(args) == broken["download_info"]["url"]:
+                sys.exit(PIP_INSTALL_ERROR)
+
+        monkeypatch.setattr(api.pip, "resolve", lambda args: resolved[tuple(args)])
+        monkeypatch.setattr(api.pip, "install", install)
+
+        specs = [BuildSpec("alpha.pyz", ["alpha"]), BuildSpec("beta.pyz", ["beta"])]
+        shared = share_dependencies(specs, tmp_path)
+
+        # the spec needing the distribution that failed to install runs pip (and reports its error) itself
+        assert shared[0].options == {"site_packages": [str(tmp_path / distribution_key(common))]}
+        assert shared[1] is specs[1]
+
+    @pytest.mark.parametrize(
+        "download_info, expected",
+        [
+            (
+                {"url": "https://host/alpha-1.0.tar.gz", "archive_info": {"hashes": {"sha256": "00", "md5": "11"}}},
+                "https://host/alpha-1.0.tar.gz --hash=md5:11 --hash=sha256:00",
+            ),
+            (
+                {"url": "file:///wheels/alpha-1.0-py3-none-any.whl", "archive_info": {"hash": "sha256=00"}},
+                "file:///wheels/alpha-1.0-py3-none-any.whl --hash=sha256:00",
+            ),
+            (
+                {
+                    "url": "https://github.com/org/repo",
+                    "vcs_info": {"vcs": "git", "commit_id": "abc123", "requested_revision": "main"},
+                    "subdirectory": "alpha",
+                },
+                "git+https://github.com/org/repo@abc123#subdirectory=alpha",
+            ),
+            ({"url": "file:///src/alpha", "dir_info": {}}, "file:///src/alpha"),
+            ({"url": "file:///src/alpha", "dir_info": {"editable": True}}, None),
+        ],
+        ids=["archive", "legacy-hash", "vcs", "directory", "editable"],
+    )
+    def test_requirement(self, download_info, expected):
+        assert api.requirement({"download_info": download_info}) == expected
+
+    @pytest.mark.parametrize(
+        "args, options",
+        [
+            (["hello", "world==1.0"], []),
+            (["--no-index", "-f", "wheels", "hello"], ["--no-index", "-f", "wheels"]),
+            (["--index-url=https://pypi", "-ihttps://pypi", "hello"], ["--index-url=https://pypi", "-ihttps://pypi"]),
+            (["-r", "requirements.txt", "--constraint=constraints.txt", "-U", "hello"], ["-U"]),
+            (["-C", "key=value", "--only-binary", ":all:", "./hello"], ["-C", "key=value", "--only-binary", ":all:"]),
+        ],
+    )
+    def test_pip_options(self, args, options):
+        assert pip_options(args) == options
+
+    @pytest.mark.parametrize("how", ["find-links", "url", "hashes"])
+    def test_build_batch_same_build_id(self, tmp_path, wheelhouse, how):
+        wheel = next(wheelhouse.glob("*.whl"))
+        requirements = tmp_path / "requirements.txt"
+        requirements.write_text(f"hello==0.0.0 --hash=sha256:{hashlib.sha256(wheel.read_bytes()).hexdigest()}\n")
+        requirement = {
+            "find-links": ["--find-links", str(wheelhouse), "hello"],
+            "url": [str(wheel)],
+            "hashes": ["--require-hashes", "--find-links", str(wheelhouse), "-r", str(requirements)],
+        }[how]
+        options = {"entry_point": "hello:main", "reproducible": True}
+
+        single = build(BuildSpec(tmp_path / "single.pyz", ["--no-index", *requirement], **options))
+        [batch] = build_batch([BuildSpec(tmp_path / "batch.pyz", ["--no-index", *requirement], **options)])
+
+        # installing the dependencies shared by a batch gives them the same metadata as installing them for one build
+        assert single.ok and batch.ok
+        assert single.build_id == batch.build_id
+        assert (tmp_path / "single.pyz").read_bytes() == (tmp_path / "batch.pyz").read_bytes()
+
+    def test_build_batch(self, tmp_path, package_location):
+        specs = [
+            BuildSpec(tmp_path / "script.pyz", [str(package_location)], console_script="hello"),
+            BuildSpec(tmp_path / "entry_point.pyz", [str(package_location)], entry_point="hello:main"),
+            BuildSpec(tmp_path / "broken.pyz", [str(package_location)], console_script="missing"),
+        ]
+
+        results = build_batch(specs, workers=2)
+
+        assert [result.spec for result in results] == specs
+        assert [result.ok for result in results] == [True, True, False]
+        assert "No entry point 'missing' found" in results[2].error
+
+        for result in results[:2]:
+            proc = subprocess.run([result.spec.output_file], stdout=subprocess.PIPE)
+            assert proc.stdout.decode().strip() == "hello world"
@@ -1,4 +1,7 @@
+import hashlib
 import os
+import stat
+import subprocess
 import sys
 
 from code import interact
@@ -7,7 +10,7 @@ from pathlib import Path
 from site import addsitedir
 from unittest import mock
 from uuid import uuid4
-from zipfile import ZipFile
+from zipfile import ZipFile, ZipInfo
 
 import pytest
 
@@ -19,12 +22,34 @@ from shiv.bootstrap import (
     extract_site_packages,
     get_first_sitedir_index,
     import_string,
+    is_foreign_bytecode,
+    layer_of,
     prepend_pythonpath,
 )
 from shiv.bootstrap.environment import Environment
 from shiv.bootstrap.filelock import FileLock
+from shiv.bootstrap.import_profile import mapped_files, read_profiles, relative_path
+from shiv.bootstrap.manifest import Manifest, ManifestEntry
 from shiv.pip import install
 
+# Records the imports of a run that imports a package, changes directories and reads one of its data files.
+RECORD_SCRIPT = """\
+import os
+import sys
+
+from pathlib import Path
+
+from shiv.bootstrap.import_profile import record_imports
+
+record_imports({profile!r}, [{site_packages!r}])
+sys.path.insert(0, {site_packages!r})
+os.chdir({site_packages!r})
+
+import recorded_package
+
+(Path(recorded_package.__file__).parent / "data.txt").read_text()
+"""
+
 
 class TestBootstrap:
     def test_import_string(self):
@@ -103,6 +128,75 @@ class TestBootstrap:
         assert Path(site_packages, "test").exists()
         assert Path(site_packages, "test").is_file()
 
+    @pytest.mark.parametrize(
+        "path, layer",
+        [
+            ("myapp/__init__.py", "app"),
+            ("myapp-1.0.dist-info/RECORD", "app"),
+            ("bin/myapp", "app"),
+            ("requests/__init__.py", "deps"),
+            ("myapplication.py", "deps"),
+        ],
+    )
+    def test_layer_of(self, path, layer):
+        assert layer_of(path, ["myapp", "myapp-*"]) == layer
+
+    def test_extract_site_packages_include(self, tmp_path, zip_location):
+        with ZipFile(str(zip_location)) as archive:
+            extract_site_packages(archive, tmp_path / "none", include=lambda path: False)
+            extract_site_packages(archive, tmp_path / "all", include=lambda path: path == "test")
+
+        assert list((tmp_path / "none" / "site-packages").iterdir()) == []
+        assert Path(tmp_path, "all", "site-packages", "test").is_file()
+
+    @pytest.mark.parametrize("symlinks", [True, False])
+    def test_extract_site_packages_stale_symlinks(self, tmp_path, monkeypatch, symlinks):
+        archive_path = tmp_path / "symlinks.zip"
+
+        with ZipFile(archive_path, "w") as archive:
+            archive.writestr("site-packages/pkg/data/table.csv", "a,b\n")
+            archive.writestr("site-packages/pkg/file.txt", "file")
+
+            for name, target in (("data_link", "pkg/data"), ("file_link", "pkg/file.txt")):
+                zinfo = ZipInfo(f"site-packages/{name}")
+                zinfo.external_attr = (stat.S_IFLNK | 0o777) << 16
+                archive.writestr(zinfo, target)
+
+        # an interrupted extraction left the links (or the copies) behind
+        outside = tmp_path / "outside.txt"
+        outside.write_text("outside")
+        stale = tmp_path / "target.tmp" / "site-packages"
+        (stale / "data_link").mkdir(parents=True)
+        (stale / "data_link" / "stale.csv").write_text("stale")
+        (stale / "file_link").symlink_to(outside)
+
+        if not symlinks:
+            # the platform doesn't allow creating symlinks, they are copies instead
+            monkeypatch.setattr(os, "symlink", mock.Mock(side_effect=OSError))
+
+        with ZipFile(archive_path) as archive:
+            extract_site_packages(archive, tmp_path / "target")
+
+        site_packages = tmp_path / "target" / "site-packages"
+        assert (site_packages / "data_link").is_symlink() is symlinks
+        assert sorted(path.name for path in (site_packages / "data_link").iterdir()) == ["table.csv"]
+        assert (site_packages / "file_link").read_text() == "file"
+        assert outside.read_text() == "outside"
+
+    @pytest.mark.parametrize(
+        "filename, foreign",
+        [
+            ("site-packages/pkg/__pycache__/mod.cpython-311.pyc", False),
+            ("site-packages/pkg/__pycache__/mod.cpython-311.opt-2.pyc", False),
+            ("site-packages/pkg/__pycache__/mod.cpython-312.pyc", True),
+            ("site-packages/pkg/__pycache__/mod.pypy39.opt-1.pyc", True),
+            ("site-packages/pkg/mod.pyc", False),
+            ("site-packages/pkg/mod.py", False),
+        ],
+    )
+    def test_is_foreign_bytecode(self, filename, foreign):
+        assert is_foreign_bytecode(filename, cache_tag="cpython-311") is foreign
+
     @pytest.mark.parametrize("additional_paths", (["test"], ["test", ".pth"]))
     def test_extend_path(self, additional_paths):
 
@@ -187,6 +281,10 @@ class TestEnvironment:
         with env_var(Environment.PREPEND_PYTHONPATH, "/path/to/other_package"):
             assert env.prepend_pythonpath == "/path/to/other_package"
 
+        assert env.record_imports is None
+        with env_var(Environment.RECORD_IMPORTS, "imports.txt"):
+            assert env.record_imports == "imports.txt"
+
     def test_roundtrip(self):
         now = str(datetime.now())
         version = "0.0.1"
@@ -218,3 +316,124 @@ class TestEnvironment:
         hashes = {"hello/__init__.py": "1e8d5b8a6839487a4211229f69b76a5f901515dcad7f111a4bdd5b30d9e96020"}
 
         ensure_no_modify(site_packages, hashes)
+
+        source = (site_packages / "hello" / "__init__.py").read_bytes()
+        ensure_no_modify(site_packages, {"hello/__init__.py": hashlib.blake2b(source).hexdigest()}, "blake2b")
+
+        with pytest.raises(RuntimeError):
+            ensure_no_modify(site_packages, hashes, "blake2b")
+
+
+class TestImportProfile:
+    def test_relative_path(self, tmp_path):
+        roots = [os.path.join(str(tmp_path / "site-packages"), "")]
+
+        assert relative_path(tmp_path / "site-packages" / "hello" / "__init__.py", roots) == "hello/__init__.py"
+        assert relative_path(str(tmp_path / "site-packages-other" / "hello.py"), roots) == ""
+        assert relative_path(3, roots) == ""
+
+    def test_mapped_files(self, tmp_path):
+        if not os.path.exists("/proc/self/maps"):
+            pytest.skip("requires /proc")
+
+        assert os.path.realpath(sys.executable) in mapped_files()
+        assert mapped_files(str(tmp_path / "missing")) == set()
+
+    def test_record_imports(self, tmp_path):
+        site_packages = tmp_path / "site-packages"
+        (site_packages / "recorded_package").mkdir(parents=True)
+        (site_packages / "recorded_package" / "__init__.py").write_text("")
+        (site_packages / "recorded_package" / "data.txt").write_text("data")
+        (site_packages / "unused.txt").write_text("")
+        profile = tmp_path / "imports.txt"
+
+        # audit hooks can't be removed, so recording runs in a process of its own (which changes directories, the
+        # profile's path is relative to where recording starts)
+        script = RECORD_SCRIPT.format(profile=profile.name, site_packages=str(site_packages))
+
+        for _ in range(2):
+            subprocess.run([sys.executable, "-c", script], check=True, cwd=str(tmp_path))
+
+        # runs append to the profile, and may also record bytecode
+        recorded = read_profiles([profile])
+        lines = profile.read_text().splitlines()
+        assert {"recorded_package/__init__.py", "recorded_package/data.txt"} <= recorded
+        assert "unused.txt" not in recorded
+        assert not (site_packages / profile.name).exists()
+        assert lines.count("recorded_package/data.txt") == 2
+
+
+class TestManifest:
+    def test_roundtrip(self, tmp_path, zip_location):
+        manifest = Manifest([ManifestEntry("hello/__init__.py", 10, 0o644, "abc", 8, 8, None)])
+        manifest.add(ManifestEntry("hello/data.bin", 10, 0o755, "def", 10, 0, 9))
+        manifest.add(ManifestEntry("hello/copy.bin", 10, 0o755, "def", 0, 0, 9, "hello/data.bin"))
+
+        loaded = Manifest.from_json(manifest.to_json())
+        assert loaded.entries == manifest.entries
+        assert loaded.build_id() == manifest.build_id()
+        assert loaded.get("hello/data.bin").level == 9
+        assert loaded.hashes() == {str(Path("hello", "__init__.py")): "abc"}
+        assert loaded.aliases() == {"hello/copy.bin": "hello/data.bin"}
+        assert loaded.compression is None
+
+        manifest.compression = {"method": 8, "level": None, "store": [], "compress": [], "store_ratio": 0.9}
+        assert Manifest.from_json(manifest.to_json()).compression == manifest.compression
+
+        with ZipFile(tmp_path / "test.zip", "w") as archive:
+            archive.writestr(Manifest.FILENAME, manifest.to_json())
+
+        with ZipFile(tmp_path / "test.zip") as archive:
+            assert Manifest.load(archive).entries == manifest.entries
+
+        # archives built by older versions of shiv have no manifest
+        with ZipFile(zip_location) as archive:
+            assert Manifest.load(archive) is None
+
+    def test_build_id(self):
+        manifest = Manifest([ManifestEntry("hello/__init__.py", 10, 0o644, "abc", 8, 8)])
+
+        # the build id changes with contents, names and permissions
+        assert manifest.build_id() != Manifest([ManifestEntry("hello/__init__.py", 10, 0o644, "abd", 8, 8)]).build_id()
+        assert manifest.build_id() != Manifest([ManifestEntry("hello/other.py", 10, 0o644, "abc", 8, 8)]).build_id()
+        assert manifest.build_id() != Manifest([ManifestEntry("hello/__init__.py", 10, 0o755, "abc", 8, 8)]).build_id()
+
+    def test_tree(self):
+        manifest = Manifest(
+            [
+                ManifestEntry("alpha/__init__.py", 10, 0o644, "a", 8, 8),
+                ManifestEntry("alpha/sub/module.py", 10, 0o644, "b", 8, 8),
+                ManifestEntry("beta/deep/down/module.py", 10, 0o644, "c", 8, 8),
+                ManifestEntry("top.py", 10, 0o644, "d", 8, 8),
+            ]
+        )
+        tree = manifest.tree()
+
+        assert sorted(tree) == ["", "alpha", "alpha/sub", "beta", "beta/deep", "beta/deep/down"]
+        assert tree[""] == manifest.build_id()
+
+        # a change only affects the digests of the directories containing the file
+        changed = Manifest(list(manifest))
+        changed.entries[1] = changed.entries[1]._replace(digest="e")
+        changed_tree = changed.tree()
+
+        assert [path for path in tree if tree[path] != changed_tree[path]] == ["alpha/sub", "alpha", ""]
+
+    def test_diff(self):
+        manifest = Manifest(
+            [
+                ManifestEntry("alpha/__init__.py", 10, 0o644, "a", 8, 8),
+                ManifestEntry("alpha/sub/module.py", 10, 0o644, "b", 8, 8),
+                ManifestEntry("beta/module.py", 10, 0o644, "c", 8, 8),
+            ]
+        )
+        other = Manifest(
+            [
+                ManifestEntry("alpha/__init__.py", 10, 0o755, "a", 8, 8),
+                ManifestEntry("alpha/sub/module.py", 10, 0o644, "b", 8, 8),
+                ManifestEntry("gamma/module.py", 10, 0o644, "c", 8, 8),
+            ]
+        )
+
+        assert manifest.diff(manifest) == []
+        assert manifest.diff(other) == ["alpha/__init__.py", "beta/module.py", "gamma/module.py"]
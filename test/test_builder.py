@@ -1,19 +1,54 @@
+import hashlib
+import io
 import os
 import stat
 import sys
 import tempfile
+import tracemalloc
 import zipfile
+import zipimport
+import zlib
 
 from pathlib import Path
 from zipapp import ZipAppError
 
 import pytest
 
-from shiv.builder import create_archive, rglob_follow_symlinks, write_file_prefix
+from shiv import builder
+from shiv.bootstrap import extract_site_packages
+from shiv.bootstrap.environment import Environment
+from shiv.bootstrap.manifest import Manifest
+from shiv.compression import CompressionPolicy
+from shiv.pruning import PruningPolicy
+from shiv.builder import (
+    SourceFile,
+    compress,
+    create_archive,
+    file_stat,
+    imap_ordered,
+    rglob_follow_symlinks,
+    walk,
+    write_compressed_to_zipapp,
+    write_file_prefix,
+    write_large_file,
+    write_to_zipapp,
+    zipinfo_for,
+)
 
 UGOX = stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH
 
 
+def populate(site_packages):
+    """Create a small site-packages tree with a mix of compressible and incompressible files."""
+    for package in ("alpha", "beta", "gamma"):
+        package_dir = site_packages / package
+        package_dir.mkdir(parents=True)
+        (package_dir / "__init__.py").write_text(f"NAME = {package!r}\n" * 100)
+        (package_dir / "data.bin").write_bytes(os.urandom(4096))
+
+    return site_packages
+
+
 def tmp_write_prefix(interpreter):
     with tempfile.TemporaryFile() as fd:
         write_file_prefix(fd, interpreter)
@@ -49,6 +84,42 @@ class TestBuilder:
         sym_file = sym_dir / real_file.name
         assert sorted(rglob_follow_symlinks(tmp_path, '*'), key=str) == [real_dir, real_file, sym_dir, sym_file]
 
+    @pytest.mark.parametrize(
+        "mode,expected",
+        [
+            (0o644, stat.S_IFREG | 0o644),
+            (stat.S_IFREG | 0o755, stat.S_IFREG | 0o755),
+            (stat.S_IFLNK | 0o777, stat.S_IFLNK | 0o777),
+        ],
+    )
+    def test_file_stat(self, mode, expected):
+        result = file_stat(mode, 42)
+
+        assert result.st_mode == expected
+        assert result.st_size == 42
+
+    def test_walk_matches_rglob_follow_symlinks(self, tmp_path):
+        populate(tmp_path)
+        (tmp_path / "alpha-beta.py").touch()
+        (tmp_path / "link").symlink_to(tmp_path / "beta")
+        (tmp_path / "gamma" / "sub").mkdir()
+        (tmp_path / "gamma" / "sub" / "module.py").touch()
+
+        expected = [path for path in sorted(rglob_follow_symlinks(tmp_path, "*"), key=str) if not path.is_dir()]
+        files = list(walk(tmp_path))
+
+        assert [Path(file.path) for file in files] == expected
+        assert [file.relpath for file in files] == [str(path.relative_to(tmp_path)) for path in expected]
+        assert [file.stat for file in files] == [path.stat() for path in expected]
+        assert [file.name for file in files[:2]] == ["alpha-beta.py", "alpha/__init__.py"]
+
+    def test_walk_symlink_cycles(self, tmp_path):
+        (tmp_path / "package" / "sub").mkdir(parents=True)
+        (tmp_path / "package" / "sub" / "module.py").touch()
+        (tmp_path / "package" / "sub" / "loop").symlink_to(tmp_path / "package")
+
+        assert [file.name for file in walk(tmp_path)] == ["package/sub/module.py"]
+
     def test_create_archive(self, sp, env):
         with tempfile.TemporaryDirectory() as tmpdir:
             target = Path(tmpdir, "test.zip")
@@ -71,3 +142,433 @@ class TestBuilder:
             create_archive(sp, target, sys.executable, "code:interact", env)
 
             assert target.stat().st_mode & UGOX == UGOX
+
+    @pytest.mark.parametrize("compression", [zipfile.ZIP_DEFLATED, zipfile.ZIP_STORED])
+    def test_write_compressed_matches_writestr(self, tmp_path, compression):
+        data = b"hello world\n" * 1000
+        date_time = (2019, 1, 1, 12, 12, 12)
+
+        with zipfile.ZipFile(str(tmp_path / "writestr.zip"), "w") as archive:
+            write_to_zipapp(archive, "hello.txt", data, date_time, compression)
+
+        with zipfile.ZipFile(str(tmp_path / "precompressed.zip"), "w") as archive:
+            payload = compress(data, compression)
+            zinfo = zipinfo_for("hello.txt", date_time, compression)
+            zinfo.file_size, zinfo.compress_size, zinfo.CRC = len(data), len(payload), zlib.crc32(data)
+            write_compressed_to_zipapp(archive, zinfo, payload)
+
+        assert (tmp_path / "writestr.zip").read_bytes() == (tmp_path / "precompressed.zip").read_bytes()
+
+    def test_imap_ordered(self):
+        items = list(range(100))
+        assert list(imap_ordered(lambda i: i * 2, items, workers=1)) == [i * 2 for i in items]
+        assert list(imap_ordered(lambda i: i * 2, items, workers=4)) == [i * 2 for i in items]
+
+    @pytest.mark.parametrize("compressed", [True, False])
+    def test_create_archive_workers_are_reproducible(self, tmp_path, env, compressed):
+        source = populate(tmp_path / "site-packages")
+
+        serial = tmp_path / "serial.pyz"
+        create_archive([source], serial, sys.executable, "code:interact", env, compressed=compressed, workers=1)
+
+        parallel = tmp_path / "parallel.pyz"
+        create_archive([source], parallel, sys.executable, "code:interact", env, compressed=compressed, workers=4)
+
+        assert serial.read_bytes() == parallel.read_bytes()
+
+        with zipfile.ZipFile(str(parallel)) as archive:
+            assert archive.testzip() is None
+            assert archive.read("site-packages/alpha/__init__.py") == (source / "alpha" / "__init__.py").read_bytes()
+
+    @pytest.mark.parametrize("compressed", [True, False])
+    def test_create_archive_streams_large_files(self, tmp_path, monkeypatch, compressed):
+        source = populate(tmp_path / "site-packages")
+        (source / "alpha" / "large.bin").write_bytes(os.urandom(64 * 1024) * 8)
+
+        def build(name):
+            env = Environment(built_at="2019-01-01 12:12:12", shiv_version="0.0.1")
+            target = tmp_path / name
+            create_archive([source], target, sys.executable, "code:interact", env, compressed=compressed)
+            return target.read_bytes(), env.build_id
+
+        in_memory = build("in_memory.pyz")
+
+        monkeypatch.setattr(builder, "STREAM_CHUNK_SIZE", 1024)
+        streamed = build("streamed.pyz")
+
+        # streaming must not change the archive or the build id
+        assert in_memory == streamed
+
+    def test_write_large_file_closes_files(self, monkeypatch):
+        monkeypatch.setattr(builder, "STREAM_CHUNK_SIZE", 1024)
+        data = os.urandom(4096)
+        opened = []
+
+        def opener():
+            opened.append(io.BytesIO(data))
+            return opened[-1]
+
+        file = SourceFile("large.bin", file_stat(0o644, len(data)), "large.bin", opener)
+        zinfo = zipinfo_for("site-packages/large.bin", (1980, 1, 1, 0, 0, 0), zipfile.ZIP_DEFLATED)
+        zinfo.file_size = len(data)
+
+        with zipfile.ZipFile(io.BytesIO(), "w") as archive:
+            decision = write_large_file(archive, zinfo, file, hashlib.sha256(), CompressionPolicy(store_ratio=0.9))
+
+        # sampling the first chunk to tell whether the file is incompressible doesn't leave it open
+        assert decision.rule == "incompressible"
+        assert len(opened) == 2
+        assert all(f.closed for f in opened)
+
+    @pytest.mark.parametrize("chunk_size", [builder.STREAM_CHUNK_SIZE, 1024])
+    def test_create_archive_to_stream(self, tmp_path, monkeypatch, chunk_size):
+        monkeypatch.setattr(builder, "STREAM_CHUNK_SIZE", chunk_size)
+        source = populate(tmp_path / "site-packages")
+        (source / "alpha" / "large.bin").write_bytes(os.urandom(64 * 1024) * 8)
+
+        def build(target):
+            env = Environment(built_at="2019-01-01 12:12:12", shiv_version="0.0.1")
+            create_archive([source], target, sys.executable, "code:interact", env)
+            return env.build_id
+
+        stream = io.BytesIO()
+        build_id = build(stream)
+        streamed = tmp_path / "streamed.pyz"
+        streamed.write_bytes(stream.getvalue())
+
+        assert build_id == build(tmp_path / "file.pyz")
+        assert stream.getvalue().startswith(tmp_write_prefix(sys.executable))
+
+        with zipfile.ZipFile(str(streamed)) as archive, zipfile.ZipFile(str(tmp_path / "file.pyz")) as expected:
+            assert archive.testzip() is None
+            assert archive.namelist() == expected.namelist()
+
+            for zinfo in archive.infolist():
+                assert archive.read(zinfo) == expected.read(zinfo.filename)
+
+            # entries whose checksum isn't known upfront are followed by a data descriptor
+            assert any(zinfo.flag_bits & 0x08 for zinfo in archive.infolist())
+
+        # zipimport (which runs the bootstrap code) can read the streamed zipapp
+        assert "def bootstrap()" in zipimport.zipimporter(str(streamed)).get_source("_bootstrap")
+
+    @pytest.mark.parametrize("chunk_size", [builder.STREAM_CHUNK_SIZE, 1024])
+    def test_create_archive_reuse_from(self, tmp_path, monkeypatch, chunk_size):
+        monkeypatch.setattr(builder, "STREAM_CHUNK_SIZE", chunk_size)
+        source = populate(tmp_path / "site-packages")
+
+        def build(target, reuse_from=None):
+            env = Environment(built_at="2019-01-01 12:12:12", shiv_version="0.0.1")
+            create_archive([source], target, sys.executable, "code:interact", env, reuse_from=reuse_from)
+            return target.read_bytes()
+
+        previous = tmp_path / "previous.pyz"
+        build(previous)
+
+        # change one file, the others can be reused
+        (source / "beta" / "data.bin").write_bytes(os.urandom(4096))
+        clean = build(tmp_path / "clean.pyz")
+
+        reused = []
+        close = builder.PreviousArchive.close
+        monkeypatch.setattr(builder.PreviousArchive, "close", lambda self: (reused.append(self.reused), close(self)))
+        assert build(tmp_path / "reused.pyz", reuse_from=previous) == clean
+        assert reused == [5]
+
+        # reusing the archive being overwritten works as well
+        assert build(previous, reuse_from=previous) == clean
+        assert not (tmp_path / "previous.pyz.previous").exists()
+
+        # a missing previous build is not an error
+        assert build(tmp_path / "fresh.pyz", reuse_from=tmp_path / "missing.pyz") == clean
+
+        # entries compressed at a different level (according to the manifest) aren't reused
+        env = Environment(built_at="2019-01-01 12:12:12", shiv_version="0.0.1")
+        policy = CompressionPolicy(level=1)
+        create_archive([source], previous, sys.executable, "code:interact", env, policy=policy)
+        reused.clear()
+        assert build(tmp_path / "relevel.pyz", reuse_from=previous) == clean
+        assert reused == [0]
+
+    @pytest.mark.parametrize("chunk_size", [builder.STREAM_CHUNK_SIZE, 1024])
+    def test_create_archive_reuse_incompressible(self, tmp_path, monkeypatch, chunk_size):
+        monkeypatch.setattr(builder, "STREAM_CHUNK_SIZE", chunk_size)
+        source = populate(tmp_path / "site-packages")
+        policy = CompressionPolicy(store_ratio=0.9)
+
+        def build(target, reuse_from=None):
+            env = Environment(built_at="2019-01-01 12:12:12", shiv_version="0.0.1")
+            report = create_archive(
+                [source], target, sys.executable, "code:interact", env, reuse_from=reuse_from, policy=policy
+            )
+            return target.read_bytes(), report
+
+        previous, report = build(tmp_path / "previous.pyz")
+        assert report.compression.rules["incompressible"].entries == 3
+
+        # the random data stored as incompressible is reused as well, instead of being compressed again
+        reused, report = build(tmp_path / "reused.pyz", reuse_from=tmp_path / "previous.pyz")
+        assert reused == previous
+        assert set(report.compression.rules) == {"reused"}
+        assert report.compression.rules["reused"].entries == 6
+
+    @pytest.mark.parametrize("chunk_size", [builder.STREAM_CHUNK_SIZE, 1024])
+    def test_create_archive_reuse_other_store_ratio(self, tmp_path, monkeypatch, chunk_size):
+        monkeypatch.setattr(builder, "STREAM_CHUNK_SIZE", chunk_size)
+        source = populate(tmp_path / "site-packages")
+
+        def build(target, policy, reuse_from=None):
+            env = Environment(built_at="2019-01-01 12:12:12", shiv_version="0.0.1")
+            report = create_archive(
+                [source], target, sys.executable, "code:interact", env, reuse_from=reuse_from, policy=policy
+            )
+            return target.read_bytes(), report
+
+        build(tmp_path / "previous.pyz", CompressionPolicy())
+        clean, _ = build(tmp_path / "clean.pyz", CompressionPolicy(store_ratio=0.9))
+
+        # the previous build deflated the entries this one stores as incompressible, so none of them are reused
+        reused, report = build(tmp_path / "reused.pyz", CompressionPolicy(store_ratio=0.9), tmp_path / "previous.pyz")
+        assert reused == clean
+        assert "reused" not in report.compression.rules
+        assert report.compression.rules["incompressible"].entries == 3
+
+    @pytest.mark.parametrize("chunk_size", [builder.STREAM_CHUNK_SIZE, 1024])
+    def test_create_archive_policy(self, tmp_path, monkeypatch, env, chunk_size):
+        monkeypatch.setattr(builder, "STREAM_CHUNK_SIZE", chunk_size)
+        source = populate(tmp_path / "site-packages")
+        (source / "alpha" / "data.txt").write_text("hello world\n" * 1000)
+        target = tmp_path / "policy.pyz"
+
+        policy = CompressionPolicy(zipfile.ZIP_LZMA, store=["alpha/*"], compress=["*.txt"], store_ratio=0.9)
+        report = create_archive([source], target, sys.executable, "code:interact", env, policy=policy)
+
+        with zipfile.ZipFile(str(target)) as archive:
+            assert archive.testzip() is None
+            methods = {zinfo.filename: zinfo.compress_type for zinfo in archive.infolist()}
+
+        # N.B. globs are matched against paths relative to site-packages
+        assert methods["site-packages/alpha/__init__.py"] == zipfile.ZIP_STORED
+        assert methods["site-packages/alpha/data.txt"] == zipfile.ZIP_LZMA
+        assert methods["site-packages/beta/__init__.py"] == zipfile.ZIP_LZMA
+        assert methods["site-packages/beta/data.bin"] == zipfile.ZIP_STORED
+        assert methods["environment.json"] == zipfile.ZIP_DEFLATED
+        assert methods["__main__.py"] == zipfile.ZIP_DEFLATED
+
+        assert report.compression.rules["store:alpha/*"].entries == 2
+        assert report.compression.rules["incompressible"].entries == 2
+        assert report.compression.rules["compress:*.txt"].entries == 1
+
+        assert list(report.phases) == ["site-packages", "bootstrap", "chmod"]
+        assert report.phases["site-packages"].files == 7
+        assert sorted(report.packages) == ["alpha", "beta", "gamma"]
+        assert report.packages["alpha"].entries == 3
+        assert report.packages["beta"].size == 4096 + len("NAME = 'beta'\n" * 100)
+        assert report.packages["beta"].compressed_size < report.packages["beta"].size
+
+    @pytest.mark.parametrize("chunk_size", [builder.STREAM_CHUNK_SIZE, 1024])
+    def test_create_archive_manifest(self, tmp_path, monkeypatch, chunk_size):
+        monkeypatch.setattr(builder, "STREAM_CHUNK_SIZE", chunk_size)
+        source = populate(tmp_path / "site-packages")
+        target = tmp_path / "manifest.pyz"
+        env = Environment(built_at="2019-01-01 12:12:12", shiv_version="0.0.1", no_modify=True)
+
+        create_archive([source], target, sys.executable, "code:interact", env)
+
+        with zipfile.ZipFile(str(target)) as archive:
+            manifest = Manifest.load(archive)
+            infos = {zinfo.filename: zinfo for zinfo in archive.infolist()}
+
+        assert manifest is not None
+        assert [entry.path for entry in manifest] == [file.name for file in walk(source)]
+
+        for entry in manifest:
+            path = source / entry.path
+            zinfo = infos[f"site-packages/{entry.path}"]
+            assert entry.digest == hashlib.sha256(path.read_bytes()).hexdigest()
+            assert entry.size == zinfo.file_size == path.stat().st_size
+            assert entry.compressed_size == zinfo.compress_size
+            assert entry.mode == stat.S_IMODE(path.stat().st_mode)
+
+        assert env.build_id == manifest.build_id()
+        init_files = [Path(package, "__init__.py") for package in ("alpha", "beta", "gamma")]
+        assert env.hashes == {str(f): hashlib.sha256((source / f).read_bytes()).hexdigest() for f in init_files}
+
+    @pytest.mark.parametrize("chunk_size", [builder.STREAM_CHUNK_SIZE, 1024])
+    def test_create_archive_deduplicate(self, tmp_path, monkeypatch, chunk_size):
+        monkeypatch.setattr(builder, "STREAM_CHUNK_SIZE", chunk_size)
+        source = populate(tmp_path / "site-packages")
+        library = os.urandom(4096)
+
+        for package in ("alpha", "beta", "gamma"):
+            (source / package / "library.so").write_bytes(library)
+
+        # same contents, different permissions
+        (source / "gamma" / "library.so").chmod(0o755)
+
+        env = Environment(built_at="2019-01-01 12:12:12", shiv_version="0.0.1")
+        deduplicated = create_archive(
+            [source], tmp_path / "dedup.pyz", sys.executable, "code:interact", env, deduplicate=True
+        )
+
+        with zipfile.ZipFile(str(tmp_path / "dedup.pyz")) as archive:
+            manifest = Manifest.load(archive)
+            names = archive.namelist()
+            extract_site_packages(archive, tmp_path / "extracted")
+
+        assert manifest is not None
+        assert manifest.aliases() == {"beta/library.so": "alpha/library.so"}
+        assert "site-packages/beta/library.so" not in names
+        assert "site-packages/gamma/library.so" in names
+        assert deduplicated.compression.rules["deduplicated"].size == len(library)
+
+        # the contents of the archive, and its build id, are the same as without deduplication
+        duplicated = Environment(built_at="2019-01-01 12:12:12", shiv_version="0.0.1")
+        create_archive([source], tmp_path / "dup.pyz", sys.executable, "code:interact", duplicated)
+        assert env.build_id == duplicated.build_id
+
+        extracted = tmp_path / "extracted" / "site-packages"
+        assert [file.name for file in walk(extracted)] == [file.name for file in walk(source)]
+        assert (extracted / "beta" / "library.so").read_bytes() == library
+        assert (extracted / "beta" / "library.so").samefile(extracted / "alpha" / "library.so")
+        assert not (extracted / "gamma" / "library.so").samefile(extracted / "alpha" / "library.so")
+        assert stat.S_IMODE((extracted / "gamma" / "library.so").stat().st_mode) == 0o755
+
+    def test_create_archive_hash_algorithm(self, tmp_path):
+        source = populate(tmp_path / "site-packages")
+        env = Environment(built_at="2019-01-01 12:12:12", shiv_version="0.0.1", no_modify=True)
+
+        target = tmp_path / "blake2b.pyz"
+        create_archive([source], target, sys.executable, "code:interact", env, hash_algorithm="blake2b")
+
+        with zipfile.ZipFile(str(target)) as archive:
+            manifest = Manifest.load(archive)
+
+        assert manifest is not None and manifest.algorithm == "blake2b"
+        assert env.build_id == manifest.build_id()
+        assert env.hash_algorithm == "blake2b"
+
+        for entry in manifest:
+            assert entry.digest == hashlib.blake2b((source / entry.path).read_bytes()).hexdigest()
+
+    def test_create_archive_preserve_symlinks(self, tmp_path, env):
+        source = populate(tmp_path / "site-packages")
+        library = os.urandom(4096)
+        (source / "alpha" / "libfoo.so.1.2").write_bytes(library)
+        (source / "alpha" / "libfoo.so").symlink_to("libfoo.so.1.2")
+        (source / "alpha" / "data").mkdir()
+        (source / "alpha" / "data" / "table.csv").write_text("a,b\n")
+        # absolute symlinks inside the tree are made relative
+        (source / "beta" / "data").symlink_to(source / "alpha" / "data", target_is_directory=True)
+        # symlinks pointing outside the tree are followed, as usual
+        (tmp_path / "outside.txt").write_text("outside")
+        (source / "gamma" / "outside.txt").symlink_to(tmp_path / "outside.txt")
+
+        target = tmp_path / "symlinks.pyz"
+        create_archive([source], target, sys.executable, "code:interact", env, preserve_symlinks=True)
+
+        with zipfile.ZipFile(str(target)) as archive:
+            infos = {zinfo.filename[len("site-packages/"):]: zinfo for zinfo in archive.infolist()}
+            symlinks = {
+                name: archive.read(zinfo) for name, zinfo in infos.items() if stat.S_ISLNK(zinfo.external_attr >> 16)
+            }
+            manifest = Manifest.load(archive)
+            extract_site_packages(archive, tmp_path / "extracted")
+
+        assert symlinks == {"alpha/libfoo.so": b"libfoo.so.1.2", "beta/data": b"../alpha/data"}
+        assert "beta/data/table.csv" not in infos
+        assert infos["gamma/outside.txt"].file_size == len("outside")
+        assert manifest is not None and manifest.get("beta/data").mode == stat.S_IFLNK | 0o777
+
+        extracted = tmp_path / "extracted" / "site-packages"
+        assert os.readlink(extracted / "alpha" / "libfoo.so") == "libfoo.so.1.2"
+        assert (extracted / "alpha" / "libfoo.so").read_bytes() == library
+        assert (extracted / "beta" / "data" / "table.csv").read_text() == "a,b\n"
+        assert not (extracted / "gamma" / "outside.txt").is_symlink()
+
+    def test_create_archive_preserve_symlinks_follows(self, tmp_path, env):
+        source = populate(tmp_path / "site-packages")
+        (source / "alpha" / "data").mkdir()
+        (source / "alpha" / "data" / "table.csv").write_text("a,b\n")
+        (source / "alpha" / "module.pyc").write_bytes(b"bytecode")
+        (source / "gamma" / "kept.py").symlink_to("__init__.py")
+        # the target is in the other layer, which is extracted to another directory
+        (source / "beta" / "alpha.py").symlink_to("../alpha/__init__.py")
+        # the targets aren't archived
+        (source / "gamma" / "data").symlink_to("../alpha/data", target_is_directory=True)
+        (source / "gamma" / "bytecode").symlink_to("../alpha/module.pyc")
+
+        env.app_layer = ["alpha"]
+        target = tmp_path / "symlinks.pyz"
+        pruning = PruningPolicy(exclude=["alpha/data/*"])
+        create_archive(
+            [source], target, sys.executable, "code:interact", env, preserve_symlinks=True, pruning=pruning
+        )
+
+        with zipfile.ZipFile(str(target)) as archive:
+            infos = {zinfo.filename[len("site-packages/"):]: zinfo for zinfo in archive.infolist()}
+            symlinks = {name for name, zinfo in infos.items() if stat.S_ISLNK(zinfo.external_attr >> 16)}
+
+            assert symlinks == {"gamma/kept.py"}
+            assert archive.read("site-packages/beta/alpha.py") == (source / "alpha" / "__init__.py").read_bytes()
+            assert archive.read("site-packages/gamma/data/table.csv") == b"a,b\n"
+            assert archive.read("site-packages/gamma/bytecode") == b"bytecode"
+            assert "site-packages/alpha/data/table.csv" not in infos
+
+    def test_create_archive_pruning(self, tmp_path, env):
+        source = populate(tmp_path / "site-packages")
+        (source / "alpha" / "tests").mkdir()
+        (source / "alpha" / "tests" / "test_alpha.py").write_text("def test():\n    pass\n")
+        (source / "alpha" / "tests" / "fixture.json").write_text("{}")
+        (source / "beta" / "README.md").write_text("# beta\n")
+
+        target = tmp_path / "pruned.pyz"
+        pruning = PruningPolicy(exclude=["*.md"], include=["*/fixture.json"], presets=["strip-tests"])
+        report = create_archive([source], target, sys.executable, "code:interact", env, pruning=pruning)
+
+        with zipfile.ZipFile(str(target)) as archive:
+            names = [name for name in archive.namelist() if name.startswith("site-packages/")]
+
+        assert "site-packages/alpha/tests/fixture.json" in names
+        assert "site-packages/alpha/tests/test_alpha.py" not in names
+        assert "site-packages/beta/README.md" not in names
+        assert len(names) == len(list(walk(source))) - 2
+
+        assert report.pruned["strip-tests"].files == 1
+        assert report.pruned["strip-tests"].bytes == len("def test():\n    pass\n")
+        assert report.pruned["exclude:*.md"].files == 1
+
+    def test_create_archive_stripped(self, tmp_path, env):
+        source = populate(tmp_path / "site-packages")
+        (source / "alpha" / "_speedups.so").write_bytes(b"with debug information")
+        stripped = tmp_path / "stripped"
+        (stripped / "alpha").mkdir(parents=True)
+        (stripped / "alpha" / "_speedups.so").write_bytes(b"stripped")
+
+        target = tmp_path / "stripped.pyz"
+        create_archive([source], target, sys.executable, "code:interact", env, stripped=stripped)
+
+        with zipfile.ZipFile(str(target)) as archive:
+            names = [name for name in archive.namelist() if name.startswith("site-packages/")]
+
+            assert names.count("site-packages/alpha/_speedups.so") == 1
+            assert archive.read("site-packages/alpha/_speedups.so") == b"stripped"
+            assert len(names) == len(list(walk(source)))
+
+    def test_create_archive_memory_is_flat(self, tmp_path, env):
+        source = tmp_path / "site-packages"
+        source.mkdir()
+
+        with (source / "large.bin").open("wb") as f:
+            for _ in range(32):
+                f.write(os.urandom(1024 * 1024))
+
+        tracemalloc.start()
+        try:
+            create_archive([source], tmp_path / "large.pyz", sys.executable, "code:interact", env, workers=1)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        # a 32MB file should never be held in memory at once
+        assert peak < 8 * 1024 * 1024
@@ -0,0 +1,50 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+from shiv.bytecode import compile_bytecode
+
+
+class TestBytecode:
+    @pytest.fixture
+    def site_packages(self, tmp_path):
+        site_packages = tmp_path / "site-packages"
+        (site_packages / "pkg").mkdir(parents=True)
+        (site_packages / "bin").mkdir()
+        (site_packages / "pkg" / "__init__.py").write_text("")
+        (site_packages / "pkg" / "module.py").write_text("VALUE = 42\n")
+        (site_packages / "pkg" / "broken.py").write_text("def broken(:\n")
+        (site_packages / "bin" / "script.py").write_text("print('hi')\n")
+        return site_packages
+
+    @pytest.mark.parametrize("workers", [1, 4])
+    def test_compile_bytecode(self, tmp_path, site_packages, workers):
+        target = tmp_path / "bytecode"
+
+        tag = compile_bytecode([site_packages], target, sys.executable, optimize=(0, 1), workers=workers)
+
+        assert tag == sys.implementation.cache_tag
+        assert sorted(str(path.relative_to(target)) for path in target.rglob("*.pyc")) == sorted(
+            importlib.util.cache_from_source(os.path.join("pkg", f"{name}.py"), optimization=opt)
+            for name in ("__init__", "module")
+            for opt in ("", 1)
+        )
+
+        # hash based pycs, i.e. reproducible ones, have their flags set
+        data = (target / importlib.util.cache_from_source(os.path.join("pkg", "module.py"))).read_bytes()
+        assert data[:4] == importlib.util.MAGIC_NUMBER
+        assert int.from_bytes(data[4:8], "little") == 0b11
+
+    def test_compile_legacy(self, tmp_path, site_packages):
+        target = tmp_path / "bytecode"
+
+        compile_bytecode([site_packages], target, sys.executable, legacy=True)
+
+        assert sorted(path.name for path in target.rglob("*.pyc")) == ["__init__.pyc", "module.pyc"]
+        assert not (target / "pkg" / "__pycache__").exists()
+
+    def test_compile_error(self, tmp_path, site_packages):
+        with pytest.raises(SystemExit):
+            compile_bytecode([site_packages], tmp_path / "bytecode", str(tmp_path / "no-such-python"))
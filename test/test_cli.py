@@ -2,22 +2,49 @@ import contextlib
 import hashlib
 import json
 import os
+import shutil
 import stat
 import subprocess
 import sys
+import sysconfig
+import zipfile
 
 from pathlib import Path
 
 import pytest
 
 from click.testing import CliRunner
-from shiv.cli import console_script_exists, find_entry_point, main
-from shiv.constants import DISALLOWED_ARGS, DISALLOWED_PIP_ARGS, NO_OUTFILE, NO_PIP_ARGS_OR_SITE_PACKAGES
+from shiv import cli
+from shiv.cli import console_script_exists, copytree, find_entry_point, main, stage_install
+from shiv.constants import (
+    DIRECT_WHEELS_ERROR,
+    DISALLOWED_ARGS,
+    DISALLOWED_PIP_ARGS,
+    NO_OUTFILE,
+    NO_PIP_ARGS_OR_SITE_PACKAGES,
+    SOURCELESS_ERROR,
+    TREE_SHAKE_ERROR,
+)
 from shiv.info import main as info_main
 from shiv.pip import install
 
 UGOX = stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH
 
+# An extension module calling into a shared library it is linked to.
+EXTENSION_SOURCE = """\
+#include <Python.h>
+
+int dep_answer(void);
+
+static PyObject *answer(PyObject *self, PyObject *args) { return PyLong_FromLong(dep_answer()); }
+
+static PyMethodDef methods[] = {{"answer", answer, METH_NOARGS, NULL}, {NULL, NULL, 0, NULL}};
+
+static struct PyModuleDef module = {PyModuleDef_HEAD_INIT, "_ext", NULL, -1, methods};
+
+PyMODINIT_FUNC PyInit__ext(void) { return PyModule_Create(&module); }
+"""
+
 
 @contextlib.contextmanager
 def mocked_sys_prefix():
@@ -70,6 +97,50 @@ class TestCLI:
 
         assert console_script_exists([empty_dir, install_dir], "hello.exe" if os.name == "nt" else "hello")
 
+    @pytest.mark.parametrize("unsupported", [(), ("reflink",), ("reflink", "hardlink")])
+    def test_copytree(self, tmp_path, monkeypatch, unsupported):
+        def fail(*args):
+            raise OSError("not supported")
+
+        if "reflink" in unsupported:
+            monkeypatch.setattr(cli, "reflink", fail)
+
+        if "hardlink" in unsupported:
+            monkeypatch.setattr(os, "link", fail)
+
+        first, second, dst = tmp_path / "first", tmp_path / "second", tmp_path / "dst"
+        (first / "pkg").mkdir(parents=True)
+        (first / "pkg" / "__init__.py").write_text("first")
+        (first / "pkg" / "module.py").write_text("module")
+        (first / "pkg" / "module.py").chmod(0o640)
+        (second / "pkg").mkdir(parents=True)
+        (second / "pkg" / "__init__.py").write_text("second")
+
+        first_counts = copytree(first, dst, workers=2)
+        second_counts = copytree(second, dst)
+
+        assert sum(first_counts.values()) == 2
+        assert all(first_counts[method] == 0 for method in unsupported)
+        assert second_counts == {**dict.fromkeys(first_counts, 0), max(first_counts, key=first_counts.get): 1}
+
+        # later sources win, without writing through to the earlier ones
+        assert (dst / "pkg" / "__init__.py").read_text() == "second"
+        assert (first / "pkg" / "__init__.py").read_text() == "first"
+        assert (dst / "pkg" / "module.py").read_text() == "module"
+        assert stat.S_IMODE((dst / "pkg" / "module.py").stat().st_mode) == 0o640
+
+    def test_copytree_preserve_symlinks(self, tmp_path):
+        src, dst = tmp_path / "src", tmp_path / "dst"
+        (src / "pkg").mkdir(parents=True)
+        (src / "pkg" / "libfoo.so.1").write_text("library")
+        (src / "pkg" / "libfoo.so").symlink_to(src / "pkg" / "libfoo.so.1")
+
+        counts = copytree(src, dst, preserve_symlinks=True)
+
+        assert counts["symlink"] == 1
+        assert os.readlink(dst / "pkg" / "libfoo.so") == "libfoo.so.1"
+        assert (dst / "pkg" / "libfoo.so").read_text() == "library"
+
     def test_no_args(self, runner):
         """This should fail with a warning about supplying pip arguments"""
 
@@ -209,6 +280,406 @@ class TestCLI:
         proc = subprocess.run([str(output_file)], stdout=subprocess.PIPE, shell=True, env=os.environ)
         assert "hello!" in proc.stdout.decode()
 
+    def test_app_layer(self, shiv_root, runner):
+        output_file = shiv_root / "test_layers.pyz"
+        deps_dir = shiv_root / "deps"
+        deps_dir.mkdir()
+        (deps_dir / "hello.py").write_text("def hello(name):\n    print(f'hello {name}!')\n")
+        app_dir = shiv_root / "app"
+        app_dir.mkdir()
+
+        def extracted(layer):
+            return sorted(path.name for path in shiv_root.glob(f"test_layers.pyz_{layer}_*"))
+
+        for name in ("world", "layers"):
+            (app_dir / "hello_app.py").write_text(f"from hello import hello\ndef main():\n    hello({name!r})\n")
+            result = runner(
+                [
+                    "-e",
+                    "hello_app:main",
+                    "-o",
+                    str(output_file),
+                    "--app-layer",
+                    "hello_app*",
+                    "--site-packages",
+                    str(deps_dir),
+                    "--site-packages",
+                    str(app_dir),
+                ]
+            )
+            assert result.exit_code == 0
+
+            proc = subprocess.run([str(output_file)], stdout=subprocess.PIPE, shell=True, env=os.environ)
+            assert proc.stdout.decode().strip() == f"hello {name}!"
+
+        # only the application layer was extracted again
+        assert len(extracted("app")) == 2
+        assert len(extracted("deps")) == 1
+        assert [path.name for path in shiv_root.glob("test_layers.pyz_deps_*/site-packages/*")] == ["hello.py"]
+
+    def test_tree_shake(self, shiv_root, runner):
+        output_file = shiv_root / "test_tree_shake.pyz"
+        package_dir = shiv_root / "package"
+        package_dir.mkdir()
+        (package_dir / "hello.py").write_text("from greeting import text\ndef main():\n    print(text)\n")
+        (package_dir / "greeting.py").write_text("text = 'hello!'\n")
+        (package_dir / "unused.py").write_text("import greeting\n")
+        (package_dir / "plugin.py").write_text("")
+
+        result = runner(
+            [
+                "-e",
+                "hello:main",
+                "-o",
+                str(output_file),
+                "--site-packages",
+                str(package_dir),
+                "--tree-shake",
+                "--keep",
+                "plugin",
+            ]
+        )
+
+        assert result.exit_code == 0
+        assert "Left out unused.py: unused is never imported" in result.output
+
+        with zipfile.ZipFile(str(output_file)) as archive:
+            names = archive.namelist()
+
+        assert "site-packages/unused.py" not in names
+        assert {"site-packages/greeting.py", "site-packages/plugin.py"} <= set(names)
+
+        proc = subprocess.run([str(output_file)], stdout=subprocess.PIPE, shell=True, env=os.environ)
+        assert "hello!" in proc.stdout.decode()
+
+    def test_import_profile(self, shiv_root, runner, tmp_path):
+        output_file = shiv_root / "test_import_profile.pyz"
+        package_dir = shiv_root / "package"
+        package_dir.mkdir()
+        (package_dir / "hello.py").write_text(
+            "import importlib\ndef main():\n    print(importlib.import_module('greeting').text)\n"
+        )
+        (package_dir / "greeting.py").write_text("text = 'hello!'\n")
+        (package_dir / "unused.py").write_text("")
+        profile = tmp_path / "imports.txt"
+
+        args = ["-e", "hello:main", "-o", str(output_file), "--site-packages", str(package_dir)]
+        assert runner(args).exit_code == 0
+
+        env = {**os.environ, "SHIV_RECORD_IMPORTS": str(profile)}
+        proc = subprocess.run([str(output_file)], stdout=subprocess.PIPE, shell=True, env=env)
+        assert "hello!" in proc.stdout.decode()
+        assert {"hello.py", "greeting.py"} <= set(profile.read_text().splitlines())
+
+        result = runner(args + ["--import-profile", str(profile)])
+
+        assert result.exit_code == 0
+        assert "Import profile: left out 1 files" in result.output
+
+        with zipfile.ZipFile(str(output_file)) as archive:
+            names = archive.namelist()
+
+        assert "site-packages/unused.py" not in names
+        assert "site-packages/greeting.py" in names
+
+        proc = subprocess.run([str(output_file)], stdout=subprocess.PIPE, shell=True, env=os.environ)
+        assert "hello!" in proc.stdout.decode()
+
+    @pytest.mark.skipif(not sys.platform.startswith("linux") or shutil.which("cc") is None, reason="requires ELF, cc")
+    def test_import_profile_vendored_library(self, shiv_root, runner, tmp_path):
+        output_file = shiv_root / "test_import_profile.pyz"
+        package_dir = shiv_root / "package"
+        (package_dir / "pkg").mkdir(parents=True)
+        (package_dir / "pkg.libs").mkdir()
+        (package_dir / "pkg" / "__init__.py").write_text("")
+        (package_dir / "hello.py").write_text("from pkg import _ext\ndef main():\n    print(_ext.answer())\n")
+        (tmp_path / "libdep.c").write_text("int dep_answer(void) { return 42; }\n")
+        (tmp_path / "ext.c").write_text(EXTENSION_SOURCE)
+
+        # an extension module linked to a library vendored the way auditwheel does it, only opened by the loader
+        libs = package_dir / "pkg.libs"
+        subprocess.run(
+            ["cc", "-shared", "-fPIC", "-o", str(libs / "libdep.so"), str(tmp_path / "libdep.c")], check=True
+        )
+        subprocess.run(
+            [
+                "cc",
+                "-shared",
+                "-fPIC",
+                f"-I{sysconfig.get_paths()['include']}",
+                "-o",
+                str(package_dir / "pkg" / "_ext.so"),
+                str(tmp_path / "ext.c"),
+                f"-L{libs}",
+                "-ldep",
+                "-Wl,-rpath,$ORIGIN/../pkg.libs",
+            ],
+            check=True,
+        )
+
+        profile = tmp_path / "imports.txt"
+        args = ["-e", "hello:main", "-o", str(output_file), "--site-packages", str(package_dir)]
+        assert runner(args).exit_code == 0
+
+        env = {**os.environ, "SHIV_RECORD_IMPORTS": str(profile)}
+        proc = subprocess.run([str(output_file)], stdout=subprocess.PIPE, shell=True, env=env)
+        assert proc.stdout.decode().strip() == "42"
+        assert {"pkg/_ext.so", "pkg.libs/libdep.so"} <= set(profile.read_text().splitlines())
+
+        # the library is kept, even without the profile recording it
+        profile.write_text("hello.py\npkg/__init__.py\npkg/_ext.so\n")
+        result = runner(args + ["--import-profile", str(profile)])
+        assert result.exit_code == 0, result.output
+
+        with zipfile.ZipFile(str(output_file)) as archive:
+            assert "site-packages/pkg.libs/libdep.so" in archive.namelist()
+
+        proc = subprocess.run([str(output_file)], stdout=subprocess.PIPE, shell=True, env=os.environ)
+        assert proc.stdout.decode().strip() == "42"
+
+    @pytest.mark.skipif(
+        shutil.which("cc") is None or shutil.which("strip") is None, reason="requires a C compiler and binutils"
+    )
+    def test_strip_debug(self, shiv_root, runner):
+        output_file = shiv_root / "test_strip_debug.pyz"
+        package_dir = shiv_root / "package"
+        package_dir.mkdir()
+        (package_dir / "hello.py").write_text("def main():\n    print('hello!')\n")
+        (package_dir / "native.c").write_text("int answer(void) { return 42; }\n")
+        subprocess.run(
+            ["cc", "-g", "-shared", "-fPIC", "-o", str(package_dir / "native.so"), str(package_dir / "native.c")],
+            check=True,
+        )
+        size = (package_dir / "native.so").stat().st_size
+
+        result = runner(
+            ["-e", "hello:main", "-o", str(output_file), "--site-packages", str(package_dir), "--strip-debug"]
+        )
+
+        assert result.exit_code == 0
+        assert "Stripped debug information from 1 native extensions" in result.output
+
+        with zipfile.ZipFile(str(output_file)) as archive:
+            assert archive.getinfo("site-packages/native.so").file_size < size
+
+        assert (package_dir / "native.so").stat().st_size == size
+
+    def test_tree_shake_requires_entry_point(self, runner):
+        result = runner(["-o", "test.pyz", "--tree-shake", "--site-packages", "."])
+
+        assert result.exit_code == 1
+        assert TREE_SHAKE_ERROR in result.output
+
+    def test_output_to_stdout(self, shiv_root, runner):
+        package_dir = shiv_root / "package"
+        package_dir.mkdir()
+        (package_dir / "hello.py").write_text("def main():\n    print('hello!')\n")
+
+        result = runner(["-e", "hello:main", "-o", "-", "--site-packages", str(package_dir), "--timings"])
+
+        assert result.exit_code == 0
+        assert result.stdout_bytes.startswith(b"#!/usr/bin/env python3\n")
+        assert "total: " in result.stderr
+
+        output_file = shiv_root / "streamed.pyz"
+        output_file.write_bytes(result.stdout_bytes)
+        output_file.chmod(output_file.stat().st_mode | UGOX)
+
+        proc = subprocess.run([str(output_file)], stdout=subprocess.PIPE, shell=True, env=os.environ)
+        assert "hello!" in proc.stdout.decode()
+
+    def test_compression_policy(self, shiv_root, runner):
+        output_file = shiv_root / "test_compression.pyz"
+        package_dir = shiv_root / "package"
+        package_dir.mkdir()
+        (package_dir / "hello.py").write_text("def main():\n    print('hello!')\n")
+        (package_dir / "data.bin").write_bytes(os.urandom(4096))
+
+        result = runner(
+            [
+                "-e",
+                "hello:main",
+                "-o",
+                str(output_file),
+                "--site-packages",
+                str(package_dir),
+                "--compression-method",
+                "bzip2",
+                "--compression-level",
+                "9",
+                "--store",
+                "*.bin",
+                "--compression-report",
+            ]
+        )
+
+        assert result.exit_code == 0
+        assert "store:*.bin: 1 entries, 4096 bytes -> 4096 bytes" in result.output
+
+        with zipfile.ZipFile(str(output_file)) as archive:
+            assert archive.getinfo("site-packages/hello.py").compress_type == zipfile.ZIP_BZIP2
+            assert archive.getinfo("site-packages/data.bin").compress_type == zipfile.ZIP_STORED
+
+        proc = subprocess.run([str(output_file)], stdout=subprocess.PIPE, shell=True, env=os.environ)
+        assert "hello!" in proc.stdout.decode()
+
+    def test_output_cache(self, shiv_root, runner, monkeypatch):
+        package_dir = shiv_root / "package"
+        package_dir.mkdir()
+        (package_dir / "hello.py").write_text("def main():\n    print('hello!')\n")
+        cache = shiv_root / "cache"
+
+        def build(output_file, *args):
+            result = runner(
+                ["-e", "hello:main", "-o", str(shiv_root / output_file), "--site-packages", str(package_dir)]
+                + ["--output-cache", str(cache), "--cache-report", *args]
+            )
+            assert result.exit_code == 0
+            return result.output.strip()
+
+        assert build("first.pyz", "--reproducible").startswith("Output cache miss: ")
+        assert build("not_reproducible.pyz") == "Output cache: build not cacheable"
+
+        # an identical build is copied from the cache, rather than built
+        monkeypatch.setattr(cli.builder, "create_archive", None)
+        assert build("second.pyz", "--reproducible").startswith("Output cache hit: ")
+        assert (shiv_root / "second.pyz").read_bytes() == (shiv_root / "first.pyz").read_bytes()
+        assert os.access(shiv_root / "second.pyz", os.X_OK)
+
+        proc = subprocess.run([str(shiv_root / "second.pyz")], stdout=subprocess.PIPE, shell=True, env=os.environ)
+        assert "hello!" in proc.stdout.decode()
+
+    def test_build_report(self, shiv_root, runner):
+        output_file = shiv_root / "test_report.pyz"
+        report_file = shiv_root / "report.json"
+        package_dir = shiv_root / "package"
+        package_dir.mkdir()
+        (package_dir / "hello.py").write_text("def main():\n    print('hello!')\n")
+
+        result = runner(
+            [
+                "-e",
+                "hello:main",
+                "-o",
+                str(output_file),
+                "--site-packages",
+                str(package_dir),
+                "--timings",
+                "--build-report",
+                str(report_file),
+            ]
+        )
+
+        assert result.exit_code == 0
+        assert "site-packages: " in result.output
+        assert "total: " in result.output
+
+        report = json.loads(report_file.read_text())
+        assert list(report["phases"]) == ["site-packages", "bootstrap", "chmod"]
+        assert report["packages"]["hello.py"]["entries"] == 1
+        assert report["slowest"][0]["name"] == "hello.py"
+
+    def test_install_cache(self, shiv_root, runner, wheelhouse, tmp_path, monkeypatch):
+        cache = tmp_path / "cache"
+        wheel = str(next(wheelhouse.glob("*.whl")))
+
+        result = runner(["-e", "hello:main", "-o", str(shiv_root / "first.pyz"), "--install-cache", str(cache), wheel])
+        assert result.exit_code == 0
+        assert len(list(cache.iterdir())) == 1
+
+        # a cache hit doesn't run pip install at all
+        monkeypatch.setattr(cli.pip, "install", None)
+        result = runner(["-e", "hello:main", "-o", str(shiv_root / "second.pyz"), "--install-cache", str(cache), wheel])
+        assert result.exit_code == 0
+        assert "Using cached install" in result.output
+
+        proc = subprocess.run([sys.executable, str(shiv_root / "second.pyz")], stdout=subprocess.PIPE, env=os.environ)
+        assert proc.stdout.decode().strip() == "hello world"
+
+    def test_install_cache_keeps_site_packages(self, shiv_root, runner, wheelhouse, tmp_path):
+        cache, site_packages = tmp_path / "cache", tmp_path / "site-packages"
+        wheel = str(next(wheelhouse.glob("*.whl")))
+        site_packages.mkdir()
+        (site_packages / "hello.py").write_text("def main():\n    print('from site-packages')\n")
+
+        # like pip install --target, existing top-level names are kept, with or without (a cold or warm) cache
+        for name in ("pip", "cold", "warm"):
+            target = shiv_root / f"{name}.pyz"
+            args = ["-e", "hello:main", "-o", str(target), "--site-packages", str(site_packages)]
+            result = runner([*args, *(["--install-cache", str(cache)] if name != "pip" else []), wheel])
+            assert result.exit_code == 0, result.output
+
+            with zipfile.ZipFile(str(target)) as archive:
+                assert b"from site-packages" in archive.read("site-packages/hello.py")
+
+    def test_stage_install(self, tmp_path):
+        install, dst = tmp_path / "install", tmp_path / "dst"
+        (install / "pkg").mkdir(parents=True)
+        (install / "pkg" / "new.py").write_text("new")
+        (install / "other.py").write_text("other")
+        (dst / "pkg").mkdir(parents=True)
+        (dst / "pkg" / "old.py").write_text("old")
+
+        stage_install(install, dst)
+        assert sorted(str(path.relative_to(dst)) for path in dst.rglob("*.py")) == ["other.py", "pkg/old.py"]
+
+        stage_install(install, dst, upgrade=True)
+        assert sorted(str(path.relative_to(dst)) for path in dst.rglob("*.py")) == ["other.py", "pkg/new.py"]
+
+    @pytest.mark.parametrize("by_url", [False, True])
+    def test_direct_wheels(self, shiv_root, runner, wheelhouse, by_url):
+        requirement = [str(next(wheelhouse.glob("*.whl")))] if by_url else ["--find-links", str(wheelhouse), "hello"]
+        args = ["-e", "hello:main", "--reproducible", "--no-index", *requirement]
+
+        assert runner(["-o", str(shiv_root / "pip.pyz"), *args]).exit_code == 0
+        assert runner(["-o", str(shiv_root / "direct.pyz"), "--direct-wheels", *args]).exit_code == 0
+
+        # reading the wheels directly gives the very same result as installing them first
+        assert (shiv_root / "direct.pyz").read_bytes() == (shiv_root / "pip.pyz").read_bytes()
+
+        proc = subprocess.run([sys.executable, str(shiv_root / "direct.pyz")], stdout=subprocess.PIPE, env=os.environ)
+        assert proc.stdout.decode().strip() == "hello world"
+
+    def test_direct_wheels_requires_wheels(self, shiv_root, runner, package_location):
+        output_file = shiv_root / "test.pyz"
+        result = runner(["-e", "hello:main", "-o", str(output_file), "--direct-wheels", str(package_location)])
+
+        assert result.exit_code == 1
+        assert DIRECT_WHEELS_ERROR.format(url=package_location.as_uri()) in result.output
+
+    @pytest.mark.parametrize("sourceless", [False, True])
+    def test_precompile(self, shiv_root, runner, sourceless):
+        output_file = shiv_root / "test_precompile.pyz"
+        package_dir = shiv_root / "package"
+        package_dir.mkdir()
+        (package_dir / "hello.py").write_text("import sys\ndef main():\n    print(sys.modules[__name__].__cached__)\n")
+
+        args = ["-e", "hello:main", "-o", str(output_file), "--site-packages", str(package_dir)]
+        args += ["--precompile", sys.executable]
+        args += ["--sourceless"] if sourceless else ["--optimize", "0", "--optimize", "2"]
+        result = runner(args)
+
+        assert result.exit_code == 0
+
+        tag = sys.implementation.cache_tag
+        pyc = "site-packages/hello.pyc" if sourceless else f"site-packages/__pycache__/hello.{tag}.pyc"
+
+        with zipfile.ZipFile(str(output_file)) as archive:
+            names = archive.namelist()
+
+        assert pyc in names
+        assert ("site-packages/hello.py" in names) is not sourceless
+        assert (f"site-packages/__pycache__/hello.{tag}.opt-2.pyc" in names) is not sourceless
+
+        proc = subprocess.run([sys.executable, str(output_file)], stdout=subprocess.PIPE, env=os.environ)
+        assert proc.stdout.decode().strip().endswith(pyc.split("/", 1)[1].replace("/", os.sep))
+
+    def test_sourceless_requires_one_interpreter(self, runner):
+        result = runner(["-e", "hello:main", "-o", "test.pyz", "--sourceless", "--site-packages", "."])
+
+        assert result.exit_code == 1
+        assert SOURCELESS_ERROR in result.output
+
     def test_no_entrypoint(self, shiv_root, runner, package_location):
 
         output_file = shiv_root / "test.pyz"
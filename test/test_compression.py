@@ -0,0 +1,67 @@
+import os
+import zipfile
+
+import pytest
+
+from shiv.compression import (
+    DEFAULT_RULE,
+    INCOMPRESSIBLE_RULE,
+    CompressionPolicy,
+    CompressionReport,
+    Decision,
+    compress,
+)
+
+
+class TestCompressionPolicy:
+    def test_decide(self):
+        policy = CompressionPolicy(level=9, store=["*.so", "*.whl"], compress=["*/important.so"])
+
+        assert policy.decide("site-packages/foo/__init__.py") == Decision(zipfile.ZIP_DEFLATED, 9, DEFAULT_RULE)
+        assert policy.decide("site-packages/foo/_speedups.so") == Decision(zipfile.ZIP_STORED, None, "store:*.so")
+        assert policy.decide("site-packages/foo/important.so") == Decision(
+            zipfile.ZIP_DEFLATED, 9, "compress:*/important.so"
+        )
+
+    def test_decide_uncompressed(self):
+        policy = CompressionPolicy(zipfile.ZIP_STORED, compress=["*.txt"])
+
+        assert policy.decide("foo.py") == Decision(zipfile.ZIP_STORED, None, DEFAULT_RULE)
+        assert policy.decide("foo.txt").compression == zipfile.ZIP_DEFLATED
+
+    def test_apply_stores_incompressible_data(self):
+        policy = CompressionPolicy(store_ratio=0.9)
+        random = os.urandom(4096)
+        text = b"hello world\n" * 1000
+
+        assert policy.apply("random.bin", random) == (Decision(zipfile.ZIP_STORED, None, INCOMPRESSIBLE_RULE), random)
+        assert policy.apply("text.txt", text) == (
+            Decision(zipfile.ZIP_DEFLATED, None, DEFAULT_RULE),
+            compress(text, zipfile.ZIP_DEFLATED),
+        )
+
+    @pytest.mark.parametrize("method", [zipfile.ZIP_DEFLATED, zipfile.ZIP_BZIP2, zipfile.ZIP_LZMA])
+    def test_compress_matches_zipfile(self, tmp_path, method):
+        data = b"hello world\n" * 1000
+        zinfo = zipfile.ZipInfo("hello.txt", date_time=(2019, 1, 1, 12, 12, 12))
+        zinfo.compress_type = method
+
+        with zipfile.ZipFile(str(tmp_path / "test.zip"), "w") as archive:
+            archive.writestr(zinfo, data)
+
+        assert compress(data, method) in (tmp_path / "test.zip").read_bytes()
+
+
+class TestCompressionReport:
+    def test_lines(self):
+        report = CompressionReport()
+        report.record(DEFAULT_RULE, 1000, 100, 1.0)
+        report.record(DEFAULT_RULE, 1000, 100, 1.0)
+        report.record("store:*.so", 500, 500)
+
+        assert report.throughput == 1000
+        assert report.lines() == [
+            "default: 2 entries, 2000 bytes -> 200 bytes in 2.00s",
+            "store:*.so: 1 entries, 500 bytes -> 500 bytes in 0.00s (saved ~0.50s of compression)",
+            "total: 2500 bytes -> 700 bytes",
+        ]
@@ -0,0 +1,46 @@
+from shiv.entry_points import ConsoleScript, ConsoleScriptIndex, parse_console_scripts
+
+
+def write_entry_points(directory, text):
+    directory.mkdir(parents=True)
+    (directory / "entry_points.txt").write_text(text)
+
+
+class TestConsoleScriptIndex:
+    def test_parse_console_scripts(self):
+        text = (
+            "[console_scripts]\nMyTool = pkg.cli:main\nother=pkg:run %s\nextra = pkg.cli:main [cli, color]\n"
+            "[gui_scripts]\ngui = pkg:gui\n"
+        )
+
+        assert parse_console_scripts(text, "pkg-1.0.dist-info") == [
+            ConsoleScript("MyTool", "pkg.cli:main", "pkg-1.0.dist-info"),
+            ConsoleScript("other", "pkg:run %s", "pkg-1.0.dist-info"),
+            ConsoleScript("extra", "pkg.cli:main", "pkg-1.0.dist-info"),
+        ]
+        assert parse_console_scripts("not an ini file", "broken.dist-info") == []
+
+    def test_build(self, tmp_path):
+        first, second = tmp_path / "first", tmp_path / "second"
+        write_entry_points(first / "alpha-1.0.dist-info", "[console_scripts]\nalpha = alpha:main\nshared = alpha:f\n")
+        write_entry_points(first / "beta-1.0.egg-info", "[console_scripts]\nbeta = beta:main\n")
+        write_entry_points(second / "gamma-1.0.dist-info", "[console_scripts]\nshared = gamma:main\n")
+        write_entry_points(second / "delta-1.0.dist-info", "[console_scripts]\nalpha = alpha:main\n")
+        (second / "bin").mkdir()
+        (second / "bin" / "script.sh").write_text("")
+
+        # only the metadata of installed distributions is read, not vendored test data
+        write_entry_points(first / "alpha" / "tests" / "data", "[console_scripts]\nstray = tests:main\n")
+
+        index = ConsoleScriptIndex.build([first, second, tmp_path / "missing"])
+
+        assert index.entry_points == {
+            "alpha": "alpha:main",
+            "shared": "gamma:main",
+            "beta": "beta:main",
+        }
+        assert list(index.conflicts) == ["shared"]
+        origins = [script.origin for script in index.conflicts["shared"]]
+        assert origins == ["alpha-1.0.dist-info", "gamma-1.0.dist-info"]
+        assert index.exists("script.sh")
+        assert not index.exists("alpha")
@@ -0,0 +1,56 @@
+from shiv import pip
+from shiv.output_cache import OutputCache, output_key, tree_digest
+
+
+class TestOutputCache:
+    def test_tree_digest(self, tmp_path):
+        (tmp_path / "package").mkdir()
+        (tmp_path / "package" / "module.py").write_text("")
+        digest = tree_digest(tmp_path)
+
+        assert tree_digest(tmp_path) == digest
+
+        # contents, permissions and names all change the digest
+        (tmp_path / "package" / "module.py").write_text("VALUE = 1\n")
+        assert tree_digest(tmp_path) != digest
+        digest = tree_digest(tmp_path)
+
+        (tmp_path / "package" / "module.py").chmod(0o755)
+        assert tree_digest(tmp_path) != digest
+        digest = tree_digest(tmp_path)
+
+        (tmp_path / "package" / "module.py").rename(tmp_path / "package" / "other.py")
+        assert tree_digest(tmp_path) != digest
+
+    def test_output_key(self, tmp_path, monkeypatch):
+        site_packages = tmp_path / "site-packages"
+        site_packages.mkdir()
+        (site_packages / "module.py").write_text("")
+        directory = {"metadata": {"name": "local", "version": "1.0"}, "download_info": {"url": tmp_path.as_uri()}}
+        monkeypatch.setattr(pip, "resolve", lambda args: [directory] if args == ["."] else None)
+
+        key = output_key({"compressed": True}, [], [site_packages])
+
+        assert key is not None
+        assert output_key({"compressed": True}, [], [site_packages]) == key
+        assert output_key({"compressed": False}, [], [site_packages]) != key
+        assert output_key({"compressed": True}, ["."], [site_packages]) not in (None, key)
+
+        (site_packages / "module.py").write_text("VALUE = 1\n")
+        assert output_key({"compressed": True}, [], [site_packages]) != key
+
+        # requirements pip can't resolve can't be cached
+        assert output_key({"compressed": True}, ["unresolvable"], [site_packages]) is None
+
+    def test_get_and_put(self, tmp_path):
+        cache = OutputCache(tmp_path / "cache")
+        zipapp = tmp_path / "app.pyz"
+        zipapp.write_bytes(b"zipapp")
+
+        assert cache.get("key") is None
+
+        cache.put("key", zipapp)
+        cached = cache.get("key")
+
+        assert cached is not None and cached.read_bytes() == b"zipapp"
+        assert [path.name for path in (tmp_path / "cache").iterdir()] == ["key.pyz"]
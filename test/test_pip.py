@@ -1,7 +1,11 @@
+import hashlib
 import os
 
+from pathlib import Path
+
+from shiv import pip
 from shiv.constants import PIP_REQUIRE_VIRTUALENV
-from shiv.pip import clean_pip_env
+from shiv.pip import cached_install, clean_pip_env, file_digest, install_key
 
 
 def test_clean_pip_env(monkeypatch):
@@ -13,3 +17,59 @@ def test_clean_pip_env(monkeypatch):
         assert PIP_REQUIRE_VIRTUALENV not in os.environ
 
     assert os.environ.get(PIP_REQUIRE_VIRTUALENV) == before_env_var
+
+
+def test_file_digest(tmp_path):
+    path = tmp_path / "file"
+    path.write_bytes(b"x" * (3 * 1024 * 1024 + 1))
+
+    assert file_digest(path) == hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def test_install_key(tmp_path):
+    wheel = tmp_path / "local-1.0-py3-none-any.whl"
+    wheel.write_bytes(b"not really a wheel")
+
+    def distribution(name, download_info):
+        return {"metadata": {"name": name, "version": "1.0"}, "download_info": download_info}
+
+    indexed = distribution("indexed", {"url": "https://host/indexed.whl", "archive_info": {"hashes": {"sha256": "00"}}})
+    local = distribution("local", {"url": wheel.as_uri(), "archive_info": {}})
+    vcs = distribution("vcs", {"url": "https://host/vcs.git", "vcs_info": {"vcs": "git", "commit_id": "abc"}})
+    directory = distribution("directory", {"url": tmp_path.as_uri(), "dir_info": {}})
+
+    key = install_key([indexed, local, vcs])
+
+    assert key is not None
+    assert install_key([vcs, local, indexed]) == key
+    assert install_key([indexed, vcs]) != key
+    assert install_key([indexed, local, vcs, directory]) is None
+    assert install_key([indexed, local, vcs, directory], lambda path: "digest") not in (None, key)
+
+    # local archives without a hash are hashed
+    wheel.write_bytes(b"another wheel")
+    assert install_key([indexed, local, vcs]) != key
+
+
+def test_cached_install(tmp_path, monkeypatch):
+    installs = []
+
+    def install(args):
+        installs.append(args)
+        target = Path(args[args.index("--target") + 1])
+        target.mkdir()
+        (target / "module.py").write_text("")
+
+    monkeypatch.setattr(pip, "install", install)
+    monkeypatch.setattr(pip, "resolve", lambda args: [] if args != ["local-dir"] else None)
+
+    cache = tmp_path / "cache"
+    entry = cached_install(["requirement"], cache)
+
+    assert entry is not None and (entry / "module.py").exists()
+    assert cached_install(["requirement"], cache) == entry
+    assert len(installs) == 1
+    assert "--no-compile" in installs[0]
+    assert [path.name for path in cache.iterdir()] == [entry.name]
+
+    assert cached_install(["local-dir"], cache) is None
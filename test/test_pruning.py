@@ -0,0 +1,82 @@
+import pytest
+
+from shiv.pruning import PRESETS, PruningPolicy, source_of
+
+
+class TestPruningPolicy:
+    @pytest.mark.parametrize(
+        "name, rule",
+        [
+            ("requests/__init__.py", None),
+            ("requests/tests/test_api.py", "strip-tests"),
+            ("tests/__init__.py", "strip-tests"),
+            ("numpy/conftest.py", "strip-tests"),
+            ("testing/__init__.py", None),
+            ("six.pyi", "strip-stubs"),
+            ("types_requests-2.0.dist-info/RECORD", "strip-record"),
+            ("requests-stubs/api.pyi", "strip-stubs"),
+            ("requests/docs/index.rst", "strip-docs"),
+            ("requests/CHANGES.md", "exclude:*.md"),
+            ("requests/tests/data.json", None),
+        ],
+    )
+    def test_excluded_by(self, name, rule):
+        policy = PruningPolicy(exclude=["*.md"], include=["*/data.json"], presets=sorted(PRESETS))
+
+        assert policy.excluded_by(name) == rule
+
+    def test_top_level(self):
+        policy = PruningPolicy(include=["unused/keep.txt"], top_level=["unused", "six.py"])
+
+        assert policy.excluded_by("unused/__init__.py") == "tree-shaking:unused"
+        assert policy.excluded_by("six.py") == "tree-shaking:six.py"
+        assert policy.excluded_by("unused/keep.txt") is None
+        assert policy.excluded_by("unused_too/__init__.py") is None
+
+    def test_profile(self):
+        policy = PruningPolicy(include=["hello/data/*"], profile={"hello/__init__.py", "hello/resource.txt"})
+
+        assert policy.excluded_by("hello/__init__.py") is None
+        assert policy.excluded_by("hello/__pycache__/__init__.cpython-311.pyc") is None
+        assert policy.excluded_by("hello/resource.txt") is None
+        assert policy.excluded_by("hello/data/other.txt") is None
+        assert policy.excluded_by("hello/unused.py") == "import-profile"
+        assert policy.excluded_by("hello/__pycache__/unused.cpython-311.pyc") == "import-profile"
+        assert policy.excluded_by("hello-1.0.dist-info/METADATA") == "import-profile"
+        assert policy.excluded_by("bin/hello") is None
+        assert policy.excluded_by("hello.pth") is None
+
+    @pytest.mark.parametrize(
+        "name, expected",
+        [
+            # not recorded, and not next to an extension module that was
+            ("pkg/_ext.cpython-311-x86_64-linux-gnu.so", "import-profile"),
+            # next to a recorded extension module
+            ("pkg/core/libhelper.so.1", None),
+            # vendored by auditwheel, old and new layout
+            ("pkg.libs/libdep-1a2b3c.so.1.2", None),
+            ("pkg/.libs/libdep-1a2b3c.so", None),
+            ("other.libs/libdep-1a2b3c.so", "import-profile"),
+            ("pkg.libs/README.txt", "import-profile"),
+            ("pkg/other/libunused.so", "import-profile"),
+        ],
+    )
+    def test_profile_shared_objects(self, name, expected):
+        policy = PruningPolicy(profile={"pkg/__init__.py", "pkg/core/_ext.cpython-311-x86_64-linux-gnu.so"})
+
+        assert policy.excluded_by(name) == expected
+
+    @pytest.mark.parametrize(
+        "name, source",
+        [
+            ("hello/__pycache__/world.cpython-311.opt-1.pyc", "hello/world.py"),
+            ("__pycache__/six.cpython-311.pyc", "six.py"),
+            ("hello/world.pyc", "hello/world.pyc"),
+            ("hello/world.py", "hello/world.py"),
+        ],
+    )
+    def test_source_of(self, name, source):
+        assert source_of(name) == source
+
+    def test_nothing_excluded_by_default(self):
+        assert PruningPolicy().excluded_by("requests/tests/test_api.py") is None
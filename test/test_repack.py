@@ -0,0 +1,204 @@
+import json
+import os
+import stat
+import subprocess
+import sys
+import zipfile
+
+from pathlib import Path
+
+import pytest
+
+from click.testing import CliRunner
+from shiv.bootstrap import extract_site_packages
+from shiv.bootstrap.environment import Environment
+from shiv.bootstrap.manifest import Manifest
+from shiv.builder import create_archive
+from shiv.compression import CompressionPolicy
+from shiv.constants import NOT_A_SHIV_PYZ_ERROR
+from shiv.pruning import PruningPolicy
+from shiv.repack import archive_files, main, read_interpreter, repack
+
+
+@pytest.fixture
+def pyz(tmp_path):
+    """A zipapp printing the name of its package, with tests, some random data and a duplicate file."""
+    site_packages = tmp_path / "site-packages"
+    package = site_packages / "alpha"
+    (package / "tests").mkdir(parents=True)
+    (package / "__init__.py").write_text("def main():\n    print('alpha')\n" + "# padding\n" * 100)
+    (package / "tests" / "test_alpha.py").write_text("def test_alpha():\n    pass\n")
+    (package / "data.bin").write_bytes(os.urandom(4096))
+    (package / "copy.bin").write_bytes((package / "data.bin").read_bytes())
+
+    env = Environment(built_at="2019-01-01 12:12:12", shiv_version="0.0.1", entry_point="alpha:main")
+    target = tmp_path / "alpha.pyz"
+    create_archive([site_packages], target, sys.executable, "_bootstrap:bootstrap", env, deduplicate=True)
+    return target
+
+
+def read(target):
+    with zipfile.ZipFile(str(target)) as archive:
+        env = Environment.from_json(archive.read("environment.json").decode())
+        manifest = Manifest.load(archive)
+        contents = {
+            zinfo.filename: (zinfo.compress_type, archive.read(zinfo))
+            for zinfo in archive.infolist()
+            if zinfo.filename.startswith("site-packages/")
+        }
+
+    return env, manifest, contents
+
+
+class TestRepack:
+    def test_read_interpreter(self, pyz, tmp_path):
+        assert read_interpreter(pyz) == sys.executable
+
+        not_executable = tmp_path / "plain.zip"
+        zipfile.ZipFile(str(not_executable), "w").close()
+        assert read_interpreter(not_executable) is None
+
+    def test_archive_files(self, pyz):
+        with zipfile.ZipFile(str(pyz)) as archive:
+            manifest = Manifest.load(archive)
+            files = {file.name: file for file in archive_files(archive, pyz, manifest)}
+            # without a manifest (e.g. zipapps built by older versions), the entries of the archive are listed
+            entries = {file.name: file for file in archive_files(archive, pyz)}
+
+            assert set(files) == {entry.path for entry in manifest}
+            assert set(entries) == set(files) - set(manifest.aliases())
+
+            # data.bin is a duplicate of copy.bin, which comes first
+            with files["alpha/data.bin"].open() as f, entries["alpha/copy.bin"].open() as g:
+                assert f.read() == g.read()
+
+    def test_repack_copies_entries(self, pyz, tmp_path):
+        target = tmp_path / "repacked.pyz"
+        report = repack(pyz, target)
+
+        env, manifest, contents = read(target)
+        original_env, original_manifest, original_contents = read(pyz)
+
+        # nothing was compressed again, and the contents (and so the build id) are unchanged
+        assert report.compression.rules["reused"].entries == len(original_contents)
+        assert contents == original_contents
+        assert list(manifest) == list(original_manifest)
+        assert env.build_id == original_env.build_id
+
+        output = subprocess.run([sys.executable, str(target)], stdout=subprocess.PIPE, env={**os.environ})
+        assert output.stdout.decode().strip() == "alpha"
+
+    def test_repack_uncompressed(self, pyz, tmp_path):
+        target = tmp_path / "repacked.pyz"
+        repack(pyz, target, policy=CompressionPolicy(zipfile.ZIP_STORED))
+
+        env, manifest, contents = read(target)
+        original_env, _, original_contents = read(pyz)
+
+        assert {compression for compression, _ in contents.values()} == {zipfile.ZIP_STORED}
+        assert {name: data for name, (_, data) in contents.items()} == {
+            name: data for name, (_, data) in original_contents.items()
+        }
+        # the build id only depends on the contents of site-packages
+        assert env.build_id == original_env.build_id
+
+    def test_repack_pruned(self, pyz, tmp_path):
+        target = tmp_path / "repacked.pyz"
+        report = repack(pyz, target, pruning=PruningPolicy(presets=["strip-tests"]), deduplicate=False)
+
+        env, manifest, contents = read(target)
+        original_env, _, _ = read(pyz)
+
+        assert "site-packages/alpha/tests/test_alpha.py" not in contents
+        assert manifest.get("alpha/tests/test_alpha.py") is None
+        assert report.pruned["strip-tests"].files == 1
+        assert env.build_id == manifest.build_id() != original_env.build_id
+        # duplicates are stored again
+        assert not manifest.aliases()
+        assert contents["site-packages/alpha/copy.bin"] == contents["site-packages/alpha/data.bin"]
+
+    def test_repack_precompiled(self, pyz, tmp_path):
+        target = tmp_path / "repacked.pyz"
+        repack(pyz, target, precompile=[sys.executable], sourceless=True)
+
+        _, manifest, contents = read(target)
+
+        assert "site-packages/alpha/__init__.pyc" in contents
+        assert "site-packages/alpha/__init__.py" not in contents
+        assert manifest.get("alpha/__init__.pyc") is not None
+
+    def test_repack_in_place(self, pyz, tmp_path):
+        _, _, original_contents = read(pyz)
+
+        repack(pyz, pyz, interpreter="/usr/bin/env python3", app_layer=["alpha"])
+
+        env, _, contents = read(pyz)
+
+        assert read_interpreter(pyz) == "/usr/bin/env python3"
+        assert contents == original_contents
+        assert env.app_layer == ["alpha"]
+        assert set(env.layer_ids) == {"app", "deps"}
+        assert not pyz.with_name(pyz.name + ".previous").exists()
+
+    @pytest.mark.parametrize(
+        "options", [{"pruning": PruningPolicy(exclude=["alpha/*"])}, {"app_layer": ["alpha"]}], ids=["pruned", "layer"]
+    )
+    def test_repack_follows_symlinks(self, tmp_path, options):
+        site_packages = tmp_path / "site-packages"
+        (site_packages / "alpha" / "sub").mkdir(parents=True)
+        (site_packages / "beta").mkdir()
+        (site_packages / "alpha" / "real.txt").write_text("real")
+        (site_packages / "alpha" / "sub" / "table.csv").write_text("a,b\n")
+        (site_packages / "beta" / "__init__.py").write_text("")
+        (site_packages / "beta" / "data").symlink_to("../alpha/real.txt")
+        (site_packages / "beta" / "sub").symlink_to("../alpha/sub", target_is_directory=True)
+        (site_packages / "beta" / "init.py").symlink_to("__init__.py")
+
+        env = Environment(built_at="2019-01-01 12:12:12", shiv_version="0.0.1", entry_point="beta:main")
+        pyz = tmp_path / "symlinks.pyz"
+        create_archive([site_packages], pyz, sys.executable, "_bootstrap:bootstrap", env, preserve_symlinks=True)
+
+        # symlinks whose targets are left out, or extracted to another directory, are replaced with their targets
+        target = tmp_path / "repacked.pyz"
+        repack(pyz, target, **options)
+
+        with zipfile.ZipFile(str(target)) as archive:
+            symlinks = {
+                zinfo.filename for zinfo in archive.infolist() if stat.S_ISLNK(zinfo.external_attr >> 16)
+            }
+            extract_site_packages(archive, tmp_path / "extracted")
+
+        assert symlinks == {"site-packages/beta/init.py"}
+
+        extracted = tmp_path / "extracted" / "site-packages" / "beta"
+        assert not (extracted / "data").is_symlink()
+        assert (extracted / "data").read_text() == "real"
+        assert (extracted / "sub" / "table.csv").read_text() == "a,b\n"
+
+    def test_repack_not_shiv(self, tmp_path):
+        not_shiv = tmp_path / "plain.pyz"
+
+        with zipfile.ZipFile(str(not_shiv), "w") as archive:
+            archive.writestr("__main__.py", "print('hello')")
+
+        with pytest.raises(SystemExit) as exc:
+            repack(not_shiv, tmp_path / "repacked.pyz")
+
+        assert exc.value.code == NOT_A_SHIV_PYZ_ERROR.format(pyz=not_shiv)
+
+    def test_cli(self, pyz, tmp_path):
+        target = tmp_path / "repacked.pyz"
+        report = tmp_path / "report.json"
+        result = CliRunner().invoke(
+            main, [str(pyz), "-o", str(target), "--store", "*.bin", "--build-report", str(report)]
+        )
+
+        assert result.exit_code == 0, result.output
+
+        env, _, contents = read(target)
+
+        assert f"build id {env.build_id}" in result.output
+        assert contents["site-packages/alpha/copy.bin"][0] == zipfile.ZIP_STORED
+        assert contents["site-packages/alpha/__init__.py"][0] == zipfile.ZIP_DEFLATED
+        assert json.loads(report.read_text())["compression"]["store:*.bin"]["entries"] == 1
+        assert Path(target).stat().st_mode & 0o111
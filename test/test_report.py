@@ -0,0 +1,81 @@
+import json
+import time
+
+from shiv.report import BuildReport, EntryStats
+
+
+class TestBuildReport:
+    def test_phase(self):
+        report = BuildReport()
+
+        with report.phase("pip") as stats:
+            stats.files += 2
+            stats.bytes += 1024
+            time.sleep(0.01)
+
+        with report.phase("pip"):
+            pass
+
+        assert list(report.phases) == ["pip"]
+        assert report.phases["pip"].seconds >= 0.01
+        assert report.phases["pip"].files == 2
+        assert report.lines()[0].startswith("pip: ")
+        assert report.lines()[0].endswith(", 2 files, 1024 bytes")
+        assert report.lines()[-1].startswith("total: ")
+
+    def test_record_entry(self):
+        report = BuildReport(slowest=2)
+
+        report.record_entry("alpha/__init__.py", 100, 50, 0.1)
+        report.record_entry("alpha/data.bin", 1000, 1000, 0.3)
+        report.record_entry("beta.py", 10, 10, 0.2)
+        report.record_entry("gamma/__init__.py", 10, 10, 0.0)
+
+        assert sorted(report.packages) == ["alpha", "beta.py", "gamma"]
+        assert report.packages["alpha"].entries == 2
+        assert report.packages["alpha"].size == 1100
+        assert report.packages["alpha"].compressed_size == 1050
+        assert report.slowest == [
+            EntryStats("alpha/data.bin", 1000, 1000, 0.3),
+            EntryStats("beta.py", 10, 10, 0.2),
+        ]
+
+    def test_record_pruned(self):
+        report = BuildReport()
+
+        report.record_pruned("strip-tests", 100)
+        report.record_pruned("strip-tests", 50)
+        report.record_pruned("exclude:*.md", 10)
+
+        assert report.pruned["strip-tests"].files == 2
+        assert report.pruned["strip-tests"].bytes == 150
+        assert report.lines()[:2] == [
+            "pruned by exclude:*.md: 1 files, 10 bytes",
+            "pruned by strip-tests: 2 files, 150 bytes",
+        ]
+
+    def test_record_stripped(self):
+        report = BuildReport()
+
+        report.record_stripped(1000, 400)
+        report.record_stripped(500, 300)
+
+        assert vars(report.stripped) == {"files": 2, "bytes": 1500, "saved": 800}
+        assert "stripped debug information: 2 files, saved 800 bytes" in report.lines()
+
+    def test_to_json(self):
+        report = BuildReport()
+
+        with report.phase("site-packages"):
+            report.record_entry("alpha/__init__.py", 100, 50, 0.1)
+            report.compression.record("default", 100, 50, 0.1)
+            report.record_pruned("strip-tests", 10)
+
+        data = json.loads(report.to_json())
+
+        assert set(data) == {"phases", "packages", "compression", "pruned", "stripped", "slowest"}
+        assert data["phases"]["site-packages"]["name"] == "site-packages"
+        assert data["packages"]["alpha"] == {"entries": 1, "size": 100, "compressed_size": 50}
+        assert data["compression"]["default"]["compressed_size"] == 50
+        assert data["slowest"][0]["name"] == "alpha/__init__.py"
+        assert data["pruned"] == {"strip-tests": {"files": 1, "bytes": 10}}
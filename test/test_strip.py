@@ -0,0 +1,74 @@
+import shutil
+import subprocess
+
+from pathlib import Path
+
+import pytest
+
+from shiv.builder import walk
+from shiv.strip import is_shared_object, strip_debug
+
+pytestmark = pytest.mark.skipif(
+    shutil.which("cc") is None or shutil.which("strip") is None, reason="requires a C compiler and binutils"
+)
+
+EXTENSION_SOURCE = """\
+static int values[256];
+
+int sum(int count) {
+    int total = 0;
+    for (int i = 0; i < count && i < 256; i++) {
+        total += values[i];
+    }
+    return total;
+}
+"""
+
+
+def build_extension(path: Path) -> None:
+    """Compile a tiny shared object with debug information."""
+    source = path.with_suffix(".c")
+    source.write_text(EXTENSION_SOURCE)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    subprocess.run(["cc", "-g", "-shared", "-fPIC", "-o", str(path), str(source)], check=True)
+    source.unlink()
+
+
+@pytest.fixture
+def site_packages(tmp_path):
+    site_packages = tmp_path / "site-packages"
+    (site_packages / "alpha").mkdir(parents=True)
+    (site_packages / "beta").mkdir()
+    build_extension(site_packages / "alpha" / "_speedups.cpython-311-x86_64-linux-gnu.so")
+    build_extension(site_packages / "beta" / "libbeta-1a2b3c.so.1.2")
+    (site_packages / "alpha" / "fake.so").write_bytes(b"not a shared object")
+    (site_packages / "alpha" / "__init__.py").write_text("")
+    return site_packages
+
+
+class TestStrip:
+    def test_is_shared_object(self, site_packages):
+        files = {file.name: file for file in walk(site_packages)}
+
+        assert is_shared_object(files["alpha/_speedups.cpython-311-x86_64-linux-gnu.so"])
+        assert is_shared_object(files["beta/libbeta-1a2b3c.so.1.2"])
+        assert not is_shared_object(files["alpha/fake.so"])
+        assert not is_shared_object(files["alpha/__init__.py"])
+
+    def test_strip_debug(self, site_packages, tmp_path):
+        target = tmp_path / "stripped"
+        original = (site_packages / "alpha" / "_speedups.cpython-311-x86_64-linux-gnu.so").read_bytes()
+
+        stripped = strip_debug(walk(site_packages), target, keep=["beta/*"])
+
+        assert [file.name for file in stripped] == ["alpha/_speedups.cpython-311-x86_64-linux-gnu.so"]
+        assert stripped[0].size == len(original)
+        assert stripped[0].stripped_size < stripped[0].size
+        assert [file.name for file in walk(target)] == ["alpha/_speedups.cpython-311-x86_64-linux-gnu.so"]
+
+        # the original is left untouched
+        assert (site_packages / "alpha" / "_speedups.cpython-311-x86_64-linux-gnu.so").read_bytes() == original
+
+    def test_strip_debug_missing_strip(self, site_packages, tmp_path):
+        with pytest.raises(SystemExit):
+            strip_debug(walk(site_packages), tmp_path / "stripped", strip=str(tmp_path / "no-such-strip"))
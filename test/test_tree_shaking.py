@@ -0,0 +1,94 @@
+import io
+import os
+
+from functools import partial
+
+import pytest
+
+from shiv.builder import SourceFile, file_stat
+from shiv.tree_shaking import find_imports, module_name, shake
+
+
+def source_file(name, text=""):
+    data = text.encode()
+    return SourceFile(name.replace("/", os.sep), file_stat(0o644, len(data)), name, partial(io.BytesIO, data))
+
+
+class TestTreeShaking:
+    @pytest.mark.parametrize(
+        "name, module",
+        [
+            ("requests/__init__.py", "requests"),
+            ("six.py", "six"),
+            ("__pycache__/six.cpython-311.pyc", "six"),
+            ("_cffi_backend.cpython-311-x86_64-linux-gnu.so", "_cffi_backend"),
+            ("requests-2.0.dist-info/RECORD", None),
+            ("README.txt", None),
+        ],
+    )
+    def test_module_name(self, name, module):
+        assert module_name(name) == module
+
+    def test_find_imports(self):
+        source = b"\n".join(
+            [
+                b"import os.path, json as j",
+                b"from urllib3.util import Retry",
+                b"from . import sibling",
+                b"from .sibling import thing",
+                b"import importlib",
+                b"plugin = importlib.import_module('plugins.default')",
+                b"other = __import__('other')",
+                b"dynamic = importlib.import_module(name)",
+            ]
+        )
+
+        assert find_imports(source) == {"os", "json", "urllib3", "importlib", "plugins", "other"}
+
+    def test_find_imports_invalid_source(self):
+        assert find_imports(b"def (") == set()
+
+    def test_shake(self):
+        files = [
+            source_file("app/__init__.py", "from app.cli import main"),
+            source_file("app/cli.py", "import requests"),
+            source_file("requests/__init__.py", "import urllib3"),
+            source_file("urllib3/__init__.py"),
+            source_file("unused/__init__.py", "import urllib3"),
+            source_file("unused/data.json", "{}"),
+            source_file("unused-1.0.dist-info/RECORD", "unused/__init__.py,,\nunused/data.json,,\n"),
+            source_file("plugin_a.py"),
+            source_file("bin/unused"),
+            source_file("share/data.txt"),
+        ]
+
+        shaken = shake(files, {"app": "entry point app.cli:main"}, keep=["plugin_*"])
+
+        assert shaken.reachable == {
+            "app": "entry point app.cli:main",
+            "plugin_a": "kept explicitly",
+            "requests": "imported by app",
+            "urllib3": "imported by requests",
+        }
+        assert shaken.dropped == {
+            "unused": "unused is never imported",
+            "unused-1.0.dist-info": "all of its modules are dropped (unused)",
+        }
+        assert shaken.lines() == [
+            "unused: unused is never imported",
+            "unused-1.0.dist-info: all of its modules are dropped (unused)",
+        ]
+
+    def test_shake_pth_and_scan(self):
+        files = [
+            source_file("app.py", "import json"),
+            source_file("app/tests/test_app.py", "import pytest"),
+            source_file("pytest.py"),
+            source_file("distutils-precedence.pth", "import _distutils_hack; _distutils_hack.add_shim()"),
+            source_file("_distutils_hack/__init__.py"),
+        ]
+
+        shaken = shake(files, {"app": "entry point app:main"}, scan=lambda name: "/tests/" not in name)
+
+        assert shaken.reachable["_distutils_hack"] == "imported by distutils-precedence.pth"
+        assert shaken.dropped == {"pytest.py": "pytest is never imported"}
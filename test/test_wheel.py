@@ -0,0 +1,109 @@
+import base64
+import hashlib
+import os
+import stat
+import subprocess
+import sys
+import zipfile
+
+import pytest
+
+from shiv.builder import walk
+from shiv.pip import install
+from shiv.wheel import Wheel, wheel_files
+
+
+def make_wheel(path, members):
+    """Write a wheel with a valid RECORD, members map names to (contents, mode)."""
+    dist_info = "demo-1.0.dist-info"
+    members = {
+        **members,
+        f"{dist_info}/METADATA": (b"Metadata-Version: 2.1\nName: demo\nVersion: 1.0\n", 0o644),
+        f"{dist_info}/WHEEL": (b"Wheel-Version: 1.0\nRoot-Is-Purelib: true\nTag: py3-none-any\n", 0o644),
+        f"{dist_info}/entry_points.txt": (
+            b"[console_scripts]\ndemo = demo.cli:main\ndemo-cli = demo.cli:main [cli]\n",
+            0o644,
+        ),
+    }
+    record = "".join(
+        f"{name},sha256={base64.urlsafe_b64encode(hashlib.sha256(data).digest()).decode().rstrip('=')},{len(data)}\n"
+        for name, (data, _) in members.items()
+    )
+    members[f"{dist_info}/RECORD"] = ((record + f"{dist_info}/RECORD,,\n").encode(), 0o644)
+
+    with zipfile.ZipFile(str(path), "w") as archive:
+        for name, (data, mode) in members.items():
+            zinfo = zipfile.ZipInfo(name)
+            zinfo.external_attr = (stat.S_IFREG | mode) << 16
+            archive.writestr(zinfo, data)
+
+    return path
+
+
+@pytest.fixture
+def wheel_path(tmp_path):
+    return make_wheel(
+        tmp_path / "demo-1.0-py3-none-any.whl",
+        {
+            "demo/__init__.py": (b"", 0o644),
+            "demo/cli.py": (b"def main():\n    print('demo')\n", 0o644),
+            "demo/tool.sh": (b"#!/bin/sh\necho tool\n", 0o755),
+            "demo-1.0.data/scripts/demo-script": (b"#!python\nprint('script')\n", 0o755),
+            "demo-1.0.data/purelib/demo_extra.py": (b"EXTRA = True\n", 0o644),
+            "demo-1.0.data/data/share/demo/data.txt": (b"data\n", 0o644),
+        },
+    )
+
+
+class TestWheel:
+    def test_target_path(self, wheel_path):
+        wheel = Wheel(wheel_path)
+
+        assert wheel.target_path("demo/cli.py") == ("demo/cli.py", True)
+        assert wheel.target_path("demo-1.0.data/scripts/demo-script") == ("bin/demo-script", False)
+        assert wheel.target_path("demo-1.0.data/purelib/demo_extra.py") == ("demo_extra.py", True)
+        assert wheel.target_path("demo-1.0.data/data/share/demo/data.txt") == ("share/demo/data.txt", False)
+        assert wheel.target_path("demo-1.0.data/headers/demo.h") == ("include/python/demo/demo.h", False)
+
+    def test_not_a_wheel(self, tmp_path):
+        with zipfile.ZipFile(str(tmp_path / "empty.whl"), "w") as archive:
+            archive.writestr("foo.py", "")
+
+        with pytest.raises(ValueError):
+            Wheel(tmp_path / "empty.whl")
+
+    def test_same_as_pip(self, tmp_path, wheel_path):
+        """Reading a wheel yields exactly the files (and permissions) pip installs from it."""
+        target = tmp_path / "target"
+        install(["--target", str(target), "--no-compile", "--no-deps", str(wheel_path)])
+        installed = list(walk(target))
+
+        # pip records where the wheel came from, this is tested through the cli
+        direct_url = (target / "demo-1.0.dist-info" / "direct_url.json").read_text()
+        wheel = Wheel(wheel_path, requested=True, direct_url=direct_url)
+        files = wheel_files([wheel])
+
+        assert [file.relpath for file in files] == [file.relpath for file in installed]
+
+        for file, expected in zip(files, installed):
+            with file.open() as f:
+                assert f.read() == (target / expected.relpath).read_bytes(), file.relpath
+
+            assert stat.S_IMODE(file.stat.st_mode) == stat.S_IMODE(expected.stat.st_mode), file.relpath
+            assert file.stat.st_size == expected.stat.st_size
+
+        wheel.close()
+        assert os.path.join("bin", "demo") in {file.relpath for file in files}
+
+        # the extras of an entry point are not part of the callable (the generated script is pip's, see above)
+        env = {**os.environ, "PYTHONPATH": str(target)}
+        proc = subprocess.run([sys.executable, str(target / "bin" / "demo-cli")], stdout=subprocess.PIPE, env=env)
+        assert proc.stdout.decode().strip() == "demo"
+
+    def test_last_wheel_wins(self, tmp_path, wheel_path):
+        other = make_wheel(tmp_path / "other.whl", {"demo/cli.py": (b"OTHER = True\n", 0o644)})
+
+        files = {file.relpath: file for file in wheel_files([Wheel(wheel_path), Wheel(other)])}
+
+        with files[os.path.join("demo", "cli.py")].open() as f:
+            assert f.read() == b"OTHER = True\n"